@@ -1,17 +1,42 @@
+import contextvars
 import os
+import sys
 import json
-import requests
+import time
+from datetime import datetime
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # Importar el SDK de Google Gemini
 import google.generativeai as genai
 
+# Módulos compartidos en scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from free_ai_integration import HTMLSectionSplitter
+from http_pool import close_async_client
+from instrumentation import record_llm, stage, tracing
+from llm_cache import get_llm_cache
+from metrics import ARTICLES, LLM_DURATION, observe_request
+from profiling import HEADER as PROFILE_HEADER, RESPONSE_HEADER as PROFILE_RESPONSE_HEADER, profiled, request_scope
+from rate_limit import RateLimitExceeded, estimate_tokens, get_gemini_limiter
+from wordpress_publisher import get_wordpress_publisher
+
 # Configurar la clave de API de Gemini
 genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+MODEL_NAME = "gemini-1.5-flash"
+model = genai.GenerativeModel(MODEL_NAME)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    """Al parar, cierra el cliente httpx del loop de la app (proveedores no bloqueantes)"""
+    yield
+    await close_async_client()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configurar CORS
 app.add_middleware(
@@ -24,6 +49,31 @@ app.add_middleware(
 
 print("FastAPI app instance created!")
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Cuenta y mide cada petición; en streaming, hasta enviar las cabeceras"""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Solo rutas conocidas, para no crear una serie por cada URL desconocida
+        path = request.url.path
+        known = any(getattr(route, "path", None) == path for route in app.routes)
+        endpoint = path.removeprefix("/api/") if known else "other"
+        observe_request(endpoint, request.method, status_code, time.perf_counter() - start)
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Con X-Profile (o por muestreo) los endpoints perfilados devuelven X-Profile-Id"""
+    with request_scope(request.headers.get(PROFILE_HEADER)) as profile_ids:
+        response = await call_next(request)
+    if profile_ids:
+        response.headers[PROFILE_RESPONSE_HEADER] = ", ".join(profile_ids)
+    return response
+
 # Función simulada de scraping (integrada)
 def scrape_amazon_product(product_url):
     """
@@ -43,23 +93,25 @@ def scrape_amazon_product(product_url):
         ]
     }
 
-@app.post("/api/generate-article-free")
-async def generate_article_free(request: Request):
-    try:
-        # Obtener los datos del request
-        data = await request.json()
-        product_url = data.get("product_url")
-        affiliate_link = data.get("affiliate_link")
-        
-        if not product_url or not affiliate_link:
-            raise HTTPException(status_code=400, detail="product_url y affiliate_link son requeridos")
+def publish_to_wordpress(article_title, article_content, images=None):
+    """
+    Publica el artículo en WordPress si hay credenciales configuradas.
+    Devuelve la URL publicada o None; los errores no interrumpen la generación.
+    """
+    publisher = get_wordpress_publisher()
+    if not publisher.configured:
+        return None
 
-        # Paso 1: Scrapear la información del producto de Amazon (simulado)
-        product_info = scrape_amazon_product(product_url)
+    result = publisher.publish(article_title, article_content, images=images)
+    if not result["success"]:
+        print(f"Error al publicar en WordPress: {result['error']}")
+        # No lanzamos error, solo continuamos sin publicar
+        return None
+    return result["link"]
 
-        # Paso 2: Generar el artículo con Gemini
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        prompt = f"""
+def build_article_prompt(product_info, affiliate_link):
+    """Prompt del artículo a partir de los datos del producto"""
+    return f"""
         Basado en la siguiente información del producto de Amazon, genera un artículo de blog detallado y atractivo. 
         El artículo debe ser informativo, persuasivo y optimizado para SEO. 
         Incluye el enlace de afiliado proporcionado de forma natural en el texto.
@@ -75,53 +127,176 @@ async def generate_article_free(request: Request):
 
         El artículo debe tener una introducción, varios párrafos de contenido (destacando beneficios, características clave y casos de uso), y una conclusión con una llamada a acción clara para comprar a través del enlace de afiliado.
         """
+
+def sse_event(event, data):
+    """Formatea un evento server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/generate-article-free")
+async def generate_article_free(request: Request):
+    # Perfil de la petición entera, serialización de la respuesta incluida
+    with profiled("generate-article-free"):
+        return await _generate_article_free(request)
+
+async def _generate_article_free(request: Request):
+    try:
+        # Obtener los datos del request
+        data = await request.json()
+        product_url = data.get("product_url")
+        affiliate_link = data.get("affiliate_link")
         
-        gemini_response = model.generate_content(prompt)
-        article_content = gemini_response.text
-
-        # Paso 3: Publicar el artículo en WordPress (opcional)
-        wordpress_api_url = os.environ.get("WORDPRESS_API_URL")
-        wordpress_username = os.environ.get("WORDPRESS_USERNAME")
-        wordpress_password = os.environ.get("WORDPRESS_PASSWORD")
-
-        published_url = None
-        if all([wordpress_api_url, wordpress_username, wordpress_password]):
-            try:
-                auth = requests.auth.HTTPBasicAuth(wordpress_username, wordpress_password)
-                
-                # Extraer título del artículo
-                article_title = article_content.split("\n")[0][:50].strip()
-                if not article_title:
-                    article_title = f'Artículo sobre {product_info.get("title", "Producto Amazon")}'
-
-                wordpress_post_data = {
-                    "title": article_title,
-                    "content": article_content,
-                    "status": "publish"
-                }
-
-                wordpress_response = requests.post(f"{wordpress_api_url}/posts", auth=auth, json=wordpress_post_data)
-                wordpress_response.raise_for_status()
-                
-                published_post_info = wordpress_response.json()
-                published_url = published_post_info.get("link")
-            except requests.exceptions.RequestException as e:
-                print(f"Error al publicar en WordPress: {e}")
-                # No lanzamos error, solo continuamos sin publicar
+        if not product_url or not affiliate_link:
+            raise HTTPException(status_code=400, detail="product_url y affiliate_link son requeridos")
+
+        ARTICLES.inc("gemini-free")
+        with tracing("generate-article-free", product_url=product_url) as trace:
+            # Paso 1: Scrapear la información del producto de Amazon (simulado)
+            with stage("fetch"):
+                product_info = scrape_amazon_product(product_url)
+
+            # Paso 2: Generar el artículo con Gemini
+            with stage("generate"):
+                prompt = build_article_prompt(product_info, affiliate_link)
+
+                # Un producto ya generado con el mismo prompt se sirve desde la caché
+                cache = get_llm_cache()
+                article_content = cache.get(MODEL_NAME, prompt) if cache else None
+
+                if article_content is None:
+                    # Esperar turno en el limitador RPM/TPM compartido y llamar de forma
+                    # asíncrona para no bloquear el event loop mientras Gemini genera
+                    await get_gemini_limiter().acquire_async(estimate_tokens(prompt) + 2048)
+                    llm_start = time.perf_counter()
+                    try:
+                        gemini_response = await model.generate_content_async(prompt)
+                    except Exception:
+                        LLM_DURATION.observe(time.perf_counter() - llm_start, "gemini", "error")
+                        raise
+                    LLM_DURATION.observe(time.perf_counter() - llm_start, "gemini", "success")
+                    article_content = gemini_response.text
+                    record_llm(prompt, article_content, getattr(gemini_response, "usage_metadata", None))
+                    if cache:
+                        cache.put(MODEL_NAME, prompt, article_content)
+                else:
+                    record_llm(prompt, article_content, cached=True)
+
+            # Paso 3: Publicar el artículo en WordPress (opcional)
+            # Extraer título del artículo
+            article_title = article_content.split("\n")[0][:50].strip()
+            if not article_title:
+                article_title = f'Artículo sobre {product_info.get("title", "Producto Amazon")}'
+
+            with stage("publish"):
+                # El hilo del pool no hereda el contexto: sin copiarlo no se medirían los bytes enviados
+                published_url = await run_in_threadpool(contextvars.copy_context().run, publish_to_wordpress,
+                                                         article_title, article_content, product_info.get("images"))
 
         return JSONResponse(content={
             "status": "success",
             "article_title": article_content.split("\n")[0][:50].strip() or "Artículo generado",
             "article_content": article_content,
             "article_url": published_url,
-            "product_info": product_info
+            "product_info": product_info,
+            "timings": trace.as_dict()
         })
 
     except HTTPException as e:
         return JSONResponse(status_code=e.status_code, content={"status": "error", "message": e.detail})
+    except RateLimitExceeded as e:
+        return JSONResponse(status_code=429, headers={"Retry-After": str(int(e.wait) + 1)},
+                            content={"status": "error", "message": str(e)})
     except Exception as e:
         return JSONResponse(status_code=500, content={"status": "error", "message": f"Error inesperado: {str(e)}"})
 
+async def stream_gemini(prompt):
+    """
+    Fragmentos de texto de Gemini con el mismo modelo y clave que
+    /api/generate-article-free; una respuesta cacheada se emite de una vez
+    """
+    cache = get_llm_cache()
+    cached = cache.get(MODEL_NAME, prompt) if cache else None
+    if cached is not None:
+        record_llm(prompt, cached, cached=True)
+        yield cached
+        return
+
+    await get_gemini_limiter().acquire_async(estimate_tokens(prompt) + 2048)
+    llm_start = time.perf_counter()
+    parts = []
+    try:
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+    except Exception:
+        LLM_DURATION.observe(time.perf_counter() - llm_start, "gemini", "error")
+        raise
+    LLM_DURATION.observe(time.perf_counter() - llm_start, "gemini", "success")
+    article_content = "".join(parts)
+    record_llm(prompt, article_content, getattr(response, "usage_metadata", None))
+    if cache:
+        cache.put(MODEL_NAME, prompt, article_content)
+
+@app.post("/api/generate-article-free/stream")
+async def generate_article_free_stream(request: Request):
+    """
+    Variante en streaming: devuelve server-sent events con cada sección del
+    artículo en cuanto está completa, en lugar de esperar al artículo entero.
+    Usa el mismo modelo, clave y caché que /api/generate-article-free.
+
+    Eventos: start, section (index, html), error, done (artículo, article_url).
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    product_url = data.get("product_url")
+    affiliate_link = data.get("affiliate_link")
+
+    if not product_url or not affiliate_link:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "product_url y affiliate_link son requeridos"})
+
+    ARTICLES.inc("gemini-free")
+    product_info = scrape_amazon_product(product_url)
+    prompt = build_article_prompt(product_info, affiliate_link)
+
+    async def events():
+        yield sse_event("start", {"ai_provider": "gemini", "model": MODEL_NAME,
+                                  "started_at": datetime.utcnow().isoformat() + "Z"})
+        splitter = HTMLSectionSplitter()
+        parts = []
+        index = 0
+        try:
+            async for chunk in stream_gemini(prompt):
+                parts.append(chunk)
+                for section in splitter.feed(chunk):
+                    yield sse_event("section", {"index": index, "html": section})
+                    index += 1
+            for section in splitter.flush():
+                yield sse_event("section", {"index": index, "html": section})
+                index += 1
+
+            article_content = "".join(parts)
+            article_title = article_content.split("\n")[0][:50].strip() or "Artículo generado"
+            article_url = await run_in_threadpool(publish_to_wordpress, article_title, article_content,
+                                                  product_info.get("images"))
+            yield sse_event("done", {
+                "status": "success",
+                "article": {"title": article_title, "content": article_content},
+                "article_url": article_url,
+                "product_info": product_info,
+            })
+        except RateLimitExceeded as e:
+            yield sse_event("error", {"status": "error", "message": str(e), "retry_after": int(e.wait) + 1})
+        except Exception as e:
+            yield sse_event("error", {"status": "error", "message": f"Error inesperado: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,6 +1,8 @@
 import asyncio
 import json
 import os
+import sys
+import time
 import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
@@ -11,24 +13,59 @@ try:
 except ImportError:
     raise ImportError("Please install google-generativeai: pip install google-generativeai")
 
+# Módulos compartidos en scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from article_schema import SCHEMA_INSTRUCTIONS, ArticleValidationError, parse_article
+from category_classifier import DEFAULT_CONFIDENCE_THRESHOLD, classify_product
+from http_pool import close_async_client, run_sync
+from instrumentation import record_llm, traced, tracing
+from llm_cache import CachedResponse, get_llm_cache
+from metrics import ARTICLES, FALLBACK_ARTICLES, LLM_DURATION, observe_request
+from pipeline_dag import PipelineDAG, Stage
+from profiling import HEADER as PROFILE_HEADER, RESPONSE_HEADER as PROFILE_RESPONSE_HEADER, profiled, request_scope
+from rate_limit import estimate_tokens, get_gemini_limiter
+from single_flight import flight_key, get_single_flight
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Etiqueta del generador y del proveedor en las métricas
+GENERATOR = "gemini"
+
 class AmazonArticleGenerator:
     """
     Generador de artículos de Amazon usando Google Gemini
     """
     
-    def __init__(self):
+    def __init__(self, single_call: Optional[bool] = None):
         """
         Inicializa el generador con la clave API de Gemini
+        
+        Args:
+            single_call: Generar contenido y SEO en una sola llamada estructurada
+                (por defecto ARTICLE_SINGLE_CALL, activado)
         """
         self.api_key = os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable not set")
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-pro')  # Use appropriate Gemini model
+        self.model_name = 'gemini-pro'  # Use appropriate Gemini model
+        self.model = genai.GenerativeModel(self.model_name)
+        
+        # Límites RPM/TPM compartidos: las ráfagas se encolan en lugar de recibir 429
+        self.limiter = get_gemini_limiter()
+        
+        # Respuestas ya generadas para el mismo prompt (None si LLM_CACHE_ENABLED=false)
+        self.cache = get_llm_cache()
+        
+        # Confianza mínima del clasificador local para no consultar a Gemini
+        self.category_threshold = DEFAULT_CONFIDENCE_THRESHOLD
+        
+        if single_call is None:
+            single_call = os.getenv("ARTICLE_SINGLE_CALL", "true").lower() == "true"
+        self.single_call = single_call
         
         # Templates de artículos por categoría
         self.article_templates = {
@@ -56,16 +93,36 @@ class AmazonArticleGenerator:
     async def generate_article(self, product_url: str, affiliate_link: str) -> Dict[str, Any]:
         """
         Genera un artículo completo sobre un producto de Amazon usando Gemini
+        
+        Las peticiones simultáneas del mismo producto y enlace de afiliado
+        comparten una sola generación; las que esperaron se marcan con
+        "coalesced".
         """
+        key = flight_key(product_url, "article", affiliate_link, self.single_call)
+        with profiled("generate_article"):
+            if key is None:
+                return await self._generate_article(product_url, affiliate_link)
+            
+            result, shared = await get_single_flight("generate_article").do_async(
+                key, self._generate_article, product_url, affiliate_link
+            )
+        return dict(result, coalesced=True) if shared else result
+    
+    async def _generate_article(self, product_url: str, affiliate_link: str) -> Dict[str, Any]:
+        # Se cuenta aquí y no en generate_article: las peticiones coalescidas comparten esta generación
+        ARTICLES.inc(GENERATOR)
         try:
             logger.info(f"Iniciando generación de artículo para: {product_url}")
             
             # Simular extracción de datos (reemplazar con scraping si necesario)
-            product_data = await self._extract_product_data(product_url)
-            category = await self._determine_category(product_data)
-            article_content = await self._generate_article_content(product_data, affiliate_link, category)
-            seo_optimized = await self._optimize_for_seo(article_content, product_data, category)
-            metadata = await self._generate_metadata(product_data, category)
+            with tracing("generate-article", product_url=product_url) as trace:
+                results, dag_timings = await self._build_pipeline(product_url, affiliate_link).run()
+            timings = dict(trace.as_dict(), dag_stages=dag_timings)
+            
+            product_data = results["product_data"]
+            category = results["category"]
+            seo_optimized = results["seo_optimized"]
+            metadata = results["metadata"]
             
             result = {
                 "success": True,
@@ -74,13 +131,16 @@ class AmazonArticleGenerator:
                     "content": seo_optimized.get("content", ""),
                     "meta_description": seo_optimized.get("meta_description", ""),
                     "keywords": seo_optimized.get("keywords", []),
+                    "alt_texts": seo_optimized.get("alt_texts", []),
                     "category": category,
                     "word_count": len(seo_optimized.get("content", "").split())
                 },
                 "product_data": product_data,
                 "metadata": metadata,
                 "affiliate_link": affiliate_link,
-                "generated_at": datetime.now().isoformat()
+                "generated_at": datetime.now().isoformat(),
+                "timings": timings,
+                "llm_cache": self.cache.stats() if self.cache else None
             }
             
             logger.info("Artículo generado exitosamente")
@@ -95,6 +155,68 @@ class AmazonArticleGenerator:
                 "affiliate_link": affiliate_link
             }
     
+    def _build_pipeline(self, product_url: str, affiliate_link: str) -> PipelineDAG:
+        """
+        Grafo de etapas del artículo: los metadatos solo dependen de los datos
+        del producto y de la categoría, así que se generan en paralelo con el
+        contenido y la optimización SEO.
+        
+        En modo de llamada única el artículo y sus campos SEO salen de una sola
+        respuesta JSON, sin la etapa intermedia de contenido.
+        """
+        if self.single_call:
+            return PipelineDAG([
+                Stage("product_data", traced("fetch", lambda: self._extract_product_data(product_url))),
+                Stage("category", traced("classify", self._determine_category), ["product_data"]),
+                Stage("seo_optimized",
+                      traced("generate", lambda product_data, category: self._generate_structured_article(product_data, affiliate_link, category)),
+                      ["product_data", "category"]),
+                Stage("metadata", self._generate_metadata, ["product_data", "category"]),
+            ])
+        
+        return PipelineDAG([
+            Stage("product_data", traced("fetch", lambda: self._extract_product_data(product_url))),
+            Stage("category", traced("classify", self._determine_category), ["product_data"]),
+            Stage("article_content",
+                  traced("generate", lambda product_data, category: self._generate_article_content(product_data, affiliate_link, category)),
+                  ["product_data", "category"]),
+            Stage("seo_optimized",
+                  traced("seo", lambda article_content, product_data, category: self._optimize_for_seo(article_content, product_data, category)),
+                  ["article_content", "product_data", "category"]),
+            Stage("metadata", self._generate_metadata, ["product_data", "category"]),
+        ])
+    
+    async def _generate(self, prompt: str, max_output_tokens: int = 2048):
+        """
+        Llama a Gemini tras reservar su hueco en el limitador de frecuencia
+        
+        Un prompt ya respondido se sirve desde la caché sin consumir cuota ni tokens.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(self.model_name, prompt)
+            if cached is not None:
+                record_llm(prompt, cached, cached=True)
+                return CachedResponse(cached)
+        
+        await self.limiter.acquire_async(estimate_tokens(prompt) + max_output_tokens)
+        start = time.perf_counter()
+        try:
+            response = await self.model.generate_content_async(prompt)
+        except Exception:
+            LLM_DURATION.observe(time.perf_counter() - start, GENERATOR, "error")
+            raise
+        LLM_DURATION.observe(time.perf_counter() - start, GENERATOR, "success")
+        record_llm(prompt, response.text, getattr(response, "usage_metadata", None))
+        
+        if self.cache is not None:
+            self.cache.put(self.model_name, prompt, response.text)
+        return response
+    
+    def _forget(self, prompt: str):
+        """Saca de la caché una respuesta que no se ha podido interpretar"""
+        if self.cache is not None:
+            self.cache.delete(self.model_name, prompt)
+    
     async def _extract_product_data(self, product_url: str) -> Dict[str, Any]:
         """Extrae datos del producto usando Gemini (simulación; añadir scraping si necesario)"""
         extraction_prompt = f"""
@@ -104,11 +226,12 @@ class AmazonArticleGenerator:
         Usa valores ficticios si no hay datos reales.
         """
         try:
-            response = self.model.generate_content(extraction_prompt)
+            response = await self._generate(extraction_prompt)
             product_data = json.loads(response.text)  # Assume Gemini returns JSON
             return product_data
         except Exception as e:
             logger.error(f"Error al extraer datos: {e}")
+            self._forget(extraction_prompt)
             return {
                 "title": "Producto de Amazon",
                 "current_price": "No disponible",
@@ -124,21 +247,30 @@ class AmazonArticleGenerator:
             }
     
     async def _determine_category(self, product_data: Dict[str, Any]) -> str:
-        """Determina la categoría del producto usando Gemini"""
+        """
+        Determina la categoría del producto con el clasificador local y solo
+        consulta a Gemini cuando la confianza queda por debajo del umbral
+        """
+        category, confidence = classify_product(product_data)
+        if confidence >= self.category_threshold:
+            return category
+        
+        logger.info(f"Categoría local poco fiable ({category}, {confidence}), consultando a Gemini")
         category_prompt = f"""
         Determina la categoría principal basada en:
         Título: {product_data.get('title', '')}
         Descripción: {product_data.get('description', '')}
+        Categoría Amazon: {product_data.get('category', '')}
         Categorías: electronics, home, fashion, books, default
         Responde solo con la categoría.
         """
         try:
-            response = self.model.generate_content(category_prompt)
-            category = response.text.strip().lower()
-            return category if category in self.article_templates else "default"
+            response = await self._generate(category_prompt)
+            llm_category = response.text.strip().lower()
+            return llm_category if llm_category in self.article_templates else category
         except Exception as e:
             logger.error(f"Error al determinar categoría: {e}")
-            return "default"
+            return category
     
     async def _generate_article_content(self, product_data: Dict[str, Any], affiliate_link: str, category: str) -> str:
         """Genera contenido del artículo usando Gemini"""
@@ -151,12 +283,41 @@ class AmazonArticleGenerator:
         Instrucciones: Tono profesional, 3+ affiliate links, pros/cons, CTA.
         """
         try:
-            response = self.model.generate_content(content_prompt)
+            response = await self._generate(content_prompt)
             return response.text
         except Exception as e:
             logger.error(f"Error al generar contenido: {e}")
             return self._generate_fallback_article(product_data, affiliate_link)
     
+    async def _generate_structured_article(self, product_data: Dict[str, Any], affiliate_link: str, category: str) -> Dict[str, Any]:
+        """
+        Genera el artículo ya optimizado para SEO en una sola llamada a Gemini
+        
+        Si la respuesta no cumple el esquema se recurre al flujo de dos llamadas.
+        """
+        template = self.article_templates.get(category, self.article_templates["default"])
+        keywords = self.seo_keywords.get(category, self.seo_keywords["default"])
+        article_prompt = f"""
+        Crea un artículo HTML de 1500-2000 palabras optimizado para SEO sobre:
+        {json.dumps(product_data, indent=2)}
+        Affiliate link: {affiliate_link}
+        Template: {template}
+        Keywords: {', '.join(keywords)}
+        Instrucciones: Tono profesional, 3+ affiliate links, pros/cons, CTA, alt text para las imágenes.
+        {SCHEMA_INSTRUCTIONS}
+        """
+        try:
+            response = await self._generate(article_prompt)
+            return parse_article(response.text)
+        except ArticleValidationError as e:
+            logger.warning(f"Respuesta estructurada no válida ({e}), usando dos llamadas")
+            self._forget(article_prompt)
+        except Exception as e:
+            logger.error(f"Error al generar artículo estructurado: {e}")
+        
+        content = await self._generate_article_content(product_data, affiliate_link, category)
+        return await self._optimize_for_seo(content, product_data, category)
+    
     async def _optimize_for_seo(self, content: str, product_data: Dict[str, Any], category: str) -> Dict[str, Any]:
         """Optimiza para SEO usando Gemini"""
         keywords = self.seo_keywords.get(category, self.seo_keywords["default"])
@@ -168,10 +329,11 @@ class AmazonArticleGenerator:
         Return JSON with title, meta_description, keywords, content, seo_score.
         """
         try:
-            response = self.model.generate_content(seo_prompt)
+            response = await self._generate(seo_prompt)
             return json.loads(response.text)
         except Exception as e:
             logger.error(f"Error al optimizar SEO: {e}")
+            self._forget(seo_prompt)
             return {
                 "title": product_data.get('title', 'Producto Amazon')[:60],
                 "meta_description": f"Análisis de {product_data.get('title', 'producto')}"[:160],
@@ -193,11 +355,296 @@ class AmazonArticleGenerator:
             "quality_score": self._calculate_quality_score(product_data)
         }
     
-    # [Keep _get_*_template, _parse_extraction_result, _generate_fallback_article, etc., as they are]
+    def _get_electronics_template(self) -> str:
+        """Template para productos electrónicos"""
+        return """
+        # [TÍTULO DEL PRODUCTO]: Análisis Completo y Mejor Precio 2025
+        
+        ## Introducción
+        - Presentación del producto
+        - Por qué es relevante
+        - Qué encontrarás en este análisis
+        
+        ## Características Principales
+        - Especificaciones técnicas
+        - Funcionalidades destacadas
+        - Innovaciones tecnológicas
+        
+        ## Análisis Detallado
+        - Rendimiento
+        - Calidad de construcción
+        - Facilidad de uso
+        - Compatibilidad
+        
+        ## Pros y Contras
+        ### Ventajas
+        ### Desventajas
+        
+        ## Comparación con Competidores
+        - Productos similares
+        - Diferencias clave
+        - Relación calidad-precio
+        
+        ## Conclusión y Recomendación
+        - Veredicto final
+        - Para quién es ideal
+        - Llamada a la acción
+        """
+    
+    def _get_home_template(self) -> str:
+        """Template para productos del hogar"""
+        return """
+        # [TÍTULO DEL PRODUCTO]: La Mejor Opción para tu Hogar
+        
+        ## Introducción
+        - Presentación del producto
+        - Beneficios para el hogar
+        - Por qué considerarlo
+        
+        ## Diseño y Calidad
+        - Materiales utilizados
+        - Acabados y estética
+        - Durabilidad
+        
+        ## Funcionalidad
+        - Uso práctico
+        - Facilidad de instalación/uso
+        - Mantenimiento
+        
+        ## Pros y Contras
+        ### Lo que nos gusta
+        ### Aspectos a mejorar
+        
+        ## Opiniones de Usuarios
+        - Experiencias reales
+        - Puntos comunes
+        - Satisfacción general
+        
+        ## Conclusión
+        - Recomendación final
+        - Mejor uso
+        - Dónde comprarlo
+        """
+    
+    def _get_fashion_template(self) -> str:
+        """Template para productos de moda"""
+        return """
+        # [TÍTULO DEL PRODUCTO]: Estilo y Calidad en un Solo Producto
+        
+        ## Introducción
+        - Presentación del producto
+        - Tendencia actual
+        - Por qué destacar
+        
+        ## Diseño y Estilo
+        - Características visuales
+        - Versatilidad
+        - Ocasiones de uso
+        
+        ## Calidad y Materiales
+        - Tejidos/materiales
+        - Confección
+        - Durabilidad
+        
+        ## Tallas y Ajuste
+        - Guía de tallas
+        - Consejos de ajuste
+        - Comentarios de usuarios
+        
+        ## Pros y Contras
+        ### Puntos fuertes
+        ### Aspectos a considerar
+        
+        ## Cómo Combinar
+        - Sugerencias de outfits
+        - Accesorios complementarios
+        - Versatilidad
+        
+        ## Conclusión
+        - Recomendación final
+        - Mejor ocasión de uso
+        - Dónde adquirirlo
+        """
+    
+    def _get_books_template(self) -> str:
+        """Template para libros"""
+        return """
+        # [TÍTULO DEL LIBRO]: Reseña Completa y Opinión Personal
+        
+        ## Introducción
+        - Presentación del libro
+        - Autor y contexto
+        - Por qué leerlo
+        
+        ## Sinopsis (Sin Spoilers)
+        - Tema principal
+        - Género y estilo
+        - Público objetivo
+        
+        ## Análisis del Contenido
+        - Calidad de la escritura
+        - Desarrollo de personajes/temas
+        - Estructura narrativa
+        
+        ## Pros y Contras
+        ### Lo que más me gustó
+        ### Aspectos mejorables
+        
+        ## Comparación con Otros Libros
+        - Libros similares
+        - Diferencias clave
+        - Lugar en el género
+        
+        ## Conclusión y Recomendación
+        - Veredicto final
+        - Para qué tipo de lector
+        - Dónde conseguirlo
+        """
+    
+    def _get_default_template(self) -> str:
+        """Template por defecto para cualquier producto"""
+        return """
+        # [TÍTULO DEL PRODUCTO]: Análisis Completo y Honest Review
+        
+        ## Introducción
+        - Presentación del producto
+        - Contexto y relevancia
+        - Qué esperar de esta reseña
+        
+        ## Características Principales
+        - Especificaciones clave
+        - Funcionalidades destacadas
+        - Valor agregado
+        
+        ## Experiencia de Uso
+        - Facilidad de uso
+        - Rendimiento
+        - Calidad general
+        
+        ## Pros y Contras
+        ### Ventajas principales
+        ### Desventajas a considerar
+        
+        ## Relación Calidad-Precio
+        - Análisis del precio
+        - Comparación con alternativas
+        - Valor por dinero
+        
+        ## Conclusión
+        - Recomendación final
+        - Para quién es ideal
+        - Dónde comprarlo al mejor precio
+        """
+    
+    def _parse_extraction_result(self, result: str) -> Dict[str, Any]:
+        """Parsea el resultado de extracción si no es JSON válido"""
+        # Implementación básica de parsing
+        return {
+            "title": "Producto extraído",
+            "current_price": "No disponible",
+            "description": result[:500] if result else "No disponible",
+            "features": [],
+            "rating": "No disponible",
+            "review_count": "0",
+            "availability": "No disponible",
+            "brand": "No disponible",
+            "category": "General",
+            "images": [],
+            "asin": "No disponible"
+        }
+    
+    def _generate_fallback_article(self, product_data: Dict[str, Any], affiliate_link: str) -> str:
+        """Genera un artículo básico como fallback"""
+        FALLBACK_ARTICLES.inc(GENERATOR)
+        title = product_data.get('title', 'Producto de Amazon')
+        
+        return f"""
+        <h1>{title}: Análisis y Opinión</h1>
+        
+        <p>En este artículo analizamos en detalle el <strong>{title}</strong>, 
+        un producto que ha captado nuestra atención por sus características únicas.</p>
+        
+        <h2>Características Principales</h2>
+        <p>Este producto destaca por su calidad y funcionalidad. 
+        A continuación, te contamos todo lo que necesitas saber.</p>
+        
+        <h2>Nuestra Opinión</h2>
+        <p>Después de analizar este producto, consideramos que es una excelente opción 
+        para quienes buscan calidad y buen precio.</p>
+        
+        <h2>Conclusión</h2>
+        <p>Si estás interesado en este producto, puedes encontrarlo al mejor precio 
+        <a href="{affiliate_link}" target="_blank" rel="nofollow">aquí</a>.</p>
+        """
+    
+    def _calculate_read_time(self, content: str) -> int:
+        """Calcula el tiempo estimado de lectura en minutos"""
+        words = len(content.split())
+        return max(1, words // 200)  # 200 palabras por minuto
+    
+    def _get_target_audience(self, category: str) -> str:
+        """Determina la audiencia objetivo según la categoría"""
+        audiences = {
+            "electronics": "Entusiastas de la tecnología, profesionales",
+            "home": "Propietarios de viviendas, decoradores",
+            "fashion": "Amantes de la moda, compradores conscientes del estilo",
+            "books": "Lectores, estudiantes, profesionales",
+            "default": "Consumidores generales"
+        }
+        return audiences.get(category, audiences["default"])
+    
+    def _calculate_quality_score(self, product_data: Dict[str, Any]) -> int:
+        """Calcula una puntuación de calidad del producto"""
+        score = 5  # Base score
+        
+        if product_data.get('rating') and product_data['rating'] != "No disponible":
+            try:
+                rating = float(product_data['rating'].split()[0])
+                score += int(rating)
+            except:
+                pass
+        
+        if product_data.get('review_count') and product_data['review_count'] != "0":
+            try:
+                reviews = int(product_data['review_count'].replace(',', ''))
+                if reviews > 100:
+                    score += 1
+                if reviews > 1000:
+                    score += 1
+            except:
+                pass
+        
+        return min(10, score)
+
+async def generate_amazon_article(product_url: str, affiliate_link: str) -> Dict[str, Any]:
+    """
+    Función principal para generar artículos de Amazon
+    
+    Args:
+        product_url: URL del producto de Amazon
+        affiliate_link: Enlace de afiliado
+        
+    Returns:
+        Dict con el artículo generado
+    """
+    generator = AmazonArticleGenerator()
+    await generator.initialize()
+    return await generator.generate_article(product_url, affiliate_link)
 
 # Vercel handler function
 def handler(request):
     """Handle HTTP requests for Vercel serverless function"""
+    start = time.perf_counter()
+    headers = getattr(request, "headers", None) or {}
+    # generate_article se perfila en el loop de fondo, donde corre de verdad
+    with request_scope(headers.get(PROFILE_HEADER)) as profile_ids:
+        response = _handle(request)
+    if profile_ids:
+        response[2][PROFILE_RESPONSE_HEADER] = ", ".join(profile_ids)
+    observe_request("generate-article", getattr(request, "method", "POST"), response[1], time.perf_counter() - start)
+    return response
+
+def _handle(request):
     try:
         data = request.get_json()
         if not data or 'product_url' not in data or 'affiliate_link' not in data:
@@ -206,10 +653,9 @@ def handler(request):
         product_url = data['product_url']
         affiliate_link = data['affiliate_link']
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(generate_amazon_article(product_url, affiliate_link))
-        loop.close()
+        # Loop de fondo del proceso: las invocaciones en caliente reutilizan
+        # el cliente HTTP asíncrono en lugar de abrir (y perder) uno por petición
+        result = run_sync(generate_amazon_article(product_url, affiliate_link))
 
         return json.dumps(result), 200, {'Content-Type': 'application/json'}
     except Exception as e:
@@ -223,5 +669,6 @@ if __name__ == "__main__":
         test_affiliate = "https://amzn.to/3xyz123"
         result = await generate_amazon_article(test_url, test_affiliate)
         print(json.dumps(result, indent=2, ensure_ascii=False))
+        await close_async_client()
     
     asyncio.run(test())
@@ -5,8 +5,15 @@ Health check endpoint para monitoreo del servicio
 from http.server import BaseHTTPRequestHandler
 import json
 import os
+import sys
 from datetime import datetime
 
+# Módulos compartidos en scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from metrics import instrumented
+
+@instrumented('health')
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         """Health check endpoint"""
@@ -38,6 +45,7 @@ class handler(BaseHTTPRequestHandler):
                 "generate_article": "/api/generate-article",
                 "scrape_amazon": "/api/scrape-amazon", 
                 "webhook": "/api/webhook",
+                "metrics": "/api/metrics",
                 "docs": "/api/docs"
             },
             "dependencies": {
@@ -0,0 +1,60 @@
+"""
+Estado de los trabajos encolados por el webhook
+GET /api/jobs/{job_id} devuelve el estado, el progreso y el resultado;
+GET /api/jobs devuelve el número de trabajos por estado
+"""
+
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+# Módulos compartidos en scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from job_queue import get_job_queue
+from metrics import instrumented
+
+@instrumented('jobs')
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Consulta un trabajo o el resumen de la cola"""
+        parsed_url = urlparse(self.path)
+        job_id = parse_qs(parsed_url.query).get('id', [None])[0]
+        if not job_id:
+            # /api/jobs/{job_id} sin reescritura (servidor local)
+            parts = [part for part in parsed_url.path.split('/') if part]
+            if len(parts) == 3 and parts[:2] == ['api', 'jobs']:
+                job_id = parts[2]
+
+        queue = get_job_queue()
+        if not job_id:
+            self._send_response(200, {
+                'success': True,
+                'jobs': queue.stats(),
+                'timestamp': datetime.utcnow().isoformat() + 'Z'
+            })
+            return
+
+        job = queue.get(job_id)
+        if job is None:
+            self._send_response(404, {
+                'success': False,
+                'error': f'Trabajo no encontrado: {job_id}'
+            })
+            return
+
+        self._send_response(200, dict(job, success=True))
+
+    def _send_response(self, status_code, data):
+        """Envía respuesta JSON"""
+        response = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
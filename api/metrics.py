@@ -0,0 +1,29 @@
+"""
+Métricas del proceso en el formato de texto de Prometheus
+GET /api/metrics devuelve contadores e histogramas de peticiones, scraping,
+llamadas a los modelos, artículos de fallback, cachés, cola y WordPress
+
+Solo refleja el proceso que atiende la petición: no se despliega en Vercel
+(.vercelignore) y se usa con benchmarks/local_server.py o un servidor de un
+solo proceso
+"""
+
+from http.server import BaseHTTPRequestHandler
+import os
+import sys
+
+# Módulos compartidos en scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from metrics import CONTENT_TYPE, REGISTRY
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Exposición para el scraper de Prometheus"""
+        response = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', CONTENT_TYPE)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
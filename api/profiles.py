@@ -0,0 +1,92 @@
+"""
+Perfiles de cProfile capturados con X-Profile o por muestreo (PROFILE_SAMPLE_RATE)
+GET /api/profiles lista los perfiles guardados; GET /api/profiles/{id}
+devuelve el resumen de pstats (?sort=tottime&limit=80) o el fichero .prof
+con ?format=raw, para snakeviz o pstats. Requiere la cabecera X-Profile con
+el valor de PROFILE_TOKEN
+"""
+
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+# Módulos compartidos en scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from profiling import HEADER, authorized, list_profiles, profile_path, render_profile
+
+SORT_KEYS = ('cumulative', 'tottime', 'calls', 'ncalls')
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Lista los perfiles o devuelve uno"""
+        if not authorized(self.headers.get(HEADER)):
+            self._send_json(403, {
+                'success': False,
+                'error': 'Se requiere la cabecera X-Profile con PROFILE_TOKEN'
+            })
+            return
+
+        parsed_url = urlparse(self.path)
+        query = parse_qs(parsed_url.query)
+        profile_id = query.get('id', [None])[0]
+        if not profile_id:
+            # /api/profiles/{id} sin reescritura (servidor local)
+            parts = [part for part in parsed_url.path.split('/') if part]
+            if len(parts) == 3 and parts[:2] == ['api', 'profiles']:
+                profile_id = parts[2]
+
+        if not profile_id:
+            self._send_json(200, {
+                'success': True,
+                'profiles': list_profiles(),
+                'timestamp': datetime.utcnow().isoformat() + 'Z'
+            })
+            return
+
+        path = profile_path(profile_id)
+        if path is None:
+            self._send_json(404, {
+                'success': False,
+                'error': f'Perfil no encontrado: {profile_id}'
+            })
+            return
+
+        if query.get('format', [''])[0] == 'raw':
+            with open(path, 'rb') as file:
+                self._send(200, file.read(), 'application/octet-stream', {
+                    'Content-Disposition': f'attachment; filename="{profile_id}.prof"'
+                })
+            return
+
+        sort = query.get('sort', ['cumulative'])[0]
+        if sort not in SORT_KEYS:
+            self._send_json(400, {
+                'success': False,
+                'error': f'sort debe ser uno de {", ".join(SORT_KEYS)}'
+            })
+            return
+        try:
+            limit = max(1, int(query.get('limit', ['40'])[0]))
+        except ValueError:
+            self._send_json(400, {'success': False, 'error': 'limit debe ser un entero'})
+            return
+
+        self._send(200, render_profile(path, sort, limit).encode('utf-8'), 'text/plain; charset=utf-8')
+
+    def _send_json(self, status_code, data):
+        """Envía respuesta JSON"""
+        self._send(status_code, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'), 'application/json')
+
+    def _send(self, status_code, body, content_type, headers=None):
+        self.send_response(status_code)
+        self.send_header('Content-type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
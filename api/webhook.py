@@ -6,9 +6,34 @@ Recibe datos desde Google Sheets y orquesta el procesamiento
 from http.server import BaseHTTPRequestHandler
 import json
 import os
+import sys
 import asyncio
 from datetime import datetime
 
+# Módulos compartidos en scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from idempotency import IN_FLIGHT, NEW, derive_idempotency_key, get_idempotency_store
+from job_queue import get_job_queue
+from metrics import instrumented
+from webhook_processing import (
+    MAX_BATCH_ROWS, is_allowed_callback_url, process_article_request, process_batch_request,
+    send_callback, sheet_range_start
+)
+
+# Con JOB_QUEUE_ENABLED=true los artículos y lotes se encolan para
+# scripts/job_worker.py en lugar de procesarse dentro de la petición
+JOB_QUEUE_ENABLED = os.getenv('JOB_QUEUE_ENABLED', 'false').lower() == 'true'
+QUEUED_EVENTS = ('process_article', 'process_batch')
+
+# En Vercel la función se congela al responder y no hay workers leyendo la
+# cola: los lotes con callback_url se procesan dentro de la petición
+SERVERLESS = bool(os.getenv('VERCEL'))
+
+# Segundos que un reintento espera a la petición original en curso
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', '25'))
+
+@instrumented('webhook')
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Procesa webhooks desde Make.com"""
@@ -23,23 +48,12 @@ class handler(BaseHTTPRequestHandler):
                 self._send_error(400, 'Datos de webhook inválidos')
                 return
             
-            # Procesar según el tipo de evento
-            event_type = data.get('event_type', 'process_article')
-            
-            if event_type == 'process_article':
-                result = self._process_article_request(data)
-            elif event_type == 'health_check':
-                result = self._process_health_check(data)
-            elif event_type == 'deployment_notification':
-                result = self._process_deployment_notification(data)
+            # Los reintentos de Make.com reutilizan la respuesta de la petición original
+            key = derive_idempotency_key(data, self.headers.get('Idempotency-Key'))
+            if key is None:
+                self._dispatch_event(data)
             else:
-                result = {
-                    'success': False,
-                    'error': f'Tipo de evento no soportado: {event_type}'
-                }
-            
-            # Enviar respuesta
-            self._send_response(200, result)
+                self._dispatch_idempotent(key, data)
             
         except json.JSONDecodeError:
             self._send_error(400, 'JSON inválido en webhook')
@@ -54,6 +68,7 @@ class handler(BaseHTTPRequestHandler):
             "description": "Webhook para integración con Make.com",
             "supported_events": [
                 "process_article",
+                "process_batch",
                 "health_check", 
                 "deployment_notification"
             ],
@@ -63,11 +78,117 @@ class handler(BaseHTTPRequestHandler):
                 "affiliate_link": "https://amzn.to/3xyz123",
                 "row_number": 2,
                 "sheet_id": "1BxiMVs0XRA5nFMdKvBdBZjgmUUqptlbs74OgvE2upms"
-            }
+            },
+            "example_batch_payload": {
+                "event_type": "process_batch",
+                "sheet_id": "1BxiMVs0XRA5nFMdKvBdBZjgmUUqptlbs74OgvE2upms",
+                "rows": [
+                    {"row_number": 2, "product_url": "https://www.amazon.com/dp/B08N5WRWNW", "affiliate_link": "https://amzn.to/3xyz123"}
+                ],
+                "sheet_range": "Amazon_Products_Automation!A2:D201 (alternativa a rows)",
+                "max_workers": 8,
+                "callback_url": "https://hook.integromat.com/tu-webhook-id (opcional)"
+            },
+            "article_content": ("Opcional en artículos y filas: artículo ya generado que se publica en WordPress "
+                                "(en los lotes, todos juntos con /batch/v1)"),
+            "async": "true encola el evento y responde 202 con job_id (por defecto JOB_QUEUE_ENABLED)",
+            "callback_url": ("Solo https a los hosts de WEBHOOK_CALLBACK_HOSTS. Con servidor propio el lote se "
+                             "encola (202 con job_id) y scripts/job_worker.py envía el resultado; en Vercel se "
+                             "procesa en la petición y se envía antes de responder"),
+            "job_status": "/api/jobs/{job_id}",
+            "idempotency": ("Cabecera Idempotency-Key o campo idempotency_key; por defecto sheet_id + row_number + "
+                            "product_url + affiliate_link. Solo se repiten las respuestas con success=true y los 202")
         }
         
         self._send_response(200, info)
     
+    def _dispatch_event(self, data):
+        """
+        Procesa el evento según su tipo y envía la respuesta
+        
+        Returns:
+            Tupla (código de estado, cuerpo enviado)
+        """
+        event_type = data.get('event_type', 'process_article')
+        
+        if event_type in QUEUED_EVENTS and self._should_enqueue(event_type, data):
+            result = self._enqueue_job(event_type, data)
+            self._send_response(202, result)
+            return 202, result
+        
+        if event_type == 'process_article':
+            result = process_article_request(data)
+        elif event_type == 'process_batch':
+            result = process_batch_request(data)
+            if data.get('callback_url'):
+                send_callback(data['callback_url'], result)
+        elif event_type == 'health_check':
+            result = self._process_health_check(data)
+        elif event_type == 'deployment_notification':
+            result = self._process_deployment_notification(data)
+        else:
+            result = {
+                'success': False,
+                'error': f'Tipo de evento no soportado: {event_type}'
+            }
+        
+        # Enviar respuesta
+        self._send_response(200, result)
+        return 200, result
+    
+    def _should_enqueue(self, event_type, data):
+        """
+        Si el evento se encola para los workers en lugar de procesarse aquí
+        
+        Un lote con callback_url se encola siempre que haya workers (fuera de
+        Vercel): responder 202 y seguir trabajando dentro de la misma
+        petición no es fiable, y el worker envía el resultado al callback.
+        """
+        if 'async' in data:
+            # Make.com puede enviar el campo como texto ("false", "0")
+            return str(data['async']).lower() in ('1', 'true', 'yes')
+        if event_type == 'process_batch' and data.get('callback_url') and not SERVERLESS:
+            return True
+        return JOB_QUEUE_ENABLED
+    
+    def _dispatch_idempotent(self, key, data):
+        """
+        Procesa el evento una sola vez por clave de idempotencia
+        
+        Un reintento que llega con la petición original en curso espera a
+        su respuesta; uno que llega después la recibe guardada. Si la
+        original falla (excepción o success=False), la clave se libera y el
+        reintento la procesa: solo se guardan los éxitos y las aceptaciones 202.
+        """
+        store = get_idempotency_store()
+        state, record = store.begin(key)
+        if state == IN_FLIGHT:
+            record = store.wait(key, IDEMPOTENCY_WAIT)
+            if record is None:
+                state, record = store.begin(key)
+        
+        if record is not None:
+            self._send_response(record['status_code'], record['body'],
+                                headers={'Idempotent-Replayed': 'true'})
+            return
+        if state != NEW:
+            self._send_response(409, {
+                'success': False,
+                'error': 'Petición duplicada en curso; reintenta más tarde',
+                'timestamp': datetime.utcnow().isoformat() + 'Z'
+            }, headers={'Retry-After': str(int(IDEMPOTENCY_WAIT))})
+            return
+        
+        try:
+            status_code, body = self._dispatch_event(data)
+        except Exception:
+            store.release(key)
+            raise
+        if body.get('success'):
+            store.complete(key, status_code, body)
+        else:
+            store.release(key)
+    
     def _validate_webhook_data(self, data):
         """Valida los datos del webhook"""
         if not isinstance(data, dict):
@@ -79,65 +200,42 @@ class handler(BaseHTTPRequestHandler):
             required_fields = ['product_url', 'affiliate_link']
             return all(field in data and data[field] for field in required_fields)
         
-        return True  # Otros tipos de eventos son menos estrictos
-    
-    def _process_article_request(self, data):
-        """Procesa solicitud de generación de artículo"""
-        try:
-            product_url = data['product_url']
-            affiliate_link = data['affiliate_link']
-            row_number = data.get('row_number')
-            sheet_id = data.get('sheet_id')
-            
-            # Validar URLs
-            if not self._is_valid_amazon_url(product_url):
-                return {
-                    'success': False,
-                    'error': 'URL de Amazon inválida',
-                    'row_number': row_number
-                }
-            
-            if not self._is_valid_affiliate_link(affiliate_link):
-                return {
-                    'success': False,
-                    'error': 'Enlace de afiliado inválido',
-                    'row_number': row_number
-                }
-            
-            # Aquí se integraría con el generador de artículos
-            # Por ahora, simulamos el procesamiento
-            
-            # En un entorno real, esto llamaría a:
-            # 1. /api/scrape-amazon para extraer datos
-            # 2. /api/generate-article para crear el artículo
-            # 3. WordPress API para publicar
-            
-            # Respuesta simulada
-            result = {
-                'success': True,
-                'message': 'Artículo procesado exitosamente',
-                'data': {
-                    'product_url': product_url,
-                    'affiliate_link': affiliate_link,
-                    'article_title': f'Análisis del producto Amazon',
-                    'article_url': f'https://myamzdeals.shop/producto-{row_number}',
-                    'processing_time': '45 segundos',
-                    'word_count': 1850,
-                    'seo_score': 8
-                },
-                'row_number': row_number,
-                'sheet_id': sheet_id,
-                'processed_at': datetime.utcnow().isoformat() + 'Z'
-            }
+        if event_type == 'process_batch':
+            if data.get('callback_url') is not None and not is_allowed_callback_url(data['callback_url']):
+                return False
             
-            return result
+            max_workers = data.get('max_workers')
+            if max_workers not in (None, ''):
+                try:
+                    if int(max_workers) < 1:
+                        return False
+                except (TypeError, ValueError):
+                    return False
             
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'Error procesando artículo: {str(e)}',
-                'row_number': data.get('row_number')
-            }
+            rows = data.get('rows')
+            if rows is not None:
+                return isinstance(rows, list) and 0 < len(rows) <= MAX_BATCH_ROWS
+            if not (isinstance(data.get('sheet_range'), str) and data['sheet_range'] and data.get('sheet_id')):
+                return False
+            try:
+                sheet_range_start(data['sheet_range'])
+            except ValueError:
+                return False
+            return True
+        
+        return True  # Otros tipos de eventos son menos estrictos
+    
+    def _enqueue_job(self, event_type, data):
+        """Encola el evento para los workers y devuelve el id del trabajo"""
+        job_id = get_job_queue().enqueue(event_type, data)
+        return {
+            'success': True,
+            'accepted': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}',
+            'received_at': datetime.utcnow().isoformat() + 'Z'
+        }
     
     def _process_health_check(self, data):
         """Procesa health check desde Make.com"""
@@ -163,36 +261,20 @@ class handler(BaseHTTPRequestHandler):
             'received_at': datetime.utcnow().isoformat() + 'Z'
         }
     
-    def _is_valid_amazon_url(self, url):
-        """Valida si es una URL válida de Amazon"""
-        if not url or not isinstance(url, str):
-            return False
-        
-        amazon_domains = [
-            'amazon.com', 'amazon.es', 'amazon.co.uk', 'amazon.de',
-            'amazon.fr', 'amazon.it', 'amazon.ca', 'amazon.com.mx'
-        ]
-        
-        return any(domain in url for domain in amazon_domains) and '/dp/' in url
-    
-    def _is_valid_affiliate_link(self, link):
-        """Valida si es un enlace de afiliado válido"""
-        if not link or not isinstance(link, str):
-            return False
-        
-        return 'amzn.to' in link or ('amazon.' in link and 'tag=' in link)
-    
-    def _send_response(self, status_code, data):
+    def _send_response(self, status_code, data, headers=None):
         """Envía respuesta JSON"""
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, Idempotency-Key')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         
-        response = json.dumps(data, ensure_ascii=False, indent=2)
-        self.wfile.write(response.encode('utf-8'))
+        response = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
     
     def _send_error(self, status_code, message):
         """Envía respuesta de error"""
@@ -209,6 +291,6 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, Idempotency-Key')
         self.end_headers()
 
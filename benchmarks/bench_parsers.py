@@ -0,0 +1,98 @@
+"""
+Benchmark de parseo + extracción por backend HTML
+
+Mide, para cada backend instalado, el tiempo por página de parsear el HTML
+y de resolver el plan de extracción, y comprueba que todos devuelven los
+mismos campos que html.parser.
+
+Uso:
+    python benchmarks/bench_parsers.py [--pages DIR] [--repeat 5] [--backends selectolax,lxml]
+
+Si DIR no contiene páginas guardadas (*.html) se genera el corpus sintético
+de benchmarks/fixtures/.
+"""
+
+import argparse
+import glob
+import os
+import re
+import statistics
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, '..', 'scripts'))
+sys.path.append(os.path.join(BENCH_DIR, 'fixtures'))
+
+from generate_pages import PAGES_DIR, generate_corpus
+from html_backends import available_backends, get_backend
+from product_extraction import ExtractionPlan
+
+
+def load_pages(directory: str) -> list:
+    """Devuelve [(url, contenido)] de las páginas guardadas en el directorio"""
+    paths = sorted(glob.glob(os.path.join(directory, '*.html')))
+    if not paths:
+        paths = generate_corpus(directory)
+
+    pages = []
+    for path in paths:
+        asin = re.search(r'([A-Z0-9]{10})', os.path.basename(path))
+        url = f"https://www.amazon.com/dp/{asin.group(1) if asin else 'UNKNOWN000'}"
+        with open(path, 'rb') as f:
+            pages.append((url, f.read()))
+    return pages
+
+
+def bench_backend(name: str, pages: list, repeat: int) -> dict:
+    plan = ExtractionPlan(backend=get_backend(name))
+    parse_times, extract_times, results = [], [], []
+
+    for url, content in pages:
+        page_parse, page_extract = [], []
+        for _ in range(repeat):
+            data, timings = plan.parse_and_extract(content, url)
+            page_parse.append(timings['parse'])
+            page_extract.append(sum(value for key, value in timings.items()
+                                    if key not in ('parser', 'parse')))
+        parse_times.append(statistics.median(page_parse))
+        extract_times.append(statistics.median(page_extract))
+        results.append(data)
+
+    return {
+        'parse_ms': statistics.mean(parse_times),
+        'extract_ms': statistics.mean(extract_times),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de backends de parseo HTML')
+    parser.add_argument('--pages', default=PAGES_DIR, help='Directorio con páginas de producto guardadas')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--backends', default=','.join(available_backends()))
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    backends = [name for name in args.backends.split(',') if name]
+    size_kb = statistics.mean(len(content) for _, content in pages) / 1024
+    print(f"{len(pages)} páginas ({size_kb:.0f} KB de media), {args.repeat} repeticiones\n")
+
+    reports = {name: bench_backend(name, pages, args.repeat) for name in backends}
+    baseline = reports.get('html.parser')
+
+    print(f"{'backend':<14}{'parse ms':>10}{'extract ms':>12}{'total ms':>10}{'speedup':>9}  campos")
+    for name, report in reports.items():
+        total = report['parse_ms'] + report['extract_ms']
+        if baseline:
+            base_total = baseline['parse_ms'] + baseline['extract_ms']
+            speedup = f"{base_total / total:.1f}x"
+            mismatches = sorted({field for ours, theirs in zip(report['results'], baseline['results'])
+                                 for field in theirs if ours.get(field) != theirs[field]})
+            fields = 'iguales' if not mismatches else 'difieren: ' + ', '.join(mismatches)
+        else:
+            speedup, fields = '-', '-'
+        print(f"{name:<14}{report['parse_ms']:>10.1f}{report['extract_ms']:>12.1f}{total:>10.1f}{speedup:>9}  {fields}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""
+Benchmark del pipeline scrape → generate → publish con servicios simulados
+
+Arranca benchmarks/fake_services.py en otro proceso (Amazon, Gemini/Ollama
+y WordPress locales) y mide por etapa el throughput, la latencia
+p50/p95/p99 y el CPU de este proceso por operación:
+
+    scrape         AmazonScraper.scrape_product sobre el corpus de fixtures/
+    generate       FreeAIArticleGenerator.generate_article
+    publish        WordPressPublisher.publish, un artículo por llamada
+    publish_batch  WordPressPublisher.publish_many, todos los artículos
+    webhook        POST process_article a api/webhook.py
+
+Uso:
+    python benchmarks/bench_pipeline.py [--products 40] [--concurrency 8] [--provider gemini]
+        [--llm-latency 0.3] [--tokens-per-second 200] [--json resultados.json]
+
+Con --json se guarda el informe para comparar entre versiones.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCH_DIR, '..')
+sys.path.append(os.path.join(ROOT_DIR, 'scripts'))
+
+STAGES = ('scrape', 'generate', 'publish', 'publish_batch', 'webhook')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class StageReport:
+    """Latencias de cada operación, tiempo total y CPU consumido por una etapa"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.extra = {}
+
+    def as_dict(self):
+        ops = len(self.latencies)
+        return {
+            'ops': ops,
+            'errors': self.errors,
+            'throughput': ops / self.wall if self.wall else 0.0,
+            'p50_ms': percentile(self.latencies, 50) * 1000,
+            'p95_ms': percentile(self.latencies, 95) * 1000,
+            'p99_ms': percentile(self.latencies, 99) * 1000,
+            'cpu_ms_per_op': self.cpu / ops * 1000 if ops else 0.0,
+            **self.extra,
+        }
+
+
+def run_threaded(name, func, items, concurrency):
+    """Ejecuta func(item) con un pool de hilos; func devuelve True si la operación fue correcta"""
+    report = StageReport(name)
+
+    def timed(item):
+        start = time.perf_counter()
+        ok = func(item)
+        return time.perf_counter() - start, ok
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, ok in executor.map(timed, items):
+            report.latencies.append(latency)
+            report.errors += 0 if ok else 1
+    report.wall = time.perf_counter() - wall
+    report.cpu = time.process_time() - cpu
+    return report
+
+
+def run_async(name, func, items, concurrency):
+    """Versión asíncrona: func(item) es una corrutina, con `concurrency` en vuelo"""
+    report = StageReport(name)
+
+    from http_pool import close_async_client
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(item):
+            async with semaphore:
+                start = time.perf_counter()
+                ok = await func(item)
+                report.latencies.append(time.perf_counter() - start)
+                report.errors += 0 if ok else 1
+
+        try:
+            await asyncio.gather(*(timed(item) for item in items))
+        finally:
+            # El loop de asyncio.run muere aquí: su cliente httpx también
+            await close_async_client()
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    asyncio.run(main())
+    report.wall = time.perf_counter() - wall
+    report.cpu = time.process_time() - cpu
+    return report
+
+
+def start_fake_services(args):
+    """Lanza fake_services.py en un subproceso: su CPU no cuenta en las mediciones"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'fake_services.py'), '--port', str(args.port),
+         '--llm-latency', str(args.llm_latency), '--tokens-per-second', str(args.tokens_per_second),
+         '--article-words', str(args.article_words), '--llm-error-rate', str(args.llm_error_rate),
+         '--amazon-latency', str(args.amazon_latency)],
+        stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError('No se pudieron arrancar los servicios simulados')
+    return process, f'http://127.0.0.1:{args.port}'
+
+
+def configure_environment(base, provider, workdir):
+    """Apunta los clientes a los servicios simulados y quita los límites que falsearían la medida"""
+    os.environ.update({
+        'GEMINI_API_BASE': base,
+        'OLLAMA_API_URL': base,
+        'GOOGLE_GEMINI_API_KEY': 'benchmark' if provider in ('gemini', 'auto') else '',
+        'HUGGINGFACE_API_KEY': '',
+        'GEMINI_RPM_LIMIT': '1000000',
+        'GEMINI_TPM_LIMIT': '1000000000',
+        'GEMINI_BURST': '100000',
+        'RATE_LIMIT_STORE': 'memory',
+        'LLM_CACHE_ENABLED': 'false',
+        'IDEMPOTENCY_DB': os.path.join(workdir, 'idempotency.sqlite3'),
+        'JOB_QUEUE_ENABLED': 'false',
+        'WORDPRESS_API_URL': f'{base}/wp-json/wp/v2',
+        'WORDPRESS_USERNAME': 'benchmark',
+        'WORDPRESS_PASSWORD': 'benchmark',
+    })
+
+
+def bench_scrape(base, args):
+    from rate_limit import HostRateLimiter
+    from serverless_solution import AmazonScraper
+
+    # Sin caché de páginas ni espaciado por host: se mide la descarga y el parseo
+    scraper = AmazonScraper(max_workers=args.concurrency, rate_limiter=HostRateLimiter(1e9, jitter=0))
+    scraper.cache = None
+    urls = [f'{base}/dp/BENCH{index:05d}' for index in range(args.products)]
+    products = {}
+
+    def scrape(url):
+        result = scraper.scrape_product(url, use_cache=False)
+        if result['success']:
+            products[url] = result['data']
+        return result['success']
+
+    return run_threaded('scrape', scrape, urls, args.concurrency), [products.get(url) for url in urls]
+
+
+def bench_generate(products, args):
+    from free_ai_integration import FreeAIArticleGenerator
+    from llm_router import LLMRouter
+    from provider_health import ProviderHealth
+
+    generator = FreeAIArticleGenerator(health=ProviderHealth(), router=LLMRouter(deadline=args.deadline))
+    articles = [None] * len(products)
+    providers = {}
+
+    async def generate(index):
+        data = products[index] or {'title': f'Producto {index}'}
+        product_data = dict(data, current_price=data.get('price'))
+        result = await generator.generate_article(product_data, f'https://amzn.to/bench{index}')
+        if result.get('success'):
+            articles[index] = dict(result['article'], images=[f"{os.environ['GEMINI_API_BASE']}/images/{index % 10}.png"])
+            providers[result['ai_provider']] = providers.get(result['ai_provider'], 0) + 1
+        return bool(result.get('success'))
+
+    report = run_async('generate', generate, range(len(products)), args.concurrency)
+    report.extra['providers'] = providers
+    return report, [article for article in articles if article]
+
+
+def bench_publish(articles, args):
+    from wordpress_publisher import WordPressPublisher
+
+    single = WordPressPublisher(upload_images=False)
+    report = run_threaded(
+        'publish',
+        lambda article: single.publish(article['title'], article['content'])['success'],
+        articles, args.concurrency
+    )
+    report.extra['http_requests'] = single.requests_sent
+
+    batch = WordPressPublisher(upload_images=True)
+    batch_report = StageReport('publish_batch')
+    cpu, wall = time.process_time(), time.perf_counter()
+    posts = [{'title': article['title'], 'content': article['content'], 'images': article['images']}
+             for article in articles]
+    results = batch.publish_many(posts)
+    batch_report.wall = time.perf_counter() - wall
+    batch_report.cpu = time.process_time() - cpu
+    # Una operación por artículo publicado, con la latencia media del lote
+    batch_report.latencies = [batch_report.wall / max(1, len(results))] * len(results)
+    batch_report.errors = sum(1 for result in results if not result['success'])
+    batch_report.extra['http_requests'] = batch.requests_sent
+    return report, batch_report
+
+
+def bench_webhook(args):
+    import requests
+
+    spec = importlib.util.spec_from_file_location('webhook', os.path.join(ROOT_DIR, 'api', 'webhook.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.handler.log_message = lambda *a: None
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), module.handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/api/webhook'
+    session = requests.Session()
+
+    def post(row):
+        response = session.post(url, json={
+            'event_type': 'process_article',
+            'product_url': f'https://www.amazon.com/dp/BENCH{row:05d}',
+            'affiliate_link': f'https://amzn.to/bench{row}',
+            'row_number': row,
+            'sheet_id': 'benchmark',
+        }, timeout=60)
+        return response.status_code == 200 and response.json().get('success', False)
+
+    try:
+        return run_threaded('webhook', post, range(args.products), args.concurrency)
+    finally:
+        server.shutdown()
+
+
+def print_report(reports, args):
+    print(f"\n{args.products} productos, concurrencia {args.concurrency}, proveedor {args.provider}, "
+          f"LLM {args.llm_latency}s + {args.tokens_per_second:.0f} tokens/s\n")
+    print(f"{'etapa':<15}{'ops':>6}{'err':>5}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'CPU ms/op':>11}")
+    for name, report in reports.items():
+        print(f"{name:<15}{report['ops']:>6}{report['errors']:>5}{report['throughput']:>9.1f}"
+              f"{report['p50_ms']:>9.1f}{report['p95_ms']:>9.1f}{report['p99_ms']:>9.1f}"
+              f"{report['cpu_ms_per_op']:>11.2f}")
+    for name, report in reports.items():
+        details = {key: report[key] for key in ('providers', 'http_requests') if key in report}
+        if details:
+            print(f"  {name}: {json.dumps(details, ensure_ascii=False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del pipeline con servicios simulados')
+    parser.add_argument('--products', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--provider', choices=('gemini', 'ollama', 'auto'), default='gemini')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--llm-latency', type=float, default=0.3)
+    parser.add_argument('--tokens-per-second', type=float, default=200)
+    parser.add_argument('--article-words', type=int, default=800)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--amazon-latency', type=float, default=0.05)
+    parser.add_argument('--deadline', type=float, default=20, help='Plazo del router antes del hedging (s)')
+    parser.add_argument('--json', help='Guardar el informe en este fichero')
+    args = parser.parse_args()
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+
+    process, base = start_fake_services(args)
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    configure_environment(base, args.provider, workdir)
+
+    reports = {}
+    try:
+        products, articles = [None] * args.products, []
+        if 'scrape' in stages:
+            report, products = bench_scrape(base, args)
+            reports['scrape'] = report.as_dict()
+        if stages and {'generate', 'publish', 'publish_batch'} & set(stages):
+            report, articles = bench_generate(products, args)
+            if 'generate' in stages:
+                reports['generate'] = report.as_dict()
+        if articles and {'publish', 'publish_batch'} & set(stages):
+            single, batch = bench_publish(articles, args)
+            if 'publish' in stages:
+                reports['publish'] = single.as_dict()
+            if 'publish_batch' in stages:
+                reports['publish_batch'] = batch.as_dict()
+        if 'webhook' in stages:
+            reports['webhook'] = bench_webhook(args).as_dict()
+    finally:
+        process.terminate()
+        process.wait()
+
+    print_report(reports, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'stages': reports}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark de generación en una llamada frente a dos llamadas (contenido + SEO)
+
+Sustituye el modelo de Gemini de api/generate-article.py por un modelo
+simulado cuya latencia depende de los tokens generados, y compara por
+artículo el número de llamadas, los tokens de entrada y salida y el tiempo
+total del pipeline.
+
+Uso:
+    python benchmarks/bench_single_call.py [--articles 3] [--words 1800] [--tokens-per-second 400]
+
+Los tokens se estiman como caracteres / 4.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCH_DIR, '..', 'api')
+sys.path.append(os.path.join(BENCH_DIR, '..', 'scripts'))
+
+from rate_limit import TokenBucketLimiter
+
+PRODUCT = {
+    'title': 'Echo Dot (4.ª generación) | Altavoz inteligente con Alexa',
+    'current_price': '49,99 €',
+    'description': 'Altavoz inteligente con sonido mejorado y control del hogar digital.',
+    'features': ['Sonido más nítido', 'Controla tu hogar digital', 'Diseño compacto'],
+    'rating': '4.7',
+    'review_count': '120000',
+    'availability': 'En stock',
+    'brand': 'Amazon',
+    'category': 'Electrónica › Hogar digital › Altavoces inteligentes',
+    'images': ['https://m.media-amazon.com/images/I/B08N5WRWNW.jpg'],
+    'asin': 'B08N5WRWNW',
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubModel:
+    """
+    Modelo simulado con la misma interfaz asíncrona que GenerativeModel.
+
+    Responde según el tipo de prompt y tarda `base_latency` más el tiempo de
+    generar los tokens de salida a `tokens_per_second`.
+    """
+
+    def __init__(self, words: int, tokens_per_second: float, base_latency: float):
+        self.words = words
+        self.tokens_per_second = tokens_per_second
+        self.base_latency = base_latency
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def _article_html(self) -> str:
+        paragraph = ('<p>El Echo Dot ofrece un sonido equilibrado y una integración sencilla con '
+                     'el hogar digital, ideal para quien busca su primer altavoz inteligente.</p>')
+        words_per_paragraph = len(paragraph.split())
+        return '<h1>Echo Dot: análisis completo</h1>' + paragraph * (self.words // words_per_paragraph)
+
+    def _respond(self, prompt: str) -> str:
+        if 'Simula la extracción' in prompt:
+            return json.dumps(PRODUCT, ensure_ascii=False)
+        if 'Determina la categoría' in prompt:
+            return 'electronics'
+        if 'Optimiza este contenido para SEO' in prompt or 'Responde ÚNICAMENTE con un objeto JSON' in prompt:
+            return json.dumps({
+                'title': 'Echo Dot 4: análisis y mejor precio',
+                'meta_description': 'Análisis completo del Echo Dot de 4.ª generación: sonido, Alexa y precio.',
+                'keywords': ['echo dot', 'altavoz inteligente', 'alexa'],
+                'content': self._article_html(),
+                'alt_texts': ['Echo Dot de 4.ª generación en color antracita'],
+                'seo_score': '8',
+            }, ensure_ascii=False)
+        return self._article_html()
+
+    async def generate_content_async(self, prompt: str) -> StubResponse:
+        text = self._respond(prompt)
+        output_tokens = estimate_tokens(text)
+        self.calls += 1
+        self.input_tokens += estimate_tokens(prompt)
+        self.output_tokens += output_tokens
+        await asyncio.sleep(self.base_latency + output_tokens / self.tokens_per_second)
+        return StubResponse(text)
+
+
+def load_generator_class():
+    """Carga AmazonArticleGenerator desde api/generate-article.py"""
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+    spec = importlib.util.spec_from_file_location('generate_article', os.path.join(API_DIR, 'generate-article.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.AmazonArticleGenerator
+
+
+async def bench_mode(generator_class, single_call: bool, model: StubModel, articles: int) -> dict:
+    generator = generator_class(single_call=single_call)
+    generator.model = model
+    # Sin límite de frecuencia: se mide solo el coste de las llamadas
+    generator.limiter = TokenBucketLimiter('benchmark', rpm=None)
+    # Sin caché de respuestas: cada artículo repite todas las llamadas
+    generator.cache = None
+    model.reset()
+
+    wall_times = []
+    for _ in range(articles):
+        start = time.perf_counter()
+        result = await generator.generate_article('https://www.amazon.es/dp/B08N5WRWNW', 'https://amzn.to/3xyz123')
+        wall_times.append((time.perf_counter() - start) * 1000)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+
+    return {
+        'calls': model.calls / articles,
+        'input_tokens': model.input_tokens / articles,
+        'output_tokens': model.output_tokens / articles,
+        'wall_ms': statistics.mean(wall_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de llamada única frente a dos llamadas')
+    parser.add_argument('--articles', type=int, default=3)
+    parser.add_argument('--words', type=int, default=1800, help='Palabras del artículo generado')
+    parser.add_argument('--tokens-per-second', type=float, default=400)
+    parser.add_argument('--base-latency', type=float, default=0.3, help='Latencia fija por llamada (s)')
+    args = parser.parse_args()
+
+    generator_class = load_generator_class()
+    model = StubModel(args.words, args.tokens_per_second, args.base_latency)
+
+    reports = {}
+    for name, single_call in (('dos llamadas', False), ('llamada única', True)):
+        reports[name] = asyncio.run(bench_mode(generator_class, single_call, model, args.articles))
+
+    print(f"{args.articles} artículos de ~{args.words} palabras, {args.tokens_per_second:.0f} tokens/s\n")
+    print(f"{'modo':<16}{'llamadas':>10}{'tokens in':>11}{'tokens out':>12}{'ms/artículo':>13}")
+    for name, report in reports.items():
+        print(f"{name:<16}{report['calls']:>10.1f}{report['input_tokens']:>11.0f}"
+              f"{report['output_tokens']:>12.0f}{report['wall_ms']:>13.0f}")
+
+    two, one = reports['dos llamadas'], reports['llamada única']
+    print(f"\nTokens de salida: -{(1 - one['output_tokens'] / two['output_tokens']) * 100:.0f}%  "
+          f"Tiempo: {two['wall_ms'] / one['wall_ms']:.2f}x más rápido")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+Servicios externos simulados para los benchmarks
+Un único servidor HTTP local que imita, según la ruta:
+
+    /dp/{ASIN}                                   páginas de producto de Amazon (corpus de fixtures/)
+    /images/{nombre}                             imágenes de producto
+    /v1beta/models/{modelo}:generateContent      Gemini (JSON)
+    /v1beta/models/{modelo}:streamGenerateContent Gemini (server-sent events con alt=sse)
+    /api/generate, /api/tags                     Ollama (JSON o una línea JSON por fragmento)
+    /wp-json/wp/v2/posts, /media, /wp-json/batch/v1  API REST de WordPress
+    /__stats                                     contadores de peticiones y tokens
+
+La latencia de los modelos es `llm_latency` más el tiempo de generar los
+tokens de salida a `tokens_per_second`, de modo que los resultados dependen
+del tamaño del artículo como con un proveedor real. La respuesta depende del
+tipo de prompt (extracción, categoría, artículo JSON o HTML).
+
+Uso:
+    python benchmarks/fake_services.py [--port 8790] [--llm-latency 0.3] [--tokens-per-second 200]
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, 'fixtures'))
+
+from generate_pages import PAGES_DIR, generate_corpus
+
+_ASIN_RE = re.compile(r'/dp/([A-Za-z0-9]{10})')
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class ServiceConfig:
+    def __init__(self, llm_latency: float = 0.3, tokens_per_second: float = 200, article_words: int = 800,
+                 llm_error_rate: float = 0.0, amazon_latency: float = 0.05, wordpress_latency: float = 0.02,
+                 pages_dir: str = PAGES_DIR):
+        self.llm_latency = llm_latency
+        self.tokens_per_second = tokens_per_second
+        self.article_words = article_words
+        self.llm_error_rate = llm_error_rate
+        self.amazon_latency = amazon_latency
+        self.wordpress_latency = wordpress_latency
+
+        paths = sorted(glob.glob(os.path.join(pages_dir, '*.html'))) or generate_corpus(pages_dir)
+        self.pages = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                self.pages.append(f.read())
+
+        self.stats = {'amazon': 0, 'images': 0, 'gemini': 0, 'ollama': 0, 'wordpress': 0,
+                      'wordpress_batch': 0, 'llm_errors': 0, 'input_tokens': 0, 'output_tokens': 0}
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def new_id(self) -> int:
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+    def article(self, prompt: str) -> str:
+        """Artículo HTML con secciones h2 de ~article_words palabras"""
+        title = re.search(r'PRODUCTO: (.+)', prompt)
+        title = title.group(1).strip() if title else 'Producto de Amazon'
+        paragraph = ('<p>Analizamos a fondo este producto: calidad de construcción, prestaciones en el uso '
+                     'diario y relación calidad-precio frente a sus principales alternativas.</p>\n')
+        per_paragraph = len(paragraph.split())
+        sections = ['Características principales', 'Pros y contras', 'Para quién es', 'Conclusión']
+        paragraphs = max(1, self.article_words // per_paragraph // len(sections))
+        body = ''.join(f'<h2>{section}</h2>\n' + paragraph * paragraphs for section in sections)
+        return f'<h1>{title[:60]}: análisis completo</h1>\n{body}'
+
+    def respond(self, prompt: str) -> str:
+        """Respuesta según el tipo de prompt de los generadores (extracción, categoría, JSON o HTML)"""
+        if 'Simula la extracción' in prompt:
+            return json.dumps({'title': 'Producto de Amazon', 'current_price': '49,99 €', 'rating': '4.5',
+                               'features': ['Característica 1', 'Característica 2'], 'brand': 'Marca',
+                               'description': 'Descripción del producto.'}, ensure_ascii=False)
+        if 'Determina la categoría' in prompt:
+            return 'electronics'
+        if 'Responde ÚNICAMENTE con un objeto JSON' in prompt or 'Optimiza este contenido para SEO' in prompt:
+            return json.dumps({'title': 'Análisis completo y mejor precio', 'keywords': ['amazon', 'análisis'],
+                               'meta_description': 'Análisis del producto: características, pros, contras y precio.',
+                               'content': self.article(prompt), 'alt_texts': ['Imagen del producto'],
+                               'seo_score': '8'}, ensure_ascii=False)
+        return self.article(prompt)
+
+    def generation_delay(self, text: str) -> float:
+        return self.llm_latency + estimate_tokens(text) / self.tokens_per_second
+
+
+class FakeServicesHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config: ServiceConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        config = self.config
+
+        if path == '/__stats':
+            with config.lock:
+                self._send_json(200, dict(config.stats))
+        elif _ASIN_RE.search(path):
+            config.count('amazon')
+            time.sleep(config.amazon_latency)
+            asin = _ASIN_RE.search(path).group(1)
+            page = config.pages[zlib.crc32(asin.encode()) % len(config.pages)]
+            self._send(200, page, 'text/html; charset=utf-8')
+        elif path.startswith('/images/'):
+            config.count('images')
+            self._send(200, b'\x89PNG\r\n\x1a\n' + os.urandom(2048), 'image/png')
+        elif path == '/api/tags':
+            self._send_json(200, {'models': [{'name': 'llama2'}]})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if ':generateContent' in path or ':streamGenerateContent' in path:
+            self._gemini(stream=':streamGenerateContent' in path)
+        elif path == '/api/generate':
+            self._ollama()
+        elif path.startswith('/wp-json/'):
+            self._wordpress(path)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def _llm_error(self) -> bool:
+        if random.random() < self.config.llm_error_rate:
+            self.config.count('llm_errors')
+            self._send_json(503, {'error': {'code': 503, 'message': 'The model is overloaded'}})
+            return True
+        return False
+
+    def _gemini(self, stream: bool):
+        config = self.config
+        payload = self._read_json()
+        config.count('gemini')
+        if self._llm_error():
+            return
+
+        prompt = ''.join(part.get('text', '') for content in payload.get('contents', [])
+                         for part in content.get('parts', []))
+        text = config.respond(prompt)
+        config.count('input_tokens', estimate_tokens(prompt))
+        config.count('output_tokens', estimate_tokens(text))
+
+        if not stream:
+            time.sleep(config.generation_delay(text))
+            self._send_json(200, {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'},
+                                                  'finishReason': 'STOP'}]})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        time.sleep(config.llm_latency)
+        for chunk in re.split(r'(?=<h2>)', text):
+            time.sleep(estimate_tokens(chunk) / config.tokens_per_second)
+            event = {'candidates': [{'content': {'parts': [{'text': chunk}], 'role': 'model'}}]}
+            self.wfile.write(f'data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n'.encode('utf-8'))
+            self.wfile.flush()
+        self.close_connection = True
+
+    def _ollama(self):
+        config = self.config
+        payload = self._read_json()
+        config.count('ollama')
+        if self._llm_error():
+            return
+
+        prompt = payload.get('prompt', '')
+        text = config.respond(prompt)
+        config.count('input_tokens', estimate_tokens(prompt))
+        config.count('output_tokens', estimate_tokens(text))
+
+        if not payload.get('stream', True):
+            time.sleep(config.generation_delay(text))
+            self._send_json(200, {'model': payload.get('model'), 'response': text, 'done': True})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        time.sleep(config.llm_latency)
+        for chunk in re.split(r'(?=<h2>)', text):
+            time.sleep(estimate_tokens(chunk) / config.tokens_per_second)
+            self.wfile.write((json.dumps({'response': chunk, 'done': False}) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b'{"response": "", "done": true}\n')
+        self.close_connection = True
+
+    def _create_post(self, body) -> dict:
+        post_id = self.config.new_id()
+        return {'id': post_id, 'link': f'http://wordpress.local/?p={post_id}', 'status': body.get('status'),
+                'title': {'rendered': body.get('title')}, 'featured_media': body.get('featured_media', 0)}
+
+    def _wordpress(self, path: str):
+        config = self.config
+        if not self.headers.get('Authorization', '').startswith('Basic '):
+            self._read_json()
+            self._send_json(401, {'code': 'rest_not_logged_in', 'message': 'No autenticado'})
+            return
+
+        time.sleep(config.wordpress_latency)
+        if path == '/wp-json/batch/v1':
+            payload = self._read_json()
+            config.count('wordpress_batch')
+            responses = [{'status': 201, 'headers': {}, 'body': self._create_post(request.get('body') or {})}
+                         for request in payload.get('requests', [])]
+            self._send_json(207, {'responses': responses})
+        elif path.endswith('/posts'):
+            config.count('wordpress')
+            self._send_json(201, self._create_post(self._read_json()))
+        elif path.endswith('/media'):
+            config.count('wordpress')
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self._send_json(201, {'id': config.new_id(), 'media_type': 'image'})
+        else:
+            self._read_json()
+            self._send_json(404, {'code': 'rest_no_route'})
+
+
+class FakeServicesServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Cola de listen amplia para las ráfagas de las pruebas de carga
+    request_queue_size = 1024
+
+
+def start_services(port: int = 0, **options) -> ThreadingHTTPServer:
+    """Arranca el servidor en un hilo y lo devuelve (server.server_port tiene el puerto)"""
+    handler = type('Handler', (FakeServicesHandler,), {'config': ServiceConfig(**options)})
+    server = FakeServicesServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servicios externos simulados para los benchmarks')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--llm-latency', type=float, default=0.3, help='Latencia fija por llamada al modelo (s)')
+    parser.add_argument('--tokens-per-second', type=float, default=200)
+    parser.add_argument('--article-words', type=int, default=800)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Fracción de llamadas que devuelven 503')
+    parser.add_argument('--amazon-latency', type=float, default=0.05)
+    parser.add_argument('--wordpress-latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = start_services(args.port, llm_latency=args.llm_latency, tokens_per_second=args.tokens_per_second,
+                            article_words=args.article_words, llm_error_rate=args.llm_error_rate,
+                            amazon_latency=args.amazon_latency, wordpress_latency=args.wordpress_latency)
+    base = f'http://127.0.0.1:{server.server_port}'
+    print(f"Servicios simulados en {base}", flush=True)
+    print(f"  GEMINI_API_BASE={base}\n  OLLAMA_API_URL={base}\n  WORDPRESS_API_URL={base}/wp-json/wp/v2", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Genera un corpus de páginas de producto con la estructura de Amazon
+Sirve cuando no hay páginas reales guardadas en benchmarks/fixtures/pages/
+
+Uso:
+    python benchmarks/fixtures/generate_pages.py [--count 5] [--size-kb 1200]
+"""
+
+import argparse
+import json
+import os
+import random
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+PRODUCTS = [
+    ('B08N5WRWNW', 'Echo Dot (4.ª generación) | Altavoz inteligente con Alexa', '49,99 €',
+     'Electrónica › Hogar digital › Altavoces inteligentes', 'amazon.es'),
+    ('B09G9FPHY6', 'Apple iPhone 13 (128 GB) - Azul', '$699.00',
+     'Electronics › Cell Phones & Accessories › Cell Phones', 'amazon.com'),
+    ('B00FLYWNYQ', 'Instant Pot Duo 7-in-1 Electric Pressure Cooker, 6 Quart', '$89.95',
+     'Home & Kitchen › Kitchen & Dining › Small Appliances', 'amazon.com'),
+    ('B08KTZ8249', 'Kindle Paperwhite – Now Waterproof with 2x the Storage', '$139.99',
+     'Kindle Store › Kindle E-readers', 'amazon.com'),
+    ('B07ZPKBL9V', 'Levi\'s Men\'s 505 Regular Fit Jeans', '$39.50',
+     'Clothing, Shoes & Jewelry › Men › Clothing › Jeans', 'amazon.com'),
+]
+
+
+def _carousel(rng: random.Random, index: int) -> str:
+    """Bloque de productos relacionados, la parte más voluminosa de la página"""
+    cards = []
+    for card in range(12):
+        asin = f'B0{rng.randrange(10 ** 8):08d}'
+        cards.append(
+            f'<li class="a-carousel-card"><div class="a-section" data-asin="{asin}">'
+            f'<a class="a-link-normal" href="/dp/{asin}"><img class="a-dynamic-image" '
+            f'src="https://m.media-amazon.com/images/I/{asin}.jpg" data-a-dynamic-image="{{}}"/>'
+            f'<span class="a-size-base a-color-base">Producto relacionado {index}-{card}</span></a>'
+            f'<span class="a-icon-alt">{rng.randint(30, 50) / 10} out of 5 stars</span>'
+            f'<span class="a-size-base">{rng.randint(10, 90000):,}</span>'
+            f'<span class="a-price"><span class="a-offscreen">${rng.randint(5, 500)}.99</span></span>'
+            f'</div></li>'
+        )
+    return (f'<div class="a-carousel-container" id="sims-{index}"><h2 class="a-carousel-heading">'
+            f'Clientes que vieron este producto también vieron</h2><ol class="a-carousel">'
+            f'{"".join(cards)}</ol></div>')
+
+
+def _inline_state(rng: random.Random, size: int) -> str:
+    """Bloque JSON embebido como los que Amazon incluye en <script>"""
+    state = {'twister': [{'asin': f'B0{rng.randrange(10 ** 8):08d}', 'dimensions': ['color', 'size'],
+                          'price': rng.randint(100, 99999)} for _ in range(size)]}
+    return f'<script type="a-state" data-a-state=\'{{"key":"twister"}}\'>{json.dumps(state)}</script>'
+
+
+def generate_page(asin: str, title: str, price: str, breadcrumb: str, marketplace: str,
+                  size_kb: int = 1200, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    features = ''.join(
+        f'<li><span class="a-list-item"> Característica {i + 1} de {title[:30]}: '
+        f'diseño cuidado, materiales resistentes y uso sencillo en el día a día. </span></li>'
+        for i in range(rng.randint(5, 8))
+    )
+    crumbs = ''.join(f'<li><span class="a-list-item"><a class="a-link-normal a-color-tertiary" href="#">'
+                     f' {crumb.strip()} </a></span></li>' for crumb in breadcrumb.split('›'))
+    whole, _, fraction = price.strip('$€ ').replace(',', '.').partition('.')
+
+    head = (f'<!doctype html><html lang="es"><head><meta charset="utf-8"><title>{title}</title>'
+            f'<link rel="canonical" href="https://www.{marketplace}/dp/{asin}">'
+            f'{_inline_state(rng, 200)}</head><body>')
+    nav = ('<header id="navbar"><div id="nav-main">'
+           + ''.join(f'<a class="nav-a" href="/b/{i}">Departamento {i}</a>' for i in range(150))
+           + '</div></header>')
+    product = f'''
+<div id="dp" class="electronics es_ES"><div id="dp-container" class="a-container">
+<div id="wayfinding-breadcrumbs_feature_div"><ul class="a-unordered-list a-horizontal a-size-small">{crumbs}</ul></div>
+<div id="ppd">
+<div id="leftCol"><div id="imgTagWrapperId" class="imgTagWrapper">
+<img id="landingImage" class="a-dynamic-image" src="https://m.media-amazon.com/images/I/{asin}._AC_SL1500_.jpg" data-old-hires="">
+</div></div>
+<div id="centerCol">
+<div id="titleSection"><h1 id="title" class="a-size-large a-spacing-none"><span id="productTitle" class="a-size-large product-title-word-break">        {title}       </span></h1></div>
+<div id="averageCustomerReviews"><span class="a-icon-alt">{rng.randint(38, 49) / 10} out of 5 stars</span>
+<a id="acrCustomerReviewLink" class="a-link-normal"><span id="acrCustomerReviewText" class="a-size-base">{rng.randint(100, 90000):,} ratings</span></a></div>
+<div id="corePrice_feature_div"><span class="a-price aok-align-center"><span class="a-offscreen">{price}</span>
+<span aria-hidden="true"><span class="a-price-symbol">$</span><span class="a-price-whole">{whole}<span class="a-price-decimal">.</span></span><span class="a-price-fraction">{fraction or '00'}</span></span></span></div>
+<div id="feature-bullets" class="a-section a-spacing-medium a-spacing-top-small"><ul class="a-unordered-list a-vertical a-spacing-mini">{features}</ul></div>
+</div>
+<div id="rightCol"><div id="availability" class="a-section a-spacing-base"><span class="a-size-medium a-color-success"> En stock </span></div></div>
+</div>
+<div id="productDescription_feature_div"><div id="productDescription" class="a-section a-spacing-small"><p><span>{title}. Descripción completa del producto con información de uso, contenido de la caja y garantía del fabricante.</span></p></div></div>
+'''
+    parts = [head, nav, product]
+    index = 0
+    while sum(len(part) for part in parts) < size_kb * 1024:
+        parts.append(_carousel(rng, index))
+        if index % 5 == 0:
+            parts.append(_inline_state(rng, 60))
+        index += 1
+    parts.append('</div></div><footer id="navFooter"></footer></body></html>')
+    return ''.join(parts)
+
+
+def generate_corpus(directory: str = PAGES_DIR, count: int = len(PRODUCTS), size_kb: int = 1200) -> list:
+    """Escribe `count` páginas en `directory` y devuelve sus rutas"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(count):
+        asin, title, price, breadcrumb, marketplace = PRODUCTS[index % len(PRODUCTS)]
+        html = generate_page(asin, title, price, breadcrumb, marketplace, size_kb=size_kb, seed=index)
+        path = os.path.join(directory, f'{asin}-{index}.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Genera páginas de producto sintéticas')
+    parser.add_argument('--count', type=int, default=len(PRODUCTS))
+    parser.add_argument('--size-kb', type=int, default=1200)
+    parser.add_argument('--output', default=PAGES_DIR)
+    args = parser.parse_args()
+
+    for path in generate_corpus(args.output, args.count, args.size_kb):
+        print(path)
@@ -0,0 +1,366 @@
+"""
+Servidor local con todos los endpoints de vercel.json, para pruebas de carga
+
+Carga los handlers de api/ tal como los despliega Vercel y enruta por
+prefijo, igual que las rewrites de vercel.json:
+
+    /api/generate-article-free[/stream]  app FastAPI (uvicorn en otro puerto, con proxy)
+    /api/generate-article                función handler(request)
+    /api/scrape-amazon, /api/webhook,    clases BaseHTTPRequestHandler
+    /api/jobs[/{id}], /api/health,
+    /api/profiles[/{id}]
+    /api/metrics                         solo aquí: en Vercel no se despliega
+
+Las dependencias externas van a benchmarks/fake_services.py, que se arranca
+en un subproceso: Gemini y Ollama apuntan a sus URLs, las peticiones a
+www.amazon.* de la sesión compartida se redirigen a sus páginas de fixtures/
+y WordPress usa su API REST simulada. El SDK de Gemini (google-generativeai)
+no permite apuntar su transporte asíncrono a un servidor local, así que se
+sustituye GenerativeModel por un cliente REST mínimo antes de cargar los
+handlers.
+
+Por defecto se quitan los límites de Gemini y de frecuencia por host para
+medir el código y no la cuota; con --keep-rate-limits se mantienen.
+
+Uso:
+    python benchmarks/local_server.py [--port 8780] [--llm-latency 0.3] [--amazon-latency 0.05]
+    locust -f benchmarks/locustfile.py --host http://127.0.0.1:8780
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCH_DIR, '..', 'api')
+sys.path.append(os.path.join(BENCH_DIR, '..', 'scripts'))
+
+from bench_pipeline import configure_environment, start_fake_services
+
+AMAZON_HOSTS = ('www.amazon.com', 'www.amazon.es', 'www.amazon.co.uk', 'www.amazon.de', 'www.amazon.fr',
+                'www.amazon.it')
+
+# Prefijos en el orden de vercel.json: generate-article-free antes que generate-article
+ROUTES = (
+    ('/api/generate-article-free', 'generate-article-free'),
+    ('/api/generate-article', 'generate-article'),
+    ('/api/scrape-amazon', 'scrape-amazon'),
+    ('/api/jobs', 'jobs'),
+    ('/api/webhook', 'webhook'),
+    ('/api/health', 'health'),
+    ('/api/metrics', 'metrics'),
+    ('/api/profiles', 'profiles'),
+)
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class RestGenerativeModel:
+    """
+    Sustituto de genai.GenerativeModel que llama a generateContent por REST
+    en GEMINI_API_BASE, con los clientes HTTP compartidos de http_pool
+    """
+
+    def __init__(self, model_name: str, **kwargs):
+        self.model_name = model_name.split('/')[-1]
+
+    def _url(self) -> str:
+        base = os.environ['GEMINI_API_BASE'].rstrip('/')
+        return f'{base}/v1beta/models/{self.model_name}:generateContent'
+
+    @staticmethod
+    def _payload(prompt) -> dict:
+        return {'contents': [{'parts': [{'text': prompt if isinstance(prompt, str) else str(prompt)}]}]}
+
+    @staticmethod
+    def _text(data: dict) -> str:
+        return ''.join(part.get('text', '') for part in data['candidates'][0]['content']['parts'])
+
+    def generate_content(self, prompt, **kwargs) -> _Response:
+        from http_pool import get_session
+
+        response = get_session().post(self._url(), json=self._payload(prompt), timeout=120)
+        response.raise_for_status()
+        return _Response(self._text(response.json()))
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        from http_pool import get_async_client
+
+        if stream:
+            return self._stream(prompt)
+        response = await get_async_client().post(self._url(), json=self._payload(prompt), timeout=120)
+        response.raise_for_status()
+        return _Response(self._text(response.json()))
+
+    async def _stream(self, prompt):
+        """Como la respuesta con stream=True del SDK: fragmentos con .text (streamGenerateContent)"""
+        from http_pool import get_async_client
+
+        url = self._url().replace(':generateContent', ':streamGenerateContent') + '?alt=sse'
+        async with get_async_client().stream('POST', url, json=self._payload(prompt), timeout=120) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith('data:'):
+                    yield _Response(self._text(json.loads(line[5:])))
+
+
+class RedirectAdapter(HTTPAdapter):
+    """Adaptador de requests que envía las peticiones a `base` conservando ruta y query"""
+
+    def __init__(self, base: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base = base.rstrip('/')
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = self.base + parts.path + (f'?{parts.query}' if parts.query else '')
+        return super().send(request, **kwargs)
+
+
+def install_stubs(base: str):
+    """Redirige Amazon a los servicios simulados y sustituye el modelo del SDK de Gemini"""
+    import google.generativeai as genai
+    from http_pool import get_session
+
+    genai.GenerativeModel = RestGenerativeModel
+
+    session = get_session()
+    adapter = RedirectAdapter(base, pool_connections=1, pool_maxsize=64)
+    for host in AMAZON_HOSTS:
+        session.mount(f'https://{host}', adapter)
+
+
+def load_api(name: str):
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(API_DIR, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _FunctionRequest:
+    """Lo mínimo que usa handler(request) de api/generate-article.py"""
+
+    def __init__(self, body: bytes, headers):
+        self.body = body
+        self.headers = headers
+
+    def get_json(self):
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+class LocalAPIHandler(BaseHTTPRequestHandler):
+    """
+    Enruta cada petición al handler de api/ correspondiente.
+
+    Los handlers que son clases BaseHTTPRequestHandler atienden la petición
+    directamente: tras leer la línea de petición se cambia la clase de la
+    instancia a la del handler. Cada conexión atiende una sola petición,
+    como una invocación de Vercel.
+    """
+
+    handlers = {}
+    fastapi_base = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        self.close_connection = True
+
+        path = urlsplit(self.path).path
+        name = next((name for prefix, name in ROUTES if path.startswith(prefix)), None)
+        target = self.handlers.get(name)
+        if isinstance(target, type):
+            self.__class__ = target
+        elif name is None:
+            self.__class__ = _NotFoundHandler
+        return True
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _write(self, status: int, body: bytes, headers):
+        self.send_response(status)
+        for key, value in headers.items():
+            if key.lower() not in ('content-length', 'transfer-encoding', 'connection'):
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path.startswith('/api/generate-article-free'):
+            self._proxy_fastapi(path)
+            return
+
+        body, status, headers = self.handlers['generate-article'].handler(
+            _FunctionRequest(self._read_body(), self.headers)
+        )
+        self._write(status, body.encode('utf-8') if isinstance(body, str) else body, headers)
+
+    def _proxy_fastapi(self, path: str):
+        """Reenvía a la app FastAPI; los server-sent events se transmiten según llegan"""
+        try:
+            response = self.handlers['generate-article-free'].post(
+                self.fastapi_base + path, data=self._read_body(),
+                headers={key: value for key, value in (
+                    ('Content-Type', self.headers.get('Content-Type', 'application/json')),
+                    ('X-Profile', self.headers.get('X-Profile')),
+                ) if value},
+                stream=True, timeout=300
+            )
+        except requests.exceptions.RequestException as e:
+            self._write(502, json.dumps({'error': str(e)}).encode('utf-8'), {'Content-Type': 'application/json'})
+            return
+
+        with response:
+            self.send_response(response.status_code)
+            for key, value in response.headers.items():
+                if key.lower() not in ('content-length', 'transfer-encoding', 'connection', 'date', 'server'):
+                    self.send_header(key, value)
+            self.end_headers()
+            for chunk in response.iter_content(chunk_size=None):
+                self.wfile.write(chunk)
+                self.wfile.flush()
+
+
+class _NotFoundHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _not_found(self):
+        body = json.dumps({'error': f'Ruta no encontrada: {self.path}'}).encode('utf-8')
+        self.send_response(404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_OPTIONS = _not_found
+
+
+class LocalServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Las ráfagas de la prueba de carga desbordan la cola de listen por defecto (5)
+    request_queue_size = 1024
+
+
+def start_fastapi(app, port: int) -> str:
+    """Arranca la app de generate-article-free con uvicorn en un hilo"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError('uvicorn no arrancó')
+        time.sleep(0.05)
+    return base
+
+
+def configure_local_environment(base: str, workdir: str, keep_rate_limits: bool):
+    """Entorno de los handlers: servicios simulados, ficheros temporales y credenciales ficticias"""
+    configure_environment(base, 'gemini', workdir)
+    os.environ.update({
+        'GEMINI_API_KEY': 'loadtest',
+        'PAGE_CACHE_PATH': os.path.join(workdir, 'page_cache.sqlite3'),
+        'LLM_CACHE_PATH': os.path.join(workdir, 'llm_cache.sqlite3'),
+        'JOB_QUEUE_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+        'RATE_LIMIT_DB': os.path.join(workdir, 'rate_limits.sqlite3'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        # Para que /api/health responda 200
+        'OPENAI_API_KEY': 'loadtest',
+        'GOOGLE_SHEETS_API_KEY': 'loadtest',
+        'MAKE_WEBHOOK_URL': f'{base}/make',
+    })
+    if keep_rate_limits:
+        for name in ('GEMINI_RPM_LIMIT', 'GEMINI_TPM_LIMIT', 'GEMINI_BURST'):
+            os.environ.pop(name, None)
+        os.environ['RATE_LIMIT_STORE'] = 'sqlite'
+    else:
+        os.environ['SCRAPER_REQUESTS_PER_SECOND'] = '1000000'
+
+
+def start_local_server(port: int, fake_base: str, fastapi_port: int) -> ThreadingHTTPServer:
+    install_stubs(fake_base)
+
+    handlers = {}
+    for name in ('scrape-amazon', 'webhook', 'jobs', 'health', 'metrics', 'profiles'):
+        module = load_api(name)
+        module.handler.log_message = lambda *a: None
+        handlers[name] = module.handler
+    handlers['generate-article'] = load_api('generate-article')
+
+    proxy = requests.Session()
+    proxy.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=256))
+    handlers['generate-article-free'] = proxy
+    fastapi_base = start_fastapi(load_api('generate-article-free').app, fastapi_port)
+
+    handler = type('Handler', (LocalAPIHandler,), {'handlers': handlers, 'fastapi_base': fastapi_base})
+    server = LocalServer(('127.0.0.1', port), handler)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Endpoints de vercel.json en local con servicios simulados')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--fake-port', type=int, default=8790)
+    parser.add_argument('--fastapi-port', type=int, default=8781)
+    parser.add_argument('--llm-latency', type=float, default=0.3)
+    parser.add_argument('--tokens-per-second', type=float, default=200)
+    parser.add_argument('--article-words', type=int, default=800)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--amazon-latency', type=float, default=0.05)
+    parser.add_argument('--keep-rate-limits', action='store_true',
+                        help='Mantener los límites de Gemini y de frecuencia por host')
+    args = parser.parse_args()
+    # Una línea por petición de httpx ahogaría la salida con carga
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    process, fake_base = start_fake_services(Namespace(
+        port=args.fake_port, llm_latency=args.llm_latency, tokens_per_second=args.tokens_per_second,
+        article_words=args.article_words, llm_error_rate=args.llm_error_rate, amazon_latency=args.amazon_latency
+    ))
+    # Con SIGTERM también se para el subproceso de los servicios simulados
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    configure_local_environment(fake_base, tempfile.mkdtemp(prefix='local_server_'), args.keep_rate_limits)
+
+    try:
+        server = start_local_server(args.port, fake_base, args.fastapi_port)
+        print(f"Endpoints de vercel.json en http://127.0.0.1:{server.server_port} "
+              f"(servicios simulados en {fake_base})", flush=True)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
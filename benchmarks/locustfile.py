@@ -0,0 +1,348 @@
+"""
+Escenarios de carga de locust para los endpoints de vercel.json
+
+Reproducen el tráfico de Make.com contra benchmarks/local_server.py (Amazon,
+Gemini y WordPress simulados):
+
+    MakeWebhookUser   ráfagas de 5-20 webhooks process_article en paralelo,
+                      algún reintento de una fila ya enviada y lotes process_batch
+    BatchScrapeUser   lotes de 10-50 URLs, productos sueltos y modo refresh
+    ArticleUser       generate-article, generate-article-free y su variante en streaming
+    MonitorUser       /api/health y /api/jobs
+
+StepLoadShape sube los usuarios por escalones y, al terminar, imprime y
+guarda (LOCUST_REPORT) por escalón el throughput, la latencia p50/p95, la
+tasa de errores por endpoint y el primer escalón saturado: errores por
+encima de LOCUST_MAX_ERROR_RATE, p95 mayor que LOCUST_MAX_P95_FACTOR veces
+el del primer escalón o un throughput que crece menos de la mitad que los
+usuarios.
+
+Uso:
+    python benchmarks/local_server.py --port 8780 &
+    locust -f benchmarks/locustfile.py --headless --host http://127.0.0.1:8780
+
+    LOCUST_STEP_USERS=10 LOCUST_STEP_TIME=30 LOCUST_MAX_USERS=100 \\
+    LOCUST_REPORT=carga.json locust -f benchmarks/locustfile.py --headless --host ...
+"""
+
+import json
+import os
+import random
+import string
+import uuid
+
+from gevent.pool import Pool
+from locust import HttpUser, LoadTestShape, between, events, task
+
+STEP_USERS = int(os.getenv('LOCUST_STEP_USERS', '10'))
+STEP_TIME = float(os.getenv('LOCUST_STEP_TIME', '30'))
+MAX_USERS = int(os.getenv('LOCUST_MAX_USERS', '100'))
+REPORT_PATH = os.getenv('LOCUST_REPORT', 'locust_report.json')
+MAX_ERROR_RATE = float(os.getenv('LOCUST_MAX_ERROR_RATE', '0.01'))
+MAX_P95_FACTOR = float(os.getenv('LOCUST_MAX_P95_FACTOR', '2'))
+# Catálogo de ASINs: con un catálogo pequeño se repiten productos (caché de páginas y single-flight)
+ASIN_POOL_SIZE = int(os.getenv('LOCUST_ASIN_POOL', '2000'))
+MARKETPLACES = ('www.amazon.com', 'www.amazon.es', 'www.amazon.de')
+
+_ASINS = ['B0' + ''.join(random.Random(index).choices(string.ascii_uppercase + string.digits, k=8))
+          for index in range(ASIN_POOL_SIZE)]
+
+
+def fail(response, reason: str = ''):
+    """Marca el fallo con el error de conexión si no hubo respuesta HTTP"""
+    response.failure(response.error or reason or f'HTTP {response.status_code}')
+
+
+def product_url() -> str:
+    return f'https://{random.choice(MARKETPLACES)}/dp/{random.choice(_ASINS)}'
+
+
+def article_row(sheet_id: str, row_number: int) -> dict:
+    url = product_url()
+    return {
+        'product_url': url,
+        'affiliate_link': f'https://amzn.to/{url.rsplit("/", 1)[-1].lower()}',
+        'row_number': row_number,
+        'sheet_id': sheet_id,
+    }
+
+
+class MakeWebhookUser(HttpUser):
+    """
+    Un escenario de Make.com: lee filas nuevas de la hoja y lanza un webhook
+    por fila, varias a la vez; si una petición vence su timeout, Make la
+    reintenta con el mismo cuerpo
+    """
+
+    weight = 4
+    wait_time = between(2, 8)
+    burst_size = (5, 20)
+    burst_parallelism = 5
+    retry_rate = 0.05
+
+    def on_start(self):
+        self.sheet_id = f'hoja-{uuid.uuid4().hex[:8]}'
+        self.next_row = 2
+        self.sent = []
+
+    def _post_article(self, row: dict, retry: bool = False):
+        name = '/api/webhook [reintento]' if retry else '/api/webhook [process_article]'
+        with self.client.post('/api/webhook', json=dict(row, event_type='process_article'),
+                              name=name, catch_response=True) as response:
+            # Un reintento de una fila aún en curso recibe 409: es la respuesta esperada
+            if response.status_code == 409 and retry:
+                response.success()
+            elif response.status_code != 200 or not response.json().get('success'):
+                fail(response)
+
+    @task(5)
+    def process_article_burst(self):
+        rows = []
+        for _ in range(random.randint(*self.burst_size)):
+            rows.append(article_row(self.sheet_id, self.next_row))
+            self.next_row += 1
+
+        pool = Pool(self.burst_parallelism)
+        for row in rows:
+            pool.spawn(self._post_article, row)
+            if self.sent and random.random() < self.retry_rate:
+                pool.spawn(self._post_article, random.choice(self.sent), True)
+        pool.join()
+        self.sent = (self.sent + rows)[-50:]
+
+    @task(1)
+    def process_batch(self):
+        rows = [article_row(self.sheet_id, self.next_row + index) for index in range(random.randint(10, 30))]
+        self.next_row += len(rows)
+        with self.client.post('/api/webhook', json={
+            'event_type': 'process_batch',
+            'sheet_id': self.sheet_id,
+            'rows': rows,
+        }, name='/api/webhook [process_batch]', catch_response=True) as response:
+            if response.status_code != 200 or response.json().get('failed'):
+                fail(response)
+
+
+class BatchScrapeUser(HttpUser):
+    """Escenarios que actualizan el catálogo: lotes de URLs y comprobación de cambios"""
+
+    weight = 2
+    wait_time = between(5, 15)
+
+    def _scrape(self, payload: dict, name: str):
+        with self.client.post('/api/scrape-amazon', json=payload, name=name, catch_response=True) as response:
+            if response.status_code != 200:
+                fail(response)
+                return
+            body = response.json()
+            if 'results' in body and body['succeeded'] < body['total']:
+                fail(response, f"{body['total'] - body['succeeded']} de {body['total']} URLs fallaron")
+            elif 'results' not in body and not body.get('success'):
+                fail(response, body.get('error', 'scraping fallido'))
+
+    @task(3)
+    def scrape_batch(self):
+        urls = [product_url() for _ in range(random.randint(10, 50))]
+        self._scrape({'urls': urls}, '/api/scrape-amazon [lote]')
+
+    @task(2)
+    def scrape_single(self):
+        self._scrape({'url': product_url()}, '/api/scrape-amazon')
+
+    @task(1)
+    def refresh_batch(self):
+        urls = [product_url() for _ in range(random.randint(10, 30))]
+        self._scrape({'urls': urls, 'mode': 'refresh'}, '/api/scrape-amazon [refresh]')
+
+
+class ArticleUser(HttpUser):
+    """Generación directa de artículos (pruebas manuales y la extensión del navegador)"""
+
+    weight = 1
+    wait_time = between(10, 30)
+
+    def _payload(self) -> dict:
+        row = article_row('manual', 0)
+        return {'product_url': row['product_url'], 'affiliate_link': row['affiliate_link']}
+
+    @task(2)
+    def generate_article_free(self):
+        with self.client.post('/api/generate-article-free', json=self._payload(),
+                              catch_response=True) as response:
+            if response.status_code != 200 or response.json().get('status') != 'success':
+                fail(response)
+
+    @task(1)
+    def generate_article_free_stream(self):
+        with self.client.post('/api/generate-article-free/stream', json=self._payload(),
+                              stream=True, catch_response=True) as response:
+            if response.status_code != 200:
+                fail(response)
+                return
+            events = [line for line in response.iter_lines(decode_unicode=True) if line.startswith('event:')]
+            if not events or events[-1] != 'event: done':
+                fail(response, f"HTTP {response.status_code}, último evento: {events[-1] if events else '-'}")
+
+    @task(2)
+    def generate_article(self):
+        with self.client.post('/api/generate-article', json=self._payload(), catch_response=True) as response:
+            if response.status_code != 200 or not response.json().get('success'):
+                fail(response)
+
+
+class MonitorUser(HttpUser):
+    """Comprobaciones de estado de Make.com y del monitor externo"""
+
+    weight = 1
+    wait_time = between(5, 10)
+
+    @task(2)
+    def health(self):
+        self.client.get('/api/health')
+
+    @task(1)
+    def jobs(self):
+        self.client.get('/api/jobs')
+        with self.client.get(f'/api/jobs/{uuid.uuid4().hex}', name='/api/jobs/[id]',
+                             catch_response=True) as response:
+            if response.status_code == 404:
+                response.success()
+
+
+def _snapshot(entry) -> dict:
+    return {
+        'requests': entry.num_requests,
+        'failures': entry.num_failures,
+        'response_times': dict(entry.response_times),
+    }
+
+
+def _percentile(histogram: dict, pct: float) -> float:
+    total = sum(histogram.values())
+    if not total:
+        return 0.0
+    threshold = total * pct / 100
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen >= threshold:
+            return float(value)
+    return float(max(histogram))
+
+
+def _diff(current: dict, previous: dict, duration: float) -> dict:
+    previous = previous or {'requests': 0, 'failures': 0, 'response_times': {}}
+    requests = current['requests'] - previous['requests']
+    failures = current['failures'] - previous['failures']
+    histogram = {value: count - previous['response_times'].get(value, 0)
+                 for value, count in current['response_times'].items()}
+    histogram = {value: count for value, count in histogram.items() if count > 0}
+    return {
+        'requests': requests,
+        'failures': failures,
+        'rps': requests / duration if duration else 0.0,
+        'error_rate': failures / requests if requests else 0.0,
+        'p50_ms': _percentile(histogram, 50),
+        'p95_ms': _percentile(histogram, 95),
+    }
+
+
+class StepLoadShape(LoadTestShape):
+    """
+    Sube LOCUST_STEP_USERS usuarios cada LOCUST_STEP_TIME segundos hasta
+    LOCUST_MAX_USERS y guarda las estadísticas de cada escalón
+    """
+
+    steps = []
+
+    def __init__(self):
+        super().__init__()
+        self.step_index = 0
+        self.step_started = 0.0
+        self.previous = None
+
+    def tick(self):
+        run_time = self.get_run_time()
+        step = int(run_time // STEP_TIME)
+        if step != self.step_index:
+            self._close_step(run_time)
+            self.step_index = step
+
+        users = (step + 1) * STEP_USERS
+        if users > MAX_USERS:
+            return None
+        return users, STEP_USERS
+
+    def _close_step(self, run_time: float):
+        stats = self.runner.stats
+        current = {'total': _snapshot(stats.total)}
+        current.update({f'{method} {name}': _snapshot(entry) for (name, method), entry in stats.entries.items()})
+        previous = self.previous or {}
+        duration = run_time - self.step_started
+
+        endpoints = {name: _diff(snapshot, previous.get(name), duration) for name, snapshot in current.items()
+                     if name != 'total'}
+        self.steps.append({
+            'users': (self.step_index + 1) * STEP_USERS,
+            **_diff(current['total'], previous.get('total'), duration),
+            'endpoints': {name: data for name, data in endpoints.items() if data['requests']},
+        })
+        self.previous = current
+        self.step_started = run_time
+
+
+def find_saturation(steps: list) -> dict:
+    """Primer escalón en el que el sistema deja de escalar, con el motivo"""
+    baseline = next((step['p95_ms'] for step in steps if step['requests']), 0.0)
+    for previous, step in zip([None] + steps, steps):
+        reasons = []
+        if step['error_rate'] > MAX_ERROR_RATE:
+            reasons.append(f"errores {step['error_rate']:.1%}")
+        if baseline and step['p95_ms'] > baseline * MAX_P95_FACTOR:
+            reasons.append(f"p95 {step['p95_ms']:.0f} ms (base {baseline:.0f} ms)")
+        if previous and previous['rps']:
+            expected = 1 + 0.5 * (step['users'] / previous['users'] - 1)
+            if step['rps'] / previous['rps'] < expected:
+                reasons.append(f"throughput {previous['rps']:.1f} → {step['rps']:.1f} req/s")
+        if reasons:
+            return {'users': step['users'], 'reasons': reasons}
+    return {'users': None, 'reasons': []}
+
+
+@events.quitting.add_listener
+def write_report(environment, **kwargs):
+    shape = environment.shape_class
+    if not isinstance(shape, StepLoadShape):
+        return
+    # El último escalón termina al parar la prueba
+    if (shape.step_index + 1) * STEP_USERS <= MAX_USERS and shape.get_run_time() > shape.step_started:
+        shape._close_step(shape.get_run_time())
+
+    steps = [step for step in shape.steps if step['requests']]
+    saturation = find_saturation(steps)
+
+    print(f"\n{'usuarios':>9}{'req':>8}{'req/s':>9}{'errores':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for step in steps:
+        print(f"{step['users']:>9}{step['requests']:>8}{step['rps']:>9.1f}{step['error_rate']:>9.1%}"
+              f"{step['p50_ms']:>9.0f}{step['p95_ms']:>9.0f}")
+    if saturation['users']:
+        print(f"\nSaturación a {saturation['users']} usuarios: {', '.join(saturation['reasons'])}")
+    else:
+        print('\nSin saturación hasta el último escalón')
+
+    worst = {}
+    for step in steps:
+        for name, data in step['endpoints'].items():
+            if data['error_rate'] > worst.get(name, (0, 0))[1]:
+                worst[name] = (step['users'], data['error_rate'])
+    for name, (users, rate) in sorted(worst.items()):
+        print(f"  {name}: {rate:.1%} de errores con {users} usuarios")
+
+    with open(REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump({
+            'config': {'step_users': STEP_USERS, 'step_time': STEP_TIME, 'max_users': MAX_USERS,
+                       'max_error_rate': MAX_ERROR_RATE, 'max_p95_factor': MAX_P95_FACTOR},
+            'saturation': saturation,
+            'steps': steps,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"Informe guardado en {REPORT_PATH}")
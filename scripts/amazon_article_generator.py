@@ -7,37 +7,64 @@ import asyncio
 import json
 import os
 import sys
+import time
 import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
 
 # Agregar el path de OpenManus
 sys.path.append('/home/ubuntu/OpenManus')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.core.agent import Agent
 from app.core.llm import LLMConfig
 from app.tools.browser import BrowserTool
 
+from article_schema import SCHEMA_INSTRUCTIONS, ArticleValidationError, parse_article
+from category_classifier import DEFAULT_CONFIDENCE_THRESHOLD, classify_product
+from instrumentation import record_llm, traced, tracing
+from llm_cache import get_llm_cache
+from metrics import ARTICLES, FALLBACK_ARTICLES, LLM_DURATION
+from pipeline_dag import PipelineDAG, Stage
+from profiling import profiled
+from single_flight import flight_key, get_single_flight
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Etiqueta del generador y del proveedor en las métricas
+GENERATOR = "openmanus"
+
 class AmazonArticleGenerator:
     """
     Generador de artículos de Amazon usando OpenManus como motor de IA
     """
     
-    def __init__(self, config_path: str = "/home/ubuntu/OpenManus/config/config.toml"):
+    def __init__(self, config_path: str = "/home/ubuntu/OpenManus/config/config.toml",
+                 single_call: Optional[bool] = None):
         """
         Inicializa el generador de artículos
         
         Args:
             config_path: Ruta al archivo de configuración de OpenManus
+            single_call: Generar contenido y SEO en una sola llamada estructurada
+                (por defecto ARTICLE_SINGLE_CALL, activado)
         """
         self.config_path = config_path
         self.agent = None
         self.browser_tool = None
         
+        # Confianza mínima del clasificador local para no consultar al agente
+        self.category_threshold = DEFAULT_CONFIDENCE_THRESHOLD
+        
+        # Respuestas ya generadas para el mismo prompt (None si LLM_CACHE_ENABLED=false)
+        self.cache = get_llm_cache()
+        
+        if single_call is None:
+            single_call = os.getenv("ARTICLE_SINGLE_CALL", "true").lower() == "true"
+        self.single_call = single_call
+        
         # Templates de artículos por categoría
         self.article_templates = {
             "electronics": self._get_electronics_template(),
@@ -76,26 +103,36 @@ class AmazonArticleGenerator:
             
         Returns:
             Dict con el artículo generado y metadatos
+        
+        Las peticiones simultáneas del mismo producto y enlace de afiliado
+        comparten una sola generación; las que esperaron se marcan con
+        "coalesced".
         """
-        try:
-            logger.info(f"Iniciando generación de artículo para: {product_url}")
+        key = flight_key(product_url, "article", affiliate_link, self.single_call)
+        with profiled("generate_article"):
+            if key is None:
+                return await self._generate_article(product_url, affiliate_link)
             
-            # Paso 1: Extraer datos del producto
-            product_data = await self._extract_product_data(product_url)
-            
-            # Paso 2: Determinar categoría del producto
-            category = await self._determine_category(product_data)
-            
-            # Paso 3: Generar contenido del artículo
-            article_content = await self._generate_article_content(
-                product_data, affiliate_link, category
+            result, shared = await get_single_flight("generate_article").do_async(
+                key, self._generate_article, product_url, affiliate_link
             )
+        return dict(result, coalesced=True) if shared else result
+    
+    async def _generate_article(self, product_url: str, affiliate_link: str) -> Dict[str, Any]:
+        # Se cuenta aquí y no en generate_article: las peticiones coalescidas comparten esta generación
+        ARTICLES.inc(GENERATOR)
+        try:
+            logger.info(f"Iniciando generación de artículo para: {product_url}")
             
-            # Paso 4: Optimizar para SEO
-            seo_optimized = await self._optimize_for_seo(article_content, product_data, category)
+            # Las etapas independientes se ejecutan en paralelo
+            with tracing("amazon-article-generator", product_url=product_url) as trace:
+                results, dag_timings = await self._build_pipeline(product_url, affiliate_link).run()
+            timings = dict(trace.as_dict(), dag_stages=dag_timings)
             
-            # Paso 5: Generar metadatos
-            metadata = await self._generate_metadata(product_data, category)
+            product_data = results["product_data"]
+            category = results["category"]
+            seo_optimized = results["seo_optimized"]
+            metadata = results["metadata"]
             
             result = {
                 "success": True,
@@ -104,13 +141,16 @@ class AmazonArticleGenerator:
                     "content": seo_optimized.get("content", ""),
                     "meta_description": seo_optimized.get("meta_description", ""),
                     "keywords": seo_optimized.get("keywords", []),
+                    "alt_texts": seo_optimized.get("alt_texts", []),
                     "category": category,
                     "word_count": len(seo_optimized.get("content", "").split())
                 },
                 "product_data": product_data,
                 "metadata": metadata,
                 "affiliate_link": affiliate_link,
-                "generated_at": datetime.now().isoformat()
+                "generated_at": datetime.now().isoformat(),
+                "timings": timings,
+                "llm_cache": self.cache.stats() if self.cache else None
             }
             
             logger.info("Artículo generado exitosamente")
@@ -125,6 +165,80 @@ class AmazonArticleGenerator:
                 "affiliate_link": affiliate_link
             }
     
+    def _build_pipeline(self, product_url: str, affiliate_link: str) -> PipelineDAG:
+        """
+        Construye el grafo de etapas del artículo
+        
+        Pasos:
+            1. Extraer datos del producto
+            2. Determinar categoría del producto
+            3. Generar contenido del artículo
+            4. Optimizar para SEO
+            5. Generar metadatos (solo depende de 1 y 2, en paralelo con 3 y 4)
+        
+        En modo de llamada única los pasos 3 y 4 se resuelven con una sola
+        respuesta JSON estructurada.
+        """
+        if self.single_call:
+            return PipelineDAG([
+                Stage("product_data", traced("fetch", lambda: self._extract_product_data(product_url))),
+                Stage("category", traced("classify", self._determine_category), ["product_data"]),
+                Stage("seo_optimized",
+                      traced("generate", lambda product_data, category: self._generate_structured_article(
+                          product_data, affiliate_link, category
+                      )),
+                      ["product_data", "category"]),
+                Stage("metadata", self._generate_metadata, ["product_data", "category"]),
+            ])
+        
+        return PipelineDAG([
+            Stage("product_data", traced("fetch", lambda: self._extract_product_data(product_url))),
+            Stage("category", traced("classify", self._determine_category), ["product_data"]),
+            Stage("article_content",
+                  traced("generate", lambda product_data, category: self._generate_article_content(
+                      product_data, affiliate_link, category
+                  )),
+                  ["product_data", "category"]),
+            Stage("seo_optimized",
+                  traced("seo", lambda article_content, product_data, category: self._optimize_for_seo(
+                      article_content, product_data, category
+                  )),
+                  ["article_content", "product_data", "category"]),
+            Stage("metadata", self._generate_metadata, ["product_data", "category"]),
+        ])
+    
+    async def _run_agent(self, prompt: str) -> str:
+        """
+        Ejecuta un prompt con el agente de OpenManus
+        
+        Las respuestas se cachean por prompt normalizado y configuración del
+        agente, así que un paso sin cambios no vuelve a consumir tokens.
+        """
+        config = {"config_path": self.config_path}
+        if self.cache is not None:
+            cached = self.cache.get("openmanus", prompt, config)
+            if cached is not None:
+                record_llm(prompt, cached, cached=True)
+                return cached
+        
+        start = time.perf_counter()
+        try:
+            result = await self.agent.run(prompt)
+        except Exception:
+            LLM_DURATION.observe(time.perf_counter() - start, GENERATOR, "error")
+            raise
+        LLM_DURATION.observe(time.perf_counter() - start, GENERATOR, "success")
+        record_llm(prompt, result if isinstance(result, str) else str(result))
+        
+        if self.cache is not None and isinstance(result, str):
+            self.cache.put("openmanus", prompt, result, config)
+        return result
+    
+    def _forget(self, prompt: str):
+        """Saca de la caché una respuesta que no se ha podido interpretar"""
+        if self.cache is not None:
+            self.cache.delete("openmanus", prompt, {"config_path": self.config_path})
+    
     async def _extract_product_data(self, product_url: str) -> Dict[str, Any]:
         """Extrae datos del producto usando OpenManus"""
         
@@ -174,7 +288,7 @@ class AmazonArticleGenerator:
         """
         
         try:
-            result = await self.agent.run(extraction_prompt)
+            result = await self._run_agent(extraction_prompt)
             
             # Intentar parsear como JSON
             try:
@@ -202,7 +316,16 @@ class AmazonArticleGenerator:
             }
     
     async def _determine_category(self, product_data: Dict[str, Any]) -> str:
-        """Determina la categoría del producto para usar el template apropiado"""
+        """
+        Determina la categoría del producto para usar el template apropiado
+        
+        El clasificador local (breadcrumb, título y características) resuelve
+        la mayoría de productos; el agente solo se consulta si no está seguro.
+        """
+        
+        local_category, confidence = classify_product(product_data)
+        if confidence >= self.category_threshold:
+            return local_category
         
         category_prompt = f"""
         Basándote en la siguiente información del producto, determina su categoría principal:
@@ -223,17 +346,17 @@ class AmazonArticleGenerator:
         """
         
         try:
-            result = await self.agent.run(category_prompt)
+            result = await self._run_agent(category_prompt)
             category = result.strip().lower()
             
             if category in self.article_templates:
                 return category
             else:
-                return "default"
+                return local_category
                 
         except Exception as e:
             logger.error(f"Error al determinar categoría: {e}")
-            return "default"
+            return local_category
     
     async def _generate_article_content(self, product_data: Dict[str, Any], 
                                       affiliate_link: str, category: str) -> str:
@@ -277,13 +400,66 @@ class AmazonArticleGenerator:
         """
         
         try:
-            article_content = await self.agent.run(content_prompt)
+            article_content = await self._run_agent(content_prompt)
             return article_content
             
         except Exception as e:
             logger.error(f"Error al generar contenido del artículo: {e}")
             return self._generate_fallback_article(product_data, affiliate_link)
     
+    async def _generate_structured_article(self, product_data: Dict[str, Any],
+                                         affiliate_link: str, category: str) -> Dict[str, Any]:
+        """
+        Genera el artículo y su optimización SEO en una sola llamada
+        
+        La respuesta se valida contra el esquema del artículo; si no lo cumple
+        se recurre a las dos llamadas (contenido + optimización SEO).
+        """
+        
+        template = self.article_templates.get(category, self.article_templates["default"])
+        keywords = self.seo_keywords.get(category, self.seo_keywords["default"])
+        
+        article_prompt = f"""
+        Crea un artículo de blog completo, atractivo y optimizado para SEO sobre el siguiente producto de Amazon.
+        
+        INFORMACIÓN DEL PRODUCTO:
+        {json.dumps(product_data, indent=2, ensure_ascii=False)}
+        
+        ENLACE DE AFILIADO: {affiliate_link}
+        
+        TEMPLATE A SEGUIR:
+        {template}
+        
+        PALABRAS CLAVE OBJETIVO: {', '.join(keywords)}
+        
+        INSTRUCCIONES ESPECÍFICAS:
+        1. El artículo debe tener entre 1500-2000 palabras
+        2. Usa un tono profesional pero accesible
+        3. Incluye el enlace de afiliado de forma natural (mínimo 3 veces)
+        4. Encabezados H1, H2 y H3 optimizados con las palabras clave
+        5. Incluye pros y contras del producto
+        6. Añade una llamada a la acción convincente
+        7. Usa formato HTML semántico
+        8. Densidad de palabras clave del 2-3%
+        9. Alt text para cada imagen del producto
+        10. Mantén un enfoque honesto y útil para el lector
+        
+        {SCHEMA_INSTRUCTIONS}
+        """
+        
+        try:
+            result = await self._run_agent(article_prompt)
+            return parse_article(result)
+            
+        except ArticleValidationError as e:
+            logger.warning(f"Respuesta estructurada no válida ({e}), usando dos llamadas")
+            self._forget(article_prompt)
+        except Exception as e:
+            logger.error(f"Error al generar artículo estructurado: {e}")
+        
+        content = await self._generate_article_content(product_data, affiliate_link, category)
+        return await self._optimize_for_seo(content, product_data, category)
+    
     async def _optimize_for_seo(self, content: str, product_data: Dict[str, Any], 
                               category: str) -> Dict[str, Any]:
         """Optimiza el artículo para SEO"""
@@ -325,12 +501,13 @@ class AmazonArticleGenerator:
         """
         
         try:
-            result = await self.agent.run(seo_prompt)
+            result = await self._run_agent(seo_prompt)
             
             try:
                 seo_data = json.loads(result)
             except json.JSONDecodeError:
                 # Fallback si no es JSON válido
+                self._forget(seo_prompt)
                 seo_data = {
                     "title": product_data.get('title', 'Producto Amazon')[:60],
                     "meta_description": f"Análisis completo de {product_data.get('title', 'este producto')}. Características, precio y opiniones."[:160],
@@ -565,6 +742,7 @@ class AmazonArticleGenerator:
     
     def _generate_fallback_article(self, product_data: Dict[str, Any], affiliate_link: str) -> str:
         """Genera un artículo básico como fallback"""
+        FALLBACK_ARTICLES.inc(GENERATOR)
         title = product_data.get('title', 'Producto de Amazon')
         
         return f"""
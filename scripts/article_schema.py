@@ -0,0 +1,105 @@
+"""
+Esquema del artículo estructurado que devuelve la IA en una sola llamada
+Construye las instrucciones de formato y valida la respuesta JSON
+"""
+
+import json
+import re
+from typing import Any, Dict, List
+
+# Campo -> (tipo, obligatorio, longitud máxima)
+ARTICLE_SCHEMA = {
+    'title': (str, True, 60),
+    'meta_description': (str, True, 160),
+    'keywords': (list, True, None),
+    'content': (str, True, None),
+    'alt_texts': (list, False, None),
+    'seo_score': ((str, int, float), False, None),
+}
+
+SCHEMA_INSTRUCTIONS = """
+Responde ÚNICAMENTE con un objeto JSON válido, sin texto adicional ni bloques de código, con esta estructura:
+{
+    "title": "título SEO del artículo (máximo 60 caracteres)",
+    "meta_description": "meta descripción atractiva (máximo 160 caracteres)",
+    "keywords": ["palabra clave principal", "secundaria 1", "secundaria 2"],
+    "content": "artículo completo en HTML semántico, ya optimizado para SEO",
+    "alt_texts": ["alt text de la imagen 1", "alt text de la imagen 2"],
+    "seo_score": "puntuación estimada del 1-10"
+}
+"""
+
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$', re.IGNORECASE)
+
+
+class ArticleValidationError(ValueError):
+    """La respuesta de la IA no cumple el esquema del artículo"""
+
+
+def extract_json(text: str) -> Dict[str, Any]:
+    """
+    Parsea el objeto JSON de la respuesta, tolerando bloques ```json y
+    texto alrededor del objeto.
+    """
+    text = _FENCE_RE.sub('', (text or '').strip())
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find('{'), text.rfind('}')
+        if start == -1 or end <= start:
+            raise ArticleValidationError("La respuesta no contiene un objeto JSON")
+        try:
+            data = json.loads(text[start:end + 1])
+        except json.JSONDecodeError as e:
+            raise ArticleValidationError(f"JSON inválido: {e}")
+
+    if not isinstance(data, dict):
+        raise ArticleValidationError("La respuesta JSON no es un objeto")
+    return data
+
+
+def validate_article(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Comprueba tipos y campos obligatorios y normaliza el artículo.
+
+    Los textos demasiado largos se recortan en lugar de rechazarse, y las
+    listas se limpian de valores vacíos.
+
+    Raises:
+        ArticleValidationError: si falta un campo obligatorio o tiene otro tipo
+    """
+    errors: List[str] = []
+    article: Dict[str, Any] = {}
+
+    for field, (expected, required, max_length) in ARTICLE_SCHEMA.items():
+        value = data.get(field)
+        if value is None or value == '' or value == []:
+            if required:
+                errors.append(f"falta el campo '{field}'")
+            continue
+        if not isinstance(value, expected):
+            errors.append(f"el campo '{field}' tiene un tipo no válido")
+            continue
+
+        if isinstance(value, str):
+            value = value.strip()
+            if max_length:
+                value = value[:max_length]
+        elif isinstance(value, list):
+            value = [str(item).strip() for item in value if str(item).strip()]
+            if required and not value:
+                errors.append(f"el campo '{field}' está vacío")
+                continue
+        article[field] = value
+
+    if errors:
+        raise ArticleValidationError('; '.join(errors))
+
+    article.setdefault('alt_texts', [])
+    article['seo_score'] = str(article.get('seo_score', ''))
+    return article
+
+
+def parse_article(text: str) -> Dict[str, Any]:
+    """Parsea y valida la respuesta de la llamada única"""
+    return validate_article(extract_json(text))
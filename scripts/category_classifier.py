@@ -0,0 +1,158 @@
+"""
+Clasificador local de categorías de producto
+Asigna una de las categorías de los templates a partir del breadcrumb, el
+título y las características, sin llamar al modelo de IA
+"""
+
+import os
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CATEGORIES = ('electronics', 'home', 'fashion', 'books', 'default')
+
+# Por debajo de este umbral el llamador debe consultar al modelo de IA
+DEFAULT_CONFIDENCE_THRESHOLD = float(os.getenv('CATEGORY_CONFIDENCE_THRESHOLD', '0.6'))
+
+# Peso de cada fuente de texto: el breadcrumb de Amazon es la señal más
+# fiable, las características son las que más ruido traen
+SOURCE_WEIGHTS = {
+    'breadcrumb_root': 6.0,
+    'breadcrumb': 3.0,
+    'title': 2.0,
+    'features': 0.5,
+}
+
+# Puntuación a partir de la cual la evidencia se considera suficiente; con
+# menos (p. ej. una sola palabra del título) la confianza se reduce en proporción
+MIN_EVIDENCE = 4.0
+
+# Términos (palabras o bigramas ya normalizados) por categoría, en español
+# e inglés para cubrir los distintos marketplaces
+KEYWORDS = {
+    'electronics': (
+        'electronica', 'electronics', 'informatica', 'computers', 'ordenador', 'portatil', 'laptop',
+        'tablet', 'smartphone', 'movil', 'telefono', 'cell phones', 'iphone', 'android', 'auriculares',
+        'headphones', 'earbuds', 'altavoz', 'speaker', 'alexa', 'echo', 'bluetooth', 'wifi', 'usb',
+        'hdmi', 'camara', 'camera', 'television', 'tv', 'monitor', 'teclado', 'keyboard', 'raton',
+        'mouse', 'consola', 'videojuegos', 'video games', 'smartwatch', 'reloj inteligente', 'cargador',
+        'charger', 'bateria', 'battery', 'gadget', 'hogar digital', 'smart home', 'e readers',
+        'ereader', 'router', 'ssd', 'gb', 'tb', 'procesador', 'processor',
+    ),
+    'home': (
+        'hogar', 'home', 'cocina', 'kitchen', 'dining', 'small appliances', 'electrodomesticos',
+        'appliances', 'jardin', 'garden', 'bricolaje', 'muebles', 'furniture', 'decoracion', 'decor',
+        'bano', 'bath', 'ropa de cama', 'bedding', 'colchon', 'mattress', 'sofa', 'lampara', 'lamp',
+        'iluminacion', 'lighting', 'aspiradora', 'vacuum', 'cafetera', 'coffee maker', 'freidora',
+        'air fryer', 'olla', 'pressure cooker', 'sarten', 'cuchillo', 'almacenamiento',
+        'storage', 'limpieza', 'cleaning', 'herramientas', 'tools',
+    ),
+    'fashion': (
+        'moda', 'fashion', 'ropa', 'clothing', 'shoes', 'zapatos', 'zapatillas', 'sneakers', 'jewelry',
+        'joyeria', 'camiseta', 'shirt', 't shirt', 'pantalon', 'pants', 'jeans', 'vaqueros', 'vestido',
+        'dress', 'chaqueta', 'jacket', 'abrigo', 'coat', 'sudadera', 'hoodie', 'bolso', 'handbag',
+        'mochila', 'backpack', 'gafas de sol', 'sunglasses', 'reloj', 'watch', 'cinturon', 'belt',
+        'talla', 'men', 'women', 'hombre', 'mujer', 'algodon', 'cotton', 'regular fit', 'slim fit',
+    ),
+    'books': (
+        'libros', 'books', 'libro', 'book', 'kindle store', 'ebook', 'ebooks', 'tapa blanda',
+        'paperback', 'tapa dura', 'hardcover', 'novela', 'novel', 'autor', 'author', 'edicion',
+        'edition', 'editorial', 'publisher', 'isbn', 'paginas', 'pages', 'audible', 'audiolibro',
+        'audiobook', 'comic', 'comics',
+    ),
+}
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_BREADCRUMB_SPLIT_RE = re.compile(r'\s*[›>|/]\s*|\n+')
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes: 'Electrónica' -> 'electronica'"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    return text.lower()
+
+
+def _terms(text: str) -> List[str]:
+    """Palabras y bigramas del texto normalizado"""
+    tokens = _TOKEN_RE.findall(normalize(text))
+    return tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+
+def _breadcrumb_parts(breadcrumb: str) -> List[str]:
+    return [part for part in (p.strip() for p in _BREADCRUMB_SPLIT_RE.split(breadcrumb or '')) if part]
+
+
+class CategoryClassifier:
+    """
+    Modelo lineal sobre términos con pesos precompilados.
+
+    Cada término conocido suma el peso de la fuente en la que aparece a las
+    categorías que lo contienen. La confianza es la fracción de la
+    puntuación total que se lleva la categoría ganadora, reducida cuando
+    hay poca evidencia: un breadcrumb claro da confianza alta, mientras que
+    un título con una sola palabra conocida ('reloj') o términos de varias
+    categorías la deja por debajo del umbral.
+    """
+
+    def __init__(self, keywords: Optional[Dict[str, Iterable[str]]] = None,
+                 source_weights: Optional[Dict[str, float]] = None):
+        self.source_weights = dict(SOURCE_WEIGHTS, **(source_weights or {}))
+        # Índice término -> categorías, compilado una sola vez
+        self._index: Dict[str, Tuple[str, ...]] = {}
+        for category, terms in (keywords or KEYWORDS).items():
+            for term in terms:
+                key = ' '.join(_TOKEN_RE.findall(normalize(term)))
+                self._index[key] = self._index.get(key, ()) + (category,)
+
+    def _score(self, scores: Dict[str, float], text: str, weight: float):
+        seen = set()
+        for term in _terms(text):
+            if term in seen:
+                continue
+            seen.add(term)
+            for category in self._index.get(term, ()):
+                scores[category] = scores.get(category, 0.0) + weight
+
+    def scores(self, product_data: Dict[str, Any]) -> Dict[str, float]:
+        """Puntuación de cada categoría para los datos de un producto"""
+        scores: Dict[str, float] = {}
+        parts = _breadcrumb_parts(product_data.get('category') or '')
+        if parts:
+            self._score(scores, parts[0], self.source_weights['breadcrumb_root'])
+            self._score(scores, ' '.join(parts[1:]), self.source_weights['breadcrumb'])
+
+        self._score(scores, product_data.get('title') or '', self.source_weights['title'])
+
+        features = product_data.get('features') or []
+        if isinstance(features, str):
+            features = [features]
+        self._score(scores, ' '.join(str(feature) for feature in features), self.source_weights['features'])
+        return scores
+
+    def classify(self, product_data: Dict[str, Any]) -> Tuple[str, float]:
+        """
+        Clasifica un producto.
+
+        Returns:
+            Tupla (categoría, confianza entre 0 y 1). Sin ninguna señal
+            devuelve ('default', 0.0).
+        """
+        scores = self.scores(product_data)
+        total = sum(scores.values())
+        if not total:
+            return 'default', 0.0
+
+        category = max(scores, key=scores.get)
+        evidence = min(1.0, scores[category] / MIN_EVIDENCE)
+        return category, round(scores[category] / total * evidence, 3)
+
+
+_default_classifier: Optional[CategoryClassifier] = None
+
+
+def classify_product(product_data: Dict[str, Any]) -> Tuple[str, float]:
+    """Clasifica con el clasificador compartido del proceso"""
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = CategoryClassifier()
+    return _default_classifier.classify(product_data)
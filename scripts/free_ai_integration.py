@@ -3,41 +3,104 @@ Integración con APIs de IA completamente gratuitas
 Alternativa a OpenAI para generar artículos sin costo
 """
 
-import requests
+import asyncio
 import json
 import os
+import re
+import sys
 import time
 import random
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from http_pool import close_async_client, get_async_client
+from instrumentation import record_llm, stage, tracing
+from llm_cache import get_llm_cache
+from llm_router import LLMRouter, RoutingError, get_router
+from metrics import ARTICLES, FALLBACK_ARTICLES, LLM_DURATION
+from profiling import profiled
+from provider_health import ProviderHealth, get_provider_health
+from rate_limit import RateLimitExceeded, estimate_tokens
+
+# Bases de las APIs; se pueden apuntar a servidores locales (benchmarks/fake_services.py)
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com').rstrip('/')
+HUGGINGFACE_API_BASE = os.getenv('HUGGINGFACE_API_BASE', 'https://api-inference.huggingface.co').rstrip('/')
+OLLAMA_API_URL = os.getenv('OLLAMA_API_URL', 'http://localhost:11434').rstrip('/')
+
+# Inicio de una sección del artículo: encabezado HTML h1/h2 o markdown # / ##
+_SECTION_START_RE = re.compile(r'<h[12][\s>]|^#{1,2}\s', re.IGNORECASE | re.MULTILINE)
+
+
+class HTMLSectionSplitter:
+    """
+    Agrupa el texto que llega en streaming en secciones completas.
+
+    Una sección se da por terminada cuando empieza el siguiente encabezado,
+    así el cliente recibe bloques HTML cerrados en lugar de tokens sueltos.
+    """
+    
+    def __init__(self):
+        self.buffer = ''
+    
+    def feed(self, text: str) -> List[str]:
+        """Añade texto y devuelve las secciones que han quedado completas"""
+        self.buffer += text
+        starts = [match.start() for match in _SECTION_START_RE.finditer(self.buffer) if match.start() > 0]
+        if not starts:
+            return []
+        
+        bounds = [0] + starts
+        sections = [self.buffer[a:b] for a, b in zip(bounds, bounds[1:])]
+        self.buffer = self.buffer[starts[-1]:]
+        return [section for section in sections if section.strip()]
+    
+    def flush(self) -> List[str]:
+        """Devuelve lo que queda en el buffer como última sección"""
+        rest, self.buffer = self.buffer, ''
+        return [rest] if rest.strip() else []
+
+
 class FreeAIArticleGenerator:
     """
     Generador de artículos usando APIs de IA gratuitas
     """
     
-    def __init__(self):
+    def __init__(self, health: Optional[ProviderHealth] = None, router: Optional[LLMRouter] = None):
         # APIs gratuitas disponibles
         self.apis = {
             'huggingface': {
-                'url': 'https://api-inference.huggingface.co/models/microsoft/DialoGPT-large',
+                'url': f'{HUGGINGFACE_API_BASE}/models/microsoft/DialoGPT-large',
                 'headers': {'Authorization': f'Bearer {os.getenv("HUGGINGFACE_API_KEY", "")}'},
                 'free': True
             },
             'gemini': {
-                'url': 'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent',
+                'url': f'{GEMINI_API_BASE}/v1beta/models/gemini-pro:generateContent',
+                'stream_url': f'{GEMINI_API_BASE}/v1beta/models/gemini-pro:streamGenerateContent',
                 'headers': {'Content-Type': 'application/json'},
                 'free': True,
                 'key': os.getenv('GOOGLE_GEMINI_API_KEY', '')
             },
             'ollama': {
-                'url': 'http://localhost:11434/api/generate',
+                'url': f'{OLLAMA_API_URL}/api/generate',
+                'health_url': f'{OLLAMA_API_URL}/api/tags',
                 'headers': {'Content-Type': 'application/json'},
                 'free': True,
                 'local': True
             }
         }
         
+        # Disponibilidad y circuit breaker compartidos entre peticiones
+        self.health = health or get_provider_health()
+        self.health.register_probe('ollama', self._probe_ollama)
+        
+        # Selección por latencia, errores y cuota, con hedging y failover
+        self.router = router or get_router()
+        
+        # Respuestas ya generadas para el mismo prompt (None si LLM_CACHE_ENABLED=false)
+        self.cache = get_llm_cache()
+        
         # Templates de artículos optimizados para IA gratuita
         self.templates = {
             'electronics': self._get_electronics_template(),
@@ -51,27 +114,61 @@ class FreeAIArticleGenerator:
         """
         Genera un artículo usando APIs gratuitas
         """
+        ARTICLES.inc('free-ai')
+        with profiled('generate_article'):
+            return await self._generate_article(product_data, affiliate_link)
+    
+    async def _generate_article(self, product_data: Dict[str, Any], affiliate_link: str) -> Dict[str, Any]:
         try:
-            # Determinar la mejor API disponible
-            api_name = self._select_best_api()
+            # APIs disponibles; el router decide el orden
+            candidates = await self._available_apis()
             
-            if not api_name:
+            if not candidates:
                 return self._generate_fallback_article(product_data, affiliate_link)
             
-            # Generar artículo con la API seleccionada
-            article_content = await self._generate_with_api(api_name, product_data, affiliate_link)
-            
-            # Optimizar para SEO
-            seo_optimized = self._optimize_seo(article_content, product_data)
+            with tracing('free-ai', product=product_data.get('title')) as trace:
+                with stage('generate'):
+                    # Una respuesta cacheada de cualquier API disponible no cuesta tokens ni cuota
+                    cached = self._find_cached_response(candidates, product_data, affiliate_link)
+                    
+                    if cached:
+                        api_name, article_content = cached
+                        record_llm(self._llm_request(api_name, product_data, affiliate_link)[1], article_content,
+                                   cached=True)
+                        routing = {'provider': api_name, 'ranking': [api_name], 'attempts': [], 'hedged': False,
+                                   'failover': False, 'total_ms': 0.0, 'cached': True}
+                    else:
+                        # Generar artículo con la API elegida por el router
+                        article_content, routing = await self.router.call(
+                            candidates, lambda api_name: self._generate_with_api(api_name, product_data, affiliate_link),
+                            tokens=lambda api_name: self._estimate_tokens(api_name, product_data, affiliate_link)
+                        )
+                        routing['cached'] = False
+                        self._store_response(routing['provider'], product_data, affiliate_link, article_content)
+                
+                # Optimizar para SEO
+                with stage('seo'):
+                    seo_optimized = self._optimize_seo(article_content, product_data)
             
             return {
                 'success': True,
                 'article': seo_optimized,
-                'ai_provider': api_name,
+                'ai_provider': routing['provider'],
+                'routing': routing,
+                'timings': trace.as_dict(),
+                'llm_cache': self.cache.stats() if self.cache else None,
                 'cost': 0.0,
                 'generated_at': datetime.now().isoformat()
             }
             
+        except RoutingError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'fallback_used': True,
+                'routing': e.route,
+                'article': self._generate_fallback_article(product_data, affiliate_link)
+            }
         except Exception as e:
             return {
                 'success': False,
@@ -80,61 +177,223 @@ class FreeAIArticleGenerator:
                 'article': self._generate_fallback_article(product_data, affiliate_link)
             }
     
-    def _select_best_api(self) -> Optional[str]:
-        """Selecciona la mejor API disponible"""
+    async def stream_article(self, product_data: Dict[str, Any], affiliate_link: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Genera el artículo en streaming
         
-        # Prioridad: Gemini > Hugging Face > Ollama
-        priority_order = ['gemini', 'huggingface', 'ollama']
+        Emite un evento 'start' de inmediato, un evento 'section' por cada
+        sección HTML completada y un evento 'done' con el artículo optimizado.
+        Si la API falla antes de producir texto se emite el artículo de
+        fallback; si falla a mitad se emite 'error' y se cierra con lo generado.
+        """
+        ARTICLES.inc('free-ai')
+        api_name = await self._select_best_api()
+        # Una respuesta cacheada no llama al proveedor: no necesita la prueba half-open
+        cached = self._find_cached_response([api_name], product_data, affiliate_link) if api_name else None
+        if api_name and not cached and not self.health.try_acquire(api_name):
+            api_name = None
+        # Paso reservado en el circuito y aún sin resultado: se devuelve en el finally si
+        # el cliente se desconecta o la llamada termina sin registrarse
+        claimed = bool(api_name and not cached)
         
-        for api_name in priority_order:
-            if self._is_api_available(api_name):
-                return api_name
+        try:
+            yield {'event': 'start', 'ai_provider': api_name or 'fallback', 'started_at': datetime.now().isoformat()}
+            
+            splitter = HTMLSectionSplitter()
+            parts: List[str] = []
+            index = 0
+            start = time.perf_counter()
+            
+            try:
+                if not api_name:
+                    raise Exception("No hay APIs de IA disponibles")
+                
+                if cached:
+                    chunks = self._replay(cached[1])
+                else:
+                    # Encolar según los límites RPM/TPM; la latencia se mide desde que sale la llamada
+                    await self.router.acquire(api_name, self._estimate_tokens(api_name, product_data, affiliate_link))
+                    start = time.perf_counter()
+                    chunks = self._stream_with_api(api_name, product_data, affiliate_link)
+                
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    for section in splitter.feed(chunk):
+                        yield {'event': 'section', 'index': index, 'html': section}
+                        index += 1
+            
+            except Exception as e:
+                # Cola del limitador llena: no cuenta como fallo del proveedor (lo libera el finally)
+                if claimed and not isinstance(e, RateLimitExceeded):
+                    claimed = False
+                    self.router.record(api_name, False)
+                    LLM_DURATION.observe(time.perf_counter() - start, api_name, 'error')
+                if not parts:
+                    article = self._generate_fallback_article(product_data, affiliate_link)
+                    for section in splitter.feed(article['content']) + splitter.flush():
+                        yield {'event': 'section', 'index': index, 'html': section}
+                        index += 1
+                    yield {'event': 'done', 'success': True, 'article': article, 'ai_provider': 'fallback',
+                           'fallback_used': True, 'cost': 0.0, 'generated_at': datetime.now().isoformat()}
+                    return
+                yield {'event': 'error', 'message': str(e)}
+            
+            else:
+                if claimed:
+                    claimed = False
+                    self.router.record(api_name, True, time.perf_counter() - start)
+                    LLM_DURATION.observe(time.perf_counter() - start, api_name, 'success')
+                    self._store_response(api_name, product_data, affiliate_link, ''.join(parts))
+            
+            for section in splitter.flush():
+                yield {'event': 'section', 'index': index, 'html': section}
+                index += 1
+            
+            yield {
+                'event': 'done',
+                'success': True,
+                'article': self._optimize_seo(''.join(parts), product_data),
+                'ai_provider': api_name,
+                'cached': bool(cached),
+                'cost': 0.0,
+                'generated_at': datetime.now().isoformat()
+            }
+        finally:
+            if claimed:
+                self.health.release(api_name)
+    
+    def _llm_request(self, api_name: str, product_data: Dict[str, Any], affiliate_link: str) -> Tuple[str, str, Dict[str, Any]]:
+        """Modelo, prompt y configuración de generación de una API: la clave de la caché"""
+        
+        if api_name == 'gemini':
+            prompt = self._create_article_prompt(product_data, affiliate_link)
+            return self.apis['gemini']['url'], prompt, self._gemini_payload(prompt)['generationConfig']
+        elif api_name == 'huggingface':
+            prompt = self._create_article_prompt(product_data, affiliate_link, max_length=500)
+            return self.apis['huggingface']['url'], prompt, self._huggingface_payload(prompt)['parameters']
+        elif api_name == 'ollama':
+            prompt = self._create_article_prompt(product_data, affiliate_link)
+            payload = self._ollama_payload(prompt)
+            return payload['model'], prompt, payload['options']
+        else:
+            raise Exception(f"API no soportada: {api_name}")
+    
+    def _estimate_tokens(self, api_name: str, product_data: Dict[str, Any], affiliate_link: str) -> int:
+        """Tokens estimados de prompt y respuesta, para el limitador RPM/TPM del proveedor"""
         
+        model, prompt, config = self._llm_request(api_name, product_data, affiliate_link)
+        return estimate_tokens(prompt) + config.get('maxOutputTokens', config.get('max_length', 0))
+    
+    def _find_cached_response(self, candidates: List[str], product_data: Dict[str, Any],
+                              affiliate_link: str) -> Optional[Tuple[str, str]]:
+        """Primera API candidata con una respuesta cacheada: (api, respuesta)"""
+        
+        if self.cache is None:
+            return None
+        
+        for api_name in candidates:
+            model, prompt, config = self._llm_request(api_name, product_data, affiliate_link)
+            response = self.cache.get(model, prompt, config)
+            if response is not None:
+                return api_name, response
         return None
     
-    def _is_api_available(self, api_name: str) -> bool:
-        """Verifica si una API está disponible"""
+    def _store_response(self, api_name: str, product_data: Dict[str, Any], affiliate_link: str, response: str):
+        if self.cache is not None:
+            model, prompt, config = self._llm_request(api_name, product_data, affiliate_link)
+            self.cache.put(model, prompt, response, config)
+    
+    async def _replay(self, text: str) -> AsyncIterator[str]:
+        """Emite una respuesta cacheada como si llegara en streaming"""
+        yield text
+    
+    async def _select_best_api(self) -> Optional[str]:
+        """Selecciona la API disponible con menor latencia esperada"""
+        
+        ranked = self.router.rank(await self._available_apis())
+        return ranked[0] if ranked else None
+    
+    async def _available_apis(self) -> List[str]:
+        """APIs configuradas y disponibles"""
+        
+        # Orden de desempate: Gemini > Hugging Face > Ollama
+        priority_order = ['gemini', 'huggingface', 'ollama']
+        
+        return [api_name for api_name in priority_order if await self._is_api_available(api_name)]
+    
+    async def _is_api_available(self, api_name: str) -> bool:
+        """
+        Verifica si una API está disponible
+        
+        La configuración (API keys) se comprueba en cada llamada; el estado del
+        servicio y el circuit breaker vienen del registro de salud cacheado.
+        """
         api_config = self.apis.get(api_name)
         
         if not api_config:
             return False
         
         # Verificar API key para APIs que la requieren
-        if api_name == 'gemini':
-            return bool(api_config.get('key'))
-        elif api_name == 'huggingface':
-            return bool(os.getenv('HUGGINGFACE_API_KEY'))
-        elif api_name == 'ollama':
-            # Verificar si Ollama está corriendo localmente
-            try:
-                response = requests.get('http://localhost:11434/api/tags', timeout=5)
-                return response.status_code == 200
-            except:
-                return False
+        if api_name == 'gemini' and not api_config.get('key'):
+            return False
+        elif api_name == 'huggingface' and not os.getenv('HUGGINGFACE_API_KEY'):
+            return False
         
-        return True
+        return await self.health.is_available(api_name)
+    
+    async def _probe_ollama(self) -> bool:
+        """Verifica si Ollama está corriendo localmente"""
+        try:
+            response = await get_async_client().get(self.apis['ollama']['health_url'], timeout=5)
+            return response.status_code == 200
+        except Exception:
+            return False
     
     async def _generate_with_api(self, api_name: str, product_data: Dict[str, Any], affiliate_link: str) -> str:
         """Genera contenido con la API especificada"""
         
+        start = time.perf_counter()
+        try:
+            if api_name == 'gemini':
+                text = await self._generate_with_gemini(product_data, affiliate_link)
+            elif api_name == 'huggingface':
+                text = await self._generate_with_huggingface(product_data, affiliate_link)
+            elif api_name == 'ollama':
+                text = await self._generate_with_ollama(product_data, affiliate_link)
+            else:
+                raise Exception(f"API no soportada: {api_name}")
+        except asyncio.CancelledError:
+            # Intento descartado por el hedging del router
+            LLM_DURATION.observe(time.perf_counter() - start, api_name, 'cancelled')
+            raise
+        except Exception:
+            LLM_DURATION.observe(time.perf_counter() - start, api_name, 'error')
+            raise
+        LLM_DURATION.observe(time.perf_counter() - start, api_name, 'success')
+        
+        # Con hedging cuentan los tokens de todos los intentos: también se pagan
+        record_llm(self._llm_request(api_name, product_data, affiliate_link)[1], text)
+        return text
+    
+    async def _stream_with_api(self, api_name: str, product_data: Dict[str, Any], affiliate_link: str) -> AsyncIterator[str]:
+        """Genera contenido en streaming con la API especificada"""
+        
         if api_name == 'gemini':
-            return await self._generate_with_gemini(product_data, affiliate_link)
-        elif api_name == 'huggingface':
-            return await self._generate_with_huggingface(product_data, affiliate_link)
+            stream = self._stream_with_gemini(product_data, affiliate_link)
         elif api_name == 'ollama':
-            return await self._generate_with_ollama(product_data, affiliate_link)
+            stream = self._stream_with_ollama(product_data, affiliate_link)
+        elif api_name == 'huggingface':
+            # La Inference API de Hugging Face no ofrece streaming para este modelo
+            yield await self._generate_with_huggingface(product_data, affiliate_link)
+            return
         else:
             raise Exception(f"API no soportada: {api_name}")
-    
-    async def _generate_with_gemini(self, product_data: Dict[str, Any], affiliate_link: str) -> str:
-        """Genera artículo con Google Gemini (Gratis)"""
-        
-        prompt = self._create_article_prompt(product_data, affiliate_link)
         
-        api_config = self.apis['gemini']
-        url = f"{api_config['url']}?key={api_config['key']}"
-        
-        payload = {
+        async for chunk in stream:
+            yield chunk
+    
+    def _gemini_payload(self, prompt: str) -> Dict[str, Any]:
+        return {
             "contents": [{
                 "parts": [{
                     "text": prompt
@@ -147,8 +406,84 @@ class FreeAIArticleGenerator:
                 "maxOutputTokens": 2048
             }
         }
+    
+    def _huggingface_payload(self, prompt: str) -> Dict[str, Any]:
+        return {
+            "inputs": prompt,
+            "parameters": {
+                "max_length": 1000,
+                "temperature": 0.7,
+                "do_sample": True,
+                "top_p": 0.9
+            }
+        }
+    
+    def _ollama_payload(self, prompt: str, stream: bool = False) -> Dict[str, Any]:
+        return {
+            "model": "llama2",  # o "mistral", "codellama"
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": 0.7,
+                "top_p": 0.9
+            }
+        }
+    
+    async def _stream_with_gemini(self, product_data: Dict[str, Any], affiliate_link: str) -> AsyncIterator[str]:
+        """Genera artículo con Google Gemini en streaming (server-sent events)"""
+        
+        prompt = self._create_article_prompt(product_data, affiliate_link)
         
-        response = requests.post(url, headers=api_config['headers'], json=payload, timeout=60)
+        api_config = self.apis['gemini']
+        url = f"{api_config['stream_url']}?alt=sse&key={api_config['key']}"
+        payload = self._gemini_payload(prompt)
+        
+        async with get_async_client().stream('POST', url, headers=api_config['headers'],
+                                             json=payload, timeout=60) as response:
+            if response.status_code != 200:
+                raise Exception(f"Error Gemini API: {response.status_code}")
+            
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                result = json.loads(line[5:])
+                for candidate in result.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+    
+    async def _stream_with_ollama(self, product_data: Dict[str, Any], affiliate_link: str) -> AsyncIterator[str]:
+        """Genera artículo con Ollama local en streaming (una línea JSON por fragmento)"""
+        
+        prompt = self._create_article_prompt(product_data, affiliate_link)
+        
+        api_config = self.apis['ollama']
+        
+        async with get_async_client().stream('POST', api_config['url'], headers=api_config['headers'],
+                                             json=self._ollama_payload(prompt, stream=True), timeout=120) as response:
+            if response.status_code != 200:
+                raise Exception(f"Error Ollama API: {response.status_code}")
+            
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                if result.get('response'):
+                    yield result['response']
+                if result.get('done'):
+                    break
+    
+    async def _generate_with_gemini(self, product_data: Dict[str, Any], affiliate_link: str) -> str:
+        """Genera artículo con Google Gemini (Gratis)"""
+        
+        prompt = self._create_article_prompt(product_data, affiliate_link)
+        
+        api_config = self.apis['gemini']
+        url = f"{api_config['url']}?key={api_config['key']}"
+        payload = self._gemini_payload(prompt)
+        
+        # El turno en el limitador RPM/TPM lo espera el router antes de llamar
+        response = await get_async_client().post(url, headers=api_config['headers'], json=payload, timeout=60)
         
         if response.status_code == 200:
             result = response.json()
@@ -164,17 +499,8 @@ class FreeAIArticleGenerator:
         
         api_config = self.apis['huggingface']
         
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_length": 1000,
-                "temperature": 0.7,
-                "do_sample": True,
-                "top_p": 0.9
-            }
-        }
-        
-        response = requests.post(api_config['url'], headers=api_config['headers'], json=payload, timeout=60)
+        response = await get_async_client().post(api_config['url'], headers=api_config['headers'],
+                                                 json=self._huggingface_payload(prompt), timeout=60)
         
         if response.status_code == 200:
             result = response.json()
@@ -191,17 +517,8 @@ class FreeAIArticleGenerator:
         
         api_config = self.apis['ollama']
         
-        payload = {
-            "model": "llama2",  # o "mistral", "codellama"
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.7,
-                "top_p": 0.9
-            }
-        }
-        
-        response = requests.post(api_config['url'], headers=api_config['headers'], json=payload, timeout=120)
+        response = await get_async_client().post(api_config['url'], headers=api_config['headers'],
+                                                 json=self._ollama_payload(prompt), timeout=120)
         
         if response.status_code == 200:
             result = response.json()
@@ -276,6 +593,7 @@ ARTÍCULO:
     def _generate_fallback_article(self, product_data: Dict[str, Any], affiliate_link: str) -> Dict[str, Any]:
         """Genera artículo básico como fallback"""
         
+        FALLBACK_ARTICLES.inc('free-ai')
         title = product_data.get('title', 'Producto de Amazon')
         price = product_data.get('current_price', 'Consultar precio')
         
@@ -370,6 +688,7 @@ if __name__ == "__main__":
         )
         
         print(json.dumps(result, indent=2, ensure_ascii=False))
+        await close_async_client()
     
     asyncio.run(test())
 
@@ -0,0 +1,249 @@
+"""
+Backends de parseo HTML intercambiables para el scraper
+Todos exponen las mismas operaciones sobre nodos que usa el plan de extracción
+"""
+
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    from bs4 import BeautifulSoup, Tag
+except ImportError:  # pragma: no cover - dependencia opcional
+    BeautifulSoup = None
+
+try:
+    import lxml.html
+except ImportError:  # pragma: no cover - dependencia opcional
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # pragma: no cover - dependencia opcional
+    LexborHTMLParser = None
+
+# Información mínima de un elemento: (tag, id, clases, atributos)
+ElementInfo = Tuple[str, Optional[str], List[str], Dict[str, Optional[str]]]
+
+# Orden de preferencia cuando SCRAPER_PARSER=auto
+AUTO_ORDER = ('selectolax', 'lxml', 'html.parser')
+
+_CHARSET = re.compile(rb'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def charset_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    """Charset declarado en una cabecera Content-Type, o None"""
+    match = _CHARSET.search((content_type or '').encode('latin-1', 'ignore'))
+    return match.group(1).decode('ascii') if match else None
+
+
+def _declared_charset(content: bytes) -> Optional[str]:
+    """Charset de <meta charset> o <meta http-equiv> al principio del documento"""
+    match = _CHARSET.search(content[:4096])
+    return match.group(1).decode('ascii') if match else None
+
+
+class ParserBackend:
+    """
+    Interfaz común de los backends.
+
+    El plan de extracción solo usa estas operaciones, por lo que los mismos
+    selectores y las mismas reglas de cada campo funcionan con cualquier
+    motor de parseo.
+    """
+
+    name = 'base'
+
+    def parse(self, content, encoding: Optional[str] = None):
+        """
+        Parsea el documento. `encoding` es el charset declarado por el
+        servidor para `content` en bytes; sin él, cada motor lo detecta
+        """
+        raise NotImplementedError
+
+    def root(self, document):
+        """Nodo desde el que recorrer el documento completo"""
+        return document
+
+    def find_by_id(self, document, element_id: str):
+        raise NotImplementedError
+
+    def children(self, element) -> Iterator:
+        """Hijos directos de `element` que son elementos (sin texto ni comentarios)"""
+        raise NotImplementedError
+
+    def info(self, element) -> ElementInfo:
+        raise NotImplementedError
+
+    def text(self, element) -> str:
+        raise NotImplementedError
+
+    def attr(self, element, name: str) -> Optional[str]:
+        return self.info(element)[3].get(name)
+
+    def tag(self, element) -> str:
+        return self.info(element)[0]
+
+    def find_all(self, element, tag: str) -> list:
+        """Descendientes de `element` con el tag indicado"""
+        raise NotImplementedError
+
+
+class SoupBackend(ParserBackend):
+    """BeautifulSoup con el tree builder indicado ('html.parser' o 'lxml')"""
+
+    def __init__(self, parser: str = 'html.parser'):
+        if BeautifulSoup is None:
+            raise ImportError("Instala beautifulsoup4: pip install beautifulsoup4")
+        if parser == 'lxml' and lxml is None:
+            raise ImportError("Instala lxml: pip install lxml")
+        self.parser = parser
+        self.name = 'bs4-lxml' if parser == 'lxml' else parser
+
+    def parse(self, content, encoding=None):
+        return BeautifulSoup(content, self.parser, from_encoding=encoding if isinstance(content, bytes) else None)
+
+    def find_by_id(self, document, element_id):
+        return document.find(id=element_id)
+
+    def children(self, element):
+        return (child for child in element.children if isinstance(child, Tag))
+
+    def info(self, element):
+        attrs = element.attrs
+        return element.name, attrs.get('id'), attrs.get('class') or [], attrs
+
+    def text(self, element):
+        return element.get_text()
+
+    def find_all(self, element, tag):
+        return element.find_all(tag)
+
+
+class LxmlBackend(ParserBackend):
+    """lxml.html nativo, sin capa de BeautifulSoup"""
+
+    name = 'lxml'
+
+    def __init__(self):
+        if lxml is None:
+            raise ImportError("Instala lxml: pip install lxml")
+        self._parsers: Dict[Optional[str], 'lxml.html.HTMLParser'] = {}
+
+    def _parser(self, encoding: Optional[str]):
+        parser = self._parsers.get(encoding)
+        if parser is None:
+            parser = self._parsers[encoding] = lxml.html.HTMLParser(encoding=encoding)
+        return parser
+
+    def parse(self, content, encoding=None):
+        if isinstance(content, bytes) and encoding is None and not _declared_charset(content):
+            # Sin charset en las cabeceras ni en <meta> lxml asumiría latin-1;
+            # las páginas de Amazon sin declaración son UTF-8
+            encoding = 'utf-8'
+        if not isinstance(content, bytes):
+            encoding = None
+        try:
+            parser = self._parser(encoding)
+        except LookupError:
+            parser = self._parser(None)
+        return lxml.html.document_fromstring(content, parser=parser)
+
+    def find_by_id(self, document, element_id):
+        return document.get_element_by_id(element_id, None)
+
+    def children(self, element):
+        return (child for child in element if isinstance(child.tag, str))
+
+    def info(self, element):
+        attrs = element.attrib
+        return element.tag, attrs.get('id'), (attrs.get('class') or '').split(), attrs
+
+    def text(self, element):
+        return element.text_content()
+
+    def find_all(self, element, tag):
+        return [child for child in element.iter(tag) if child is not element]
+
+
+class SelectolaxBackend(ParserBackend):
+    """selectolax sobre el motor lexbor"""
+
+    name = 'selectolax'
+
+    def __init__(self):
+        if LexborHTMLParser is None:
+            raise ImportError("Instala selectolax: pip install selectolax")
+
+    def parse(self, content, encoding=None):
+        # lexbor trata los bytes como UTF-8: se decodifican con el charset
+        # de las cabeceras o, en su defecto, el del <meta>
+        encoding = encoding or (_declared_charset(content) if isinstance(content, bytes) else None)
+        if isinstance(content, bytes) and encoding:
+            try:
+                content = content.decode(encoding, errors='replace')
+            except LookupError:
+                pass
+        return LexborHTMLParser(content)
+
+    def root(self, document):
+        return document.root
+
+    def find_by_id(self, document, element_id):
+        return document.css_first(f'[id="{element_id}"]')
+
+    def children(self, element):
+        return (child for child in element.iter(include_text=False) if child.is_element_node)
+
+    def info(self, element):
+        attrs = element.attributes
+        return element.tag, attrs.get('id'), (attrs.get('class') or '').split(), attrs
+
+    def text(self, element):
+        return element.text(deep=True)
+
+    def find_all(self, element, tag):
+        return element.css(tag)
+
+
+_FACTORIES = {
+    'selectolax': SelectolaxBackend,
+    'lxml': LxmlBackend,
+    'bs4-lxml': lambda: SoupBackend('lxml'),
+    'html.parser': lambda: SoupBackend('html.parser'),
+}
+
+
+def available_backends() -> List[str]:
+    """Nombres de los backends que pueden usarse en este entorno"""
+    available = []
+    for name, factory in _FACTORIES.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        available.append(name)
+    return available
+
+
+def get_backend(name: Optional[str] = None) -> ParserBackend:
+    """
+    Crea el backend indicado o, con 'auto', el más rápido instalado.
+
+    Si no se indica nombre se usa SCRAPER_PARSER (por defecto 'auto'). Con
+    'auto' se recurre a html.parser cuando no hay lxml ni selectolax.
+    """
+    name = name or os.getenv('SCRAPER_PARSER', 'auto')
+
+    if name != 'auto':
+        if name not in _FACTORIES:
+            raise ValueError(f"Backend de parseo no soportado: {name}")
+        return _FACTORIES[name]()
+
+    for candidate in AUTO_ORDER:
+        try:
+            return _FACTORIES[candidate]()
+        except ImportError:
+            continue
+
+    raise ImportError("No hay ningún parser HTML disponible: instala beautifulsoup4, lxml o selectolax")
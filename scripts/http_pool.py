@@ -0,0 +1,174 @@
+"""
+Capa HTTP compartida con pools de conexiones persistentes
+Reutiliza conexiones TCP/TLS entre llamadas dentro de un proceso en caliente
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+import weakref
+from typing import Any, Awaitable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - dependencia opcional
+    httpx = None
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', '100'))
+
+# Tamaño del pool por host; los hosts de Amazon reciben más conexiones
+# porque scrape_many los consulta en paralelo
+HOST_POOL_SIZES = {
+    'www.amazon.com': 16,
+    'www.amazon.es': 16,
+    'www.amazon.co.uk': 16,
+    'www.amazon.de': 16,
+    'www.amazon.fr': 16,
+    'www.amazon.it': 16,
+    'www.amazon.ca': 16,
+    'www.amazon.com.mx': 16,
+    'generativelanguage.googleapis.com': 8,
+    'api-inference.huggingface.co': 4,
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_async_clients: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+# Event loop de fondo del proceso para los handlers síncronos (run_sync): sus
+# corrutinas comparten un único cliente asíncrono y sus conexiones
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _parse_host_pool_sizes(value: str) -> Dict[str, int]:
+    """Parsea HTTP_HOST_POOL_SIZES con formato "host=tamaño,host=tamaño" """
+    sizes = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        host, size = item.split('=', 1)
+        sizes[host.strip()] = int(size)
+    return sizes
+
+
+def _host_pool_sizes() -> Dict[str, int]:
+    sizes = dict(HOST_POOL_SIZES)
+    sizes.update(_parse_host_pool_sizes(os.getenv('HTTP_HOST_POOL_SIZES', '')))
+    return sizes
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+
+    default_adapter = HTTPAdapter(pool_connections=DEFAULT_POOL_MAXSIZE,
+                                  pool_maxsize=DEFAULT_POOL_MAXSIZE)
+    session.mount('https://', default_adapter)
+    session.mount('http://', default_adapter)
+
+    # requests elige el adaptador con el prefijo más largo
+    for host, size in _host_pool_sizes().items():
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+        session.mount(f'https://{host}', adapter)
+        session.mount(f'http://{host}', adapter)
+
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Devuelve la sesión HTTP síncrona compartida del proceso.
+
+    La sesión mantiene conexiones keep-alive por host, de modo que las
+    invocaciones en caliente reutilizan conexiones ya abiertas.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get_async_client() -> 'httpx.AsyncClient':
+    """
+    Devuelve el cliente HTTP asíncrono compartido para el event loop actual.
+
+    Usa HTTP/2 cuando el paquete `h2` está instalado. Se mantiene un cliente
+    por event loop porque las conexiones de httpx quedan ligadas al loop que
+    las creó. Un loop de vida corta (asyncio.run) debe cerrar el suyo con
+    close_async_client() antes de terminar; los handlers síncronos usan
+    run_sync() y reutilizan siempre el mismo.
+    """
+    if httpx is None:
+        raise ImportError("Instala httpx para usar el cliente asíncrono: pip install 'httpx[http2]'")
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                              max_keepalive_connections=DEFAULT_POOL_MAXSIZE * 2)
+        client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=limits)
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Cierra el cliente asíncrono del event loop actual, si lo hay"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='http-pool-loop', daemon=True).start()
+                atexit.register(_stop_background_loop, loop)
+                _loop = loop
+    return _loop
+
+
+def _stop_background_loop(loop: asyncio.AbstractEventLoop):
+    try:
+        asyncio.run_coroutine_threadsafe(close_async_client(), loop).result(timeout=5)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def run_sync(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """
+    Ejecuta una corrutina desde código síncrono en el event loop de fondo.
+
+    Sustituye a asyncio.run / new_event_loop por petición: el loop vive lo
+    que el proceso, así que el cliente de get_async_client() y sus
+    conexiones se reutilizan entre invocaciones en caliente y no queda un
+    cliente sin cerrar por cada petición. Admite llamadas concurrentes
+    desde varios hilos.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _background_loop())
+    return future.result(timeout)
+
+
+def close_all():
+    """Cierra la sesión síncrona compartida (útil en tests y benchmarks)"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
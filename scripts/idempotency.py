@@ -0,0 +1,204 @@
+"""
+Idempotencia de las peticiones del webhook
+Make.com reintenta el POST cuando vence su timeout; con una clave de
+idempotencia los reintentos esperan a la petición original en curso o
+reciben al instante su respuesta guardada, en lugar de repetir el scraping,
+la generación y la publicación
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+IDEMPOTENCY_DB = os.getenv('IDEMPOTENCY_DB', '/tmp/amazon_idempotency.sqlite3')
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', str(24 * 3600)))
+# Una petición en curso más antigua que esto se da por abandonada (maxDuration es 300 s)
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '330'))
+
+NEW = 'new'
+IN_FLIGHT = 'in_flight'
+COMPLETED = 'completed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    status_code INTEGER,
+    response TEXT,
+    started_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idempotency_expires ON idempotency (expires_at);
+"""
+
+
+def derive_idempotency_key(data: Dict[str, Any], header: Optional[str] = None) -> Optional[str]:
+    """
+    Clave de idempotencia de una petición del webhook.
+
+    Por orden de preferencia: la cabecera Idempotency-Key, el campo
+    `idempotency_key` del cuerpo o, para artículos y lotes, un hash de la
+    fila de la hoja (sheet_id + row_number + product_url + affiliate_link)
+    o del lote. Un artículo sin sheet_id ni row_number no identifica una
+    fila y, como los demás eventos, no es idempotente: devuelve None.
+    """
+    explicit = header or data.get('idempotency_key')
+    if explicit:
+        return f'explicit:{explicit}'
+
+    event_type = data.get('event_type', 'process_article')
+    if event_type == 'process_article':
+        if not data.get('sheet_id') and not data.get('row_number'):
+            return None
+        parts = [data.get('sheet_id') or '', data.get('row_number') or '', data.get('product_url') or '',
+                 data.get('affiliate_link') or '']
+    elif event_type == 'process_batch':
+        parts = [data.get('sheet_id') or '', data.get('sheet_range') or '',
+                 json.dumps(data.get('rows') or [], sort_keys=True)]
+    else:
+        return None
+
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'{event_type}:{digest}'
+
+
+class IdempotencyStore:
+    """
+    Registro de peticiones por clave, compartido entre procesos.
+
+    `begin` reserva la clave de forma atómica: la primera petición la
+    procesa (NEW), las que llegan mientras tanto esperan con `wait`
+    (IN_FLIGHT) y las posteriores reciben la respuesta guardada durante
+    `ttl` segundos (COMPLETED). Si la petición original falla, `release`
+    libera la clave para que el siguiente reintento la procese.
+    """
+
+    def __init__(self, path: str = IDEMPOTENCY_DB, ttl: float = IDEMPOTENCY_TTL,
+                 lock_timeout: float = IDEMPOTENCY_LOCK_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.replayed = 0
+        self.coalesced = 0
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        # Avisos para las esperas del mismo proceso; entre procesos se consulta SQLite
+        self._events: Dict[str, threading.Event] = {}
+
+    def begin(self, key: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Reserva la clave.
+
+        Returns:
+            (NEW, None) si esta petición debe procesarse, (IN_FLIGHT, None) si
+            otra la está procesando o (COMPLETED, respuesta guardada)
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                self._conn.execute('DELETE FROM idempotency WHERE expires_at <= ?', (now,))
+                row = self._conn.execute(
+                    'SELECT state, status_code, response FROM idempotency WHERE key = ?', (key,)
+                ).fetchone()
+
+                if row is not None and row[0] == COMPLETED:
+                    self._conn.execute('COMMIT')
+                    self.replayed += 1
+                    return COMPLETED, {'status_code': row[1], 'body': json.loads(row[2])}
+                if row is not None:
+                    self._conn.execute('COMMIT')
+                    return IN_FLIGHT, None
+
+                self._conn.execute(
+                    'INSERT INTO idempotency (key, state, started_at, expires_at) VALUES (?, ?, ?, ?)',
+                    (key, IN_FLIGHT, now, now + self.lock_timeout)
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+            self._events[key] = threading.Event()
+            return NEW, None
+
+    def complete(self, key: str, status_code: int, body: Any):
+        """Guarda la respuesta de la petición original durante `ttl` segundos"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO idempotency (key, state, status_code, response, started_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, COMPLETED, status_code, json.dumps(body, ensure_ascii=False), now, now + self.ttl)
+            )
+            event = self._events.pop(key, None)
+        if event:
+            event.set()
+
+    def release(self, key: str):
+        """Libera la clave de una petición que ha fallado"""
+        with self._lock:
+            self._conn.execute('DELETE FROM idempotency WHERE key = ? AND state = ?', (key, IN_FLIGHT))
+            event = self._events.pop(key, None)
+        if event:
+            event.set()
+
+    def wait(self, key: str, timeout: float, poll_interval: float = 0.5) -> Optional[Dict[str, Any]]:
+        """
+        Espera a que termine la petición original.
+
+        Returns:
+            La respuesta guardada, o None si la clave se liberó o se agotó el
+            tiempo (el llamador puede volver a intentar `begin`)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT state, status_code, response FROM idempotency WHERE key = ?', (key,)
+                ).fetchone()
+                event = self._events.get(key)
+
+            if row is None:
+                return None
+            if row[0] == COMPLETED:
+                self.coalesced += 1
+                return {'status_code': row[1], 'body': json.loads(row[2])}
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if event is not None:
+                event.wait(min(remaining, poll_interval * 10))
+            else:
+                time.sleep(min(remaining, poll_interval))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) FROM idempotency GROUP BY state').fetchall()
+        counts = {IN_FLIGHT: 0, COMPLETED: 0}
+        counts.update(dict(rows))
+        return dict(counts, replayed=self.replayed, coalesced=self.coalesced)
+
+
+_default_store: Optional[IdempotencyStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Registro compartido del proceso"""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = IdempotencyStore()
+    return _default_store
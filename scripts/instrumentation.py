@@ -0,0 +1,203 @@
+"""
+Instrumentación por etapa del pipeline de artículos
+Cada etapa (fetch, parse, classify, generate, seo, publish) acumula tiempo
+de reloj, bytes transferidos, tokens de prompt y de respuesta y aciertos de
+caché; al terminar, el resumen va a la respuesta (`timings`) y a una línea
+de log JSON
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from rate_limit import estimate_tokens
+
+STAGES = ('fetch', 'parse', 'classify', 'generate', 'seo', 'publish')
+LOG_ENABLED = os.getenv('PIPELINE_LOG_ENABLED', 'true').lower() == 'true'
+
+logger = logging.getLogger('pipeline')
+if not logger.handlers:
+    # Una línea JSON por producto, aunque la aplicación no configure logging
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# La traza y la etapa en curso viajan con el contexto: las tareas de asyncio
+# las heredan y cada etapa concurrente del DAG ve la suya
+_current_trace: ContextVar[Optional['PipelineTrace']] = ContextVar('pipeline_trace', default=None)
+_current_stage: ContextVar[Optional[str]] = ContextVar('pipeline_stage', default=None)
+
+
+class StageStats:
+    __slots__ = ('ms', 'calls', 'bytes', 'prompt_tokens', 'completion_tokens', 'cache_hits')
+
+    def __init__(self):
+        self.ms = 0.0
+        self.calls = 0
+        self.bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'ms': round(self.ms, 1),
+            'calls': self.calls,
+            'bytes': self.bytes,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cache_hits': self.cache_hits,
+        }
+
+
+class PipelineTrace:
+    """
+    Mediciones de un producto a lo largo del pipeline.
+
+    Las etapas pueden repetirse (reintentos, fallback a dos llamadas) y se
+    acumulan; las que se ejecutan en paralelo suman su propio tiempo, así
+    que la suma de etapas puede superar el total.
+    """
+
+    def __init__(self, pipeline: str, **context):
+        self.pipeline = pipeline
+        self.context = context
+        self.stages: Dict[str, StageStats] = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def _stats(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator['PipelineTrace']:
+        token = _current_stage.set(name)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            _current_stage.reset(token)
+            with self._lock:
+                stats = self._stats(name)
+                stats.ms += elapsed
+                stats.calls += 1
+
+    def record(self, stage: Optional[str] = None, bytes: int = 0, prompt_tokens: int = 0,
+               completion_tokens: int = 0, cache_hit: bool = False):
+        """Suma a la etapa indicada o, por defecto, a la etapa en curso"""
+        name = stage or _current_stage.get()
+        if name is None:
+            return
+        with self._lock:
+            stats = self._stats(name)
+            stats.bytes += bytes
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.cache_hits += 1 if cache_hit else 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            names = [name for name in STAGES if name in self.stages]
+            names += sorted(name for name in self.stages if name not in STAGES)
+            stages = {name: self.stages[name].as_dict() for name in names}
+        dominant = max(stages, key=lambda name: stages[name]['ms']) if stages else None
+        return {
+            'total_ms': round(self.elapsed_ms, 1),
+            'dominant_stage': dominant,
+            'prompt_tokens': sum(stats['prompt_tokens'] for stats in stages.values()),
+            'completion_tokens': sum(stats['completion_tokens'] for stats in stages.values()),
+            'stages': stages,
+        }
+
+    def log(self, **extra):
+        if LOG_ENABLED:
+            logger.info(json.dumps({'event': 'pipeline_timings', 'pipeline': self.pipeline,
+                                    **self.context, **extra, **self.as_dict()},
+                                   ensure_ascii=False, default=str))
+
+
+def current_trace() -> Optional[PipelineTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def tracing(pipeline: str, **context) -> Iterator[PipelineTrace]:
+    """
+    Abre la traza de un producto y la emite en el log al salir.
+
+    Si ya hay una traza activa (por ejemplo, el webhook llamando al
+    generador) se reutiliza, para que todas las etapas queden en un único
+    resumen emitido por quien la abrió.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+
+    trace = PipelineTrace(pipeline, **context)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.log()
+
+
+def stage(name: str):
+    """Mide una etapa de la traza en curso; sin traza no hace nada"""
+    trace = _current_trace.get()
+    return trace.stage(name) if trace is not None else nullcontext()
+
+
+def record(stage: Optional[str] = None, **measurements):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, **measurements)
+
+
+def record_llm(prompt: str, text: Optional[str], usage: Any = None, cached: bool = False):
+    """
+    Registra una llamada al modelo en la etapa en curso.
+
+    Usa los tokens que informa el proveedor (usage_metadata de Gemini) y,
+    si no los hay, los estima por caracteres. Una respuesta de la caché
+    cuenta solo como acierto, sin tokens ni bytes: los bytes de la etapa
+    son los que se envían y reciben del proveedor.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    if cached:
+        trace.record(cache_hit=True)
+        return
+    text = text or ''
+    size = len(prompt.encode('utf-8')) + len(text.encode('utf-8'))
+    prompt_tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+    completion_tokens = getattr(usage, 'candidates_token_count', None) or estimate_tokens(text)
+    trace.record(bytes=size, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def traced(name: str, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Envuelve la corrutina de una etapa del DAG para medirla como `name`"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with stage(name):
+            return await func(*args, **kwargs)
+    return wrapper
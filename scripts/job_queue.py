@@ -0,0 +1,240 @@
+"""
+Cola de trabajos persistente en SQLite
+Permite que el webhook encole la generación de artículos y responda al
+momento, mientras los workers de scripts/job_worker.py la procesan con
+reintentos, backoff exponencial y timeouts de visibilidad
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', '/tmp/amazon_jobs.sqlite3')
+VISIBILITY_TIMEOUT = float(os.getenv('JOB_VISIBILITY_TIMEOUT', '600'))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', '10'))
+MAX_RETRY_DELAY = float(os.getenv('JOB_MAX_RETRY_DELAY', '600'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_id TEXT,
+    lease_expires_at REAL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if not timestamp:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + 'Z'
+
+
+def retry_delay(attempts: int, base: float = RETRY_BACKOFF, cap: float = MAX_RETRY_DELAY) -> float:
+    """Backoff exponencial con jitter completo: entre 0 y base * 2^(intentos-1)"""
+    return random.uniform(0, min(cap, base * 2 ** max(0, attempts - 1)))
+
+
+class JobQueue:
+    """
+    Cola de trabajos compartida por todos los procesos de la máquina.
+
+    `claim` entrega un trabajo a un único worker con un lease de
+    `visibility_timeout` segundos; el worker lo amplía con `heartbeat`
+    mientras trabaja. Si el worker muere y el lease caduca, el trabajo vuelve
+    a estar disponible para otro. Los trabajos que fallan se reprograman con
+    backoff exponencial hasta `max_attempts` intentos.
+
+    `complete`, `fail` y `heartbeat` solo tienen efecto con el lease vigente,
+    de modo que un worker que perdió el trabajo no puede pisar el resultado
+    del que lo recogió después.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, visibility_timeout: float = VISIBILITY_TIMEOUT,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None,
+                delay: float = 0) -> str:
+        """Encola un trabajo y devuelve su id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, kind, payload, status, max_attempts, available_at, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), QUEUED,
+                 max_attempts or self.max_attempts, now + delay, now, now)
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Reserva el siguiente trabajo disponible: uno encolado cuyo backoff ya
+        ha pasado o uno en curso cuyo lease ha caducado.
+
+        Returns:
+            El trabajo con su `lease_id`, o None si no hay ninguno
+        """
+        with self._lock:
+            while True:
+                # BEGIN IMMEDIATE: dos workers nunca reservan el mismo trabajo
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    now = time.time()
+                    row = self._conn.execute(
+                        'SELECT id, kind, payload, attempts, max_attempts, status FROM jobs '
+                        'WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at <= ?) '
+                        'ORDER BY available_at LIMIT 1',
+                        (QUEUED, now, RUNNING, now)
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute('COMMIT')
+                        return None
+
+                    job_id, kind, payload, attempts, max_attempts, status = row
+                    if status == RUNNING and attempts >= max_attempts:
+                        # El último intento se quedó sin lease (worker caído o colgado)
+                        self._conn.execute(
+                            'UPDATE jobs SET status = ?, error = ?, lease_id = NULL, updated_at = ? WHERE id = ?',
+                            (FAILED, 'Timeout de visibilidad agotado en el último intento', now, job_id)
+                        )
+                        self._conn.execute('COMMIT')
+                        continue
+
+                    lease_id = uuid.uuid4().hex
+                    self._conn.execute(
+                        'UPDATE jobs SET status = ?, attempts = attempts + 1, lease_id = ?, '
+                        'lease_expires_at = ?, updated_at = ? WHERE id = ?',
+                        (RUNNING, lease_id, now + self.visibility_timeout, now, job_id)
+                    )
+                    self._conn.execute('COMMIT')
+                except BaseException:
+                    self._conn.execute('ROLLBACK')
+                    raise
+
+                return {
+                    'id': job_id,
+                    'kind': kind,
+                    'payload': json.loads(payload),
+                    'attempt': attempts + 1,
+                    'max_attempts': max_attempts,
+                    'lease_id': lease_id,
+                }
+
+    def _update_leased(self, job: Dict[str, Any], assignments: str, values: tuple) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                f'UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND lease_id = ? AND status = ?',
+                values + (time.time(), job['id'], job['lease_id'], RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job: Dict[str, Any], progress: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Amplía el lease y, opcionalmente, guarda el progreso.
+
+        Returns:
+            False si el trabajo ya no pertenece a este worker
+        """
+        expires = time.time() + self.visibility_timeout
+        if progress is None:
+            return self._update_leased(job, 'lease_expires_at = ?', (expires,))
+        return self._update_leased(job, 'lease_expires_at = ?, progress = ?',
+                                   (expires, json.dumps(progress, ensure_ascii=False)))
+
+    def complete(self, job: Dict[str, Any], result: Any) -> bool:
+        """Marca el trabajo como completado con su resultado"""
+        return self._update_leased(job, 'status = ?, result = ?, error = NULL, lease_id = NULL',
+                                   (COMPLETED, json.dumps(result, ensure_ascii=False)))
+
+    def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """
+        Registra un intento fallido: reprograma el trabajo con backoff o lo
+        marca como fallido si ya no quedan intentos.
+        """
+        if job['attempt'] >= job['max_attempts']:
+            return self._update_leased(job, 'status = ?, error = ?, lease_id = NULL', (FAILED, error))
+        return self._update_leased(job, 'status = ?, error = ?, lease_id = NULL, available_at = ?',
+                                   (QUEUED, error, time.time() + retry_delay(job['attempt'])))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado público de un trabajo, para el endpoint de consulta"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, kind, status, attempts, max_attempts, available_at, progress, result, error, '
+                'created_at, updated_at FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        (job_id, kind, status, attempts, max_attempts, available_at, progress, result, error,
+         created_at, updated_at) = row
+        job = {
+            'job_id': job_id,
+            'kind': kind,
+            'status': status,
+            'attempts': attempts,
+            'max_attempts': max_attempts,
+            'progress': json.loads(progress) if progress else None,
+            'result': json.loads(result) if result else None,
+            'error': error,
+            'created_at': _iso(created_at),
+            'updated_at': _iso(updated_at),
+        }
+        if status == QUEUED and attempts:
+            job['next_attempt_at'] = _iso(available_at)
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        """Número de trabajos por estado"""
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = {QUEUED: 0, RUNNING: 0, COMPLETED: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+_default_queue: Optional[JobQueue] = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Cola compartida del proceso"""
+    global _default_queue
+    if _default_queue is None:
+        with _default_queue_lock:
+            if _default_queue is None:
+                _default_queue = JobQueue()
+    return _default_queue
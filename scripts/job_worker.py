@@ -0,0 +1,156 @@
+"""
+Workers de la cola de trabajos
+Procesan en varios procesos los artículos y lotes que el webhook encola en
+scripts/job_queue.py
+
+Uso:
+    python scripts/job_worker.py [--processes 4] [--poll-interval 1] [--once]
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_queue import JobQueue, JOB_QUEUE_PATH
+from webhook_processing import process_article_request, process_batch_request, send_callback
+
+WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', '2'))
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+
+
+def _run_article(payload: Dict[str, Any], progress: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    return process_article_request(payload)
+
+
+def _run_batch(payload: Dict[str, Any], progress: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    return process_batch_request(payload, on_progress=progress)
+
+
+# Tipo de trabajo -> función(payload, progress) que devuelve el resultado;
+# las excepciones se reintentan, los resultados con success=False no
+HANDLERS: Dict[str, Callable[[Dict[str, Any], Callable], Dict[str, Any]]] = {
+    'process_article': _run_article,
+    'process_batch': _run_batch,
+}
+
+
+class _Heartbeat(threading.Thread):
+    """Amplía el lease del trabajo mientras la función sigue en marcha"""
+
+    def __init__(self, queue: JobQueue, job: Dict[str, Any]):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job = job
+        self.interval = max(1.0, queue.visibility_timeout / 3)
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.queue.heartbeat(self.job):
+                self.lost = True
+                return
+
+
+def process_one(queue: JobQueue, worker_id: str) -> bool:
+    """
+    Reserva y procesa un trabajo.
+
+    Returns:
+        False si la cola no tenía trabajos disponibles
+    """
+    job = queue.claim()
+    if job is None:
+        return False
+
+    handler = HANDLERS.get(job['kind'])
+    if handler is None:
+        queue.fail(dict(job, attempt=job['max_attempts']), f"Tipo de trabajo no soportado: {job['kind']}")
+        return True
+
+    heartbeat = _Heartbeat(queue, job)
+    heartbeat.start()
+    start = time.perf_counter()
+    try:
+        result = handler(job['payload'], lambda progress: queue.heartbeat(job, progress))
+    except Exception as e:
+        heartbeat.stopped.set()
+        print(f"[{worker_id}] Trabajo {job['id']} falló (intento {job['attempt']}/{job['max_attempts']}): {e}")
+        traceback.print_exc()
+        queue.fail(job, str(e))
+        return True
+    heartbeat.stopped.set()
+
+    if not queue.complete(job, result):
+        # Otro worker recogió el trabajo tras caducar el lease: su resultado prevalece
+        print(f"[{worker_id}] Trabajo {job['id']} perdido por timeout de visibilidad")
+        return True
+
+    print(f"[{worker_id}] Trabajo {job['id']} ({job['kind']}) completado en "
+          f"{time.perf_counter() - start:.1f}s")
+    callback_url = job['payload'].get('callback_url')
+    if callback_url:
+        send_callback(callback_url, dict(result, job_id=job['id']))
+    return True
+
+
+def run_worker(queue_path: str = JOB_QUEUE_PATH, worker_id: Optional[str] = None,
+               poll_interval: float = POLL_INTERVAL, stop: Optional[Any] = None, once: bool = False):
+    """
+    Bucle de un worker: procesa trabajos hasta que `stop` se activa (o hasta
+    vaciar la cola con `once`)
+    """
+    # Cada proceso abre su propia conexión a SQLite
+    queue = JobQueue(queue_path)
+    worker_id = worker_id or f'worker-{os.getpid()}'
+
+    while stop is None or not stop.is_set():
+        if process_one(queue, worker_id):
+            continue
+        if once:
+            return
+        if stop is not None:
+            stop.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workers de la cola de generación de artículos')
+    parser.add_argument('--processes', type=int, default=WORKER_PROCESSES)
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--queue', default=JOB_QUEUE_PATH, help='Fichero SQLite de la cola')
+    parser.add_argument('--once', action='store_true', help='Procesar los trabajos pendientes y salir')
+    args = parser.parse_args()
+
+    stop = multiprocessing.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    workers = [
+        multiprocessing.Process(target=run_worker, name=f'worker-{index}',
+                                args=(args.queue, f'worker-{index}', args.poll_interval, stop, args.once))
+        for index in range(max(1, args.processes))
+    ]
+    for worker in workers:
+        worker.start()
+    print(f"{len(workers)} workers procesando {args.queue}")
+
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Caché de respuestas de los modelos de IA
+Indexa cada respuesta por un hash del modelo, la configuración de generación
+y el prompt normalizado, con un nivel en memoria y otro en SQLite
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_CACHE_PATH = os.getenv('LLM_CACHE_PATH', '/tmp/amazon_llm_cache.sqlite3')
+DEFAULT_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+DEFAULT_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(100 * 1024 * 1024)))
+DEFAULT_MEMORY_ENTRIES = int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', '256'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Colapsa espacios y saltos de línea: la indentación de los prompts no cambia la respuesta"""
+    return _WHITESPACE_RE.sub(' ', prompt or '').strip()
+
+
+def cache_key(model: str, prompt: str, config: Optional[Dict[str, Any]] = None) -> str:
+    payload = json.dumps([model, config or {}, normalize_prompt(prompt)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CachedResponse:
+    """Respuesta cacheada con la misma interfaz mínima que la del SDK (`.text`)"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class LLMCache:
+    """
+    Caché de respuestas en dos niveles.
+
+    La memoria guarda las `memory_entries` respuestas más recientes del
+    proceso; SQLite las conserva entre invocaciones en caliente y entre
+    procesos, con TTL y expulsión LRU cuando se superan `max_bytes`. Solo
+    deben guardarse respuestas correctas: las que no pasan la validación
+    del llamador se eliminan con `delete`.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: int = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES, memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, prompt: str, config: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Devuelve la respuesta cacheada si existe y no ha caducado"""
+        key = cache_key(model, prompt, config)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+
+            row = self._conn.execute(
+                'SELECT response, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, model: str, prompt: str, response: str, config: Optional[Dict[str, Any]] = None):
+        """Guarda una respuesta correcta"""
+        if not response:
+            return
+
+        key = cache_key(model, prompt, config)
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, response, len(response.encode('utf-8')), now, now)
+            )
+            self._evict(now)
+
+    def delete(self, model: str, prompt: str, config: Optional[Dict[str, Any]] = None):
+        """Elimina una respuesta que el llamador no ha podido usar"""
+        key = cache_key(model, prompt, config)
+        with self._lock:
+            self._memory.pop(key, None)
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def _evict(self, now: float):
+        """Borra las entradas caducadas y expulsa por LRU hasta quedar por debajo de max_bytes"""
+        self._conn.execute('DELETE FROM responses WHERE created_at <= ?', (now - self.ttl,))
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute('SELECT key, size FROM responses ORDER BY last_access ASC').fetchall()
+        expired = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            self._memory.pop(key, None)
+            total -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+            return {
+                'entries': entries,
+                'bytes': size,
+                'memory_entries': len(self._memory),
+                'hits': self.memory_hits + self.disk_hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
+
+
+_default_cache: Optional[LLMCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Caché compartida del proceso, o None si LLM_CACHE_ENABLED=false"""
+    global _default_cache
+    if os.getenv('LLM_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = LLMCache()
+    return _default_cache
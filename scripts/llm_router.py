@@ -0,0 +1,330 @@
+"""
+Enrutador de llamadas a proveedores de IA
+Elige el proveedor con menor latencia esperada según la latencia, la tasa
+de errores y la cuota restante de cada uno (la espera en su limitador de
+frecuencia si lo tiene), y cubre las llamadas lentas con
+una petición de respaldo (hedging) o las redirige si fallan
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from provider_health import ProviderHealth, get_provider_health
+from rate_limit import RateLimitExceeded, TokenBucketLimiter, get_gemini_limiter
+
+WINDOW_SIZE = int(os.getenv('LLM_ROUTER_WINDOW', '50'))
+
+# Segundos sin respuesta tras los que se lanza la petición de respaldo
+DEFAULT_DEADLINE = float(os.getenv('LLM_DEADLINE_SECONDS', '20'))
+
+# Peticiones por minuto de los proveedores sin limitador compartido (None =
+# sin límite conocido). La cuota de Gemini la lleva su token bucket
+DEFAULT_QUOTAS = {
+    'gemini': None,
+    'huggingface': None,
+    'ollama': None,
+}
+
+# Latencia supuesta (s) mientras un proveedor no tiene muestras
+PRIOR_LATENCY = {
+    'gemini': 8.0,
+    'huggingface': 15.0,
+    'ollama': 30.0,
+}
+
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class RoutingError(Exception):
+    """Ningún proveedor pudo atender la llamada; `route` describe los intentos"""
+
+    def __init__(self, message: str, route: Dict[str, Any]):
+        super().__init__(message)
+        self.route = route
+
+
+class ProviderStats:
+    """
+    Ventana móvil de latencias y resultados de un proveedor, más su cuota.
+
+    Si el proveedor tiene un limitador (token bucket) la cuota es la suya:
+    el saldo del bucket y la espera que tendría una llamada ahora. Si no,
+    se cuentan las llamadas del último minuto contra `rpm_limit`.
+    """
+
+    def __init__(self, name: str, rpm_limit: Optional[int] = None, window: int = WINDOW_SIZE,
+                 limiter: Optional[TokenBucketLimiter] = None):
+        self.name = name
+        self.rpm_limit = rpm_limit
+        self.limiter = limiter
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.calls: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self.calls and now - self.calls[0] >= 60:
+            self.calls.popleft()
+
+    def remaining_quota(self) -> Optional[int]:
+        if self.limiter is not None:
+            return self.limiter.remaining()
+        if self.rpm_limit is None:
+            return None
+        with self._lock:
+            self._prune(time.monotonic())
+            return max(0, self.rpm_limit - len(self.calls))
+
+    def queue_wait(self) -> float:
+        """Segundos que esperaría en el limitador una llamada lanzada ahora"""
+        return self.limiter.wait_time() if self.limiter is not None else 0.0
+
+    def has_quota(self) -> bool:
+        """
+        Si se puede llamar al proveedor: con limitador basta con que la
+        espera quepa en su cola; sin él, que quede cuota en el minuto
+        """
+        if self.limiter is not None:
+            return self.queue_wait() <= self.limiter.max_wait
+        return self.remaining_quota() != 0
+
+    def consume(self):
+        # Con limitador la llamada ya se cuenta al reservar su hueco
+        if self.limiter is not None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            self.calls.append(now)
+
+    def record(self, success: bool, latency: Optional[float] = None):
+        with self._lock:
+            self.outcomes.append(success)
+            if success and latency is not None:
+                self.latencies.append(latency)
+
+    def p50(self) -> Optional[float]:
+        with self._lock:
+            return _percentile(list(self.latencies), 50)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            return _percentile(list(self.latencies), 95)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def expected_latency(self) -> float:
+        """
+        Latencia esperada contando los reintentos: la mediana dividida por la
+        probabilidad de éxito (con un mínimo para no dividir por cero), más
+        la espera en el limitador
+        """
+        p50 = self.p50()
+        latency = p50 if p50 is not None else PRIOR_LATENCY.get(self.name, 20.0)
+        return latency / max(0.05, 1 - self.error_rate()) + self.queue_wait()
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.p50(), self.p95()
+        return {
+            'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            'error_rate': round(self.error_rate(), 3),
+            'remaining_quota': self.remaining_quota(),
+            'queue_wait_s': round(self.queue_wait(), 2),
+            'samples': len(self.latencies),
+        }
+
+
+class LLMRouter:
+    """
+    Enruta cada llamada al proveedor con menor latencia esperada.
+
+    Los proveedores sin cuota restante en el último minuto se descartan; los
+    que tienen limitador (`limiters`, por defecto el de Gemini) solo si la
+    espera en su cola superaría su máximo, y si no se llaman tras esperar
+    su turno, sumando esa espera a su latencia esperada. Si el proveedor elegido no responde antes de `deadline` segundos se lanza
+    en paralelo la misma petición al siguiente (hedging) y se usa la
+    primera respuesta correcta; si falla, se pasa al siguiente de la lista.
+    Los resultados alimentan tanto las estadísticas como el circuit breaker
+    del registro de salud.
+    """
+
+    def __init__(self, quotas: Optional[Dict[str, Optional[int]]] = None, deadline: float = DEFAULT_DEADLINE,
+                 health: Optional[ProviderHealth] = None,
+                 limiters: Optional[Dict[str, TokenBucketLimiter]] = None):
+        self.quotas = dict(DEFAULT_QUOTAS, **(quotas or {}))
+        self.limiters = {'gemini': get_gemini_limiter()} if limiters is None else dict(limiters)
+        self.deadline = deadline
+        self.health = health or get_provider_health()
+        self._stats: Dict[str, ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    def stats(self, name: str) -> ProviderStats:
+        with self._lock:
+            if name not in self._stats:
+                self._stats[name] = ProviderStats(name, self.quotas.get(name), limiter=self.limiters.get(name))
+            return self._stats[name]
+
+    def rank(self, candidates: Iterable[str]) -> List[str]:
+        """Candidatos con cuota disponible, de menor a mayor latencia esperada"""
+        ranked = [name for name in candidates if self.stats(name).has_quota()]
+        return sorted(ranked, key=lambda name: self.stats(name).expected_latency())
+
+    def record(self, name: str, success: bool, latency: Optional[float] = None):
+        """Registra el resultado de una llamada hecha fuera del router (p. ej. streaming)"""
+        self.stats(name).record(success, latency)
+        if success:
+            self.health.record_success(name)
+        else:
+            self.health.record_failure(name)
+
+    async def acquire(self, name: str, tokens: int = 0) -> float:
+        """
+        Espera el turno del proveedor en su limitador (si lo tiene).
+
+        Las llamadas hechas fuera del router deben llamarlo antes de empezar
+        a medir la latencia, para no contar la espera en la cola.
+
+        Raises:
+            RateLimitExceeded: si la espera superaría el máximo del limitador
+        """
+        limiter = self.limiters.get(name)
+        return await limiter.acquire_async(tokens) if limiter is not None else 0.0
+
+    async def call(self, candidates: Iterable[str],
+                   call: Callable[[str], Awaitable[Any]],
+                   tokens: Optional[Callable[[str], int]] = None) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Ejecuta `call(proveedor)` con enrutado, hedging y failover.
+
+        Antes de cada intento se espera el turno en el limitador del
+        proveedor, reservando `tokens(proveedor)` (prompt y respuesta estimados); la
+        latencia del intento se mide desde que termina esa espera.
+
+        Returns:
+            Tupla (resultado, información de la ruta con el proveedor usado,
+            el orden considerado, cada intento y los tiempos)
+
+        Raises:
+            RoutingError: si no hay proveedores con cuota o todos fallan
+        """
+        ranking = self.rank(candidates)
+        route: Dict[str, Any] = {
+            'provider': None,
+            'ranking': ranking,
+            'attempts': [],
+            'hedged': False,
+            'failover': False,
+        }
+        if not ranking:
+            route['total_ms'] = 0.0
+            raise RoutingError("No hay proveedores de IA con cuota disponible", route)
+
+        start = time.perf_counter()
+        # Por intento: proveedor y [inicio de la llamada tras el limitador, espera en el limitador]
+        pending: Dict[asyncio.Task, Tuple[str, List[float]]] = {}
+        queue = list(ranking)
+        last_error: Optional[BaseException] = None
+
+        async def attempt_call(name: str, timing: List[float]) -> Any:
+            timing[1] = await self.acquire(name, tokens(name) if tokens else 0)
+            timing[0] = time.perf_counter()
+            return await call(name)
+
+        def launch() -> bool:
+            """Lanza el siguiente proveedor cuyo circuito deje pasar la llamada"""
+            while queue:
+                name = queue.pop(0)
+                # La prueba half-open se reclama aquí, al llamar de verdad, y no al consultar la disponibilidad
+                if not self.health.try_acquire(name):
+                    route['attempts'].append({'provider': name, 'status': 'skipped', 'ms': 0.0})
+                    continue
+                self.stats(name).consume()
+                timing = [time.perf_counter(), 0.0]
+                pending[asyncio.ensure_future(attempt_call(name, timing))] = (name, timing)
+                return True
+            return False
+
+        if not launch():
+            route['total_ms'] = 0.0
+            raise RoutingError("Ningún proveedor de IA tiene el circuito disponible", route)
+        try:
+            while pending:
+                done, _ = await asyncio.wait(list(pending), timeout=self.deadline,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Plazo superado: respaldo con el siguiente proveedor
+                    if queue and launch():
+                        route['hedged'] = True
+                    continue
+
+                for task in done:
+                    name, (started, queued) = pending.pop(task)
+                    elapsed = time.perf_counter() - started
+                    error = task.exception()
+                    attempt = {'provider': name, 'ms': round(elapsed * 1000, 1)}
+                    if queued:
+                        attempt['queued_ms'] = round(queued * 1000, 1)
+
+                    if isinstance(error, RateLimitExceeded):
+                        # Cola del limitador llena: no es un fallo del proveedor
+                        self.health.release(name)
+                        route['attempts'].append(dict(attempt, ms=0.0, status='rate_limited', error=str(error)))
+                        last_error = error
+                        continue
+
+                    if error is None:
+                        self.record(name, True, elapsed)
+                        route['attempts'].append(dict(attempt, status='ok'))
+                        route['provider'] = name
+                        route['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+                        return task.result(), route
+
+                    self.record(name, False)
+                    route['attempts'].append(dict(attempt, status='error', error=str(error)))
+                    last_error = error
+
+                if not pending and queue and launch():
+                    route['failover'] = True
+        finally:
+            for task, (name, (started, queued)) in pending.items():
+                task.cancel()
+                self.health.release(name)
+                route['attempts'].append({'provider': name, 'status': 'cancelled',
+                                          'ms': round((time.perf_counter() - started) * 1000, 1)})
+
+        route['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        raise RoutingError(f"Todos los proveedores de IA han fallado: {last_error}", route) from last_error
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            names = list(self._stats)
+        return {name: self.stats(name).snapshot() for name in names}
+
+
+_default_router: Optional[LLMRouter] = None
+_default_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """Router compartido del proceso: las estadísticas se acumulan entre peticiones"""
+    global _default_router
+    if _default_router is None:
+        with _default_router_lock:
+            if _default_router is None:
+                _default_router = LLMRouter()
+    return _default_router
@@ -0,0 +1,282 @@
+"""
+Métricas en formato de texto de Prometheus
+Contadores e histogramas agregados en memoria del proceso, con un lock por
+métrica, que se exponen en /api/metrics para alertar sobre caídas de
+throughput y aumentos de latencia
+
+Cada proceso solo ve sus propias métricas: sirven en un despliegue de un
+solo proceso (benchmarks/local_server.py o un servidor propio con un único
+worker). En Vercel cada invocación puede caer en una instancia distinta,
+así que /api/metrics no se despliega allí (.vercelignore)
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Segundos: las peticiones HTTP y el scraping van de milisegundos a decenas
+# de segundos; la generación con LLM, hasta el maxDuration de 300 s
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[Any]) -> Labels:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} espera las etiquetas {self.labelnames}')
+        return tuple(str(value) for value in labels)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}', *self.samples()]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con buckets fijos (`le`), suma y número de observaciones"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = HTTP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [conteos por bucket (el último es +Inf), suma]
+        self._values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: Any):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, *labels: Any) -> '_Timer':
+        """Context manager que observa la duración del bloque"""
+        return _Timer(self, labels)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}'
+            label_text = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum{label_text} {_format_value(round(total, 6))}'
+            yield f'{self.name}_count{label_text} {cumulative}'
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Sequence[Any]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class CallbackMetric(_Metric):
+    """
+    Métrica calculada al exponer: `callback` devuelve {valores de etiquetas: valor}.
+    Sirve para estado que ya se lleva en otro sitio (cola, contadores de las cachés).
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Labels, float]], type: str = 'gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def samples(self) -> Iterable[str]:
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"Error calculando la métrica {self.name}: {e}")
+            return
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Métrica duplicada: {metric.name}')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de exposición de texto 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+_START_TIME = time.time()
+
+
+def _page_cache_requests() -> Dict[Labels, float]:
+    import page_cache
+
+    cache = page_cache._default_cache
+    if cache is None:
+        return {}
+    return {('page', 'hit'): cache.hits, ('page', 'miss'): cache.misses}
+
+
+def _llm_cache_requests() -> Dict[Labels, float]:
+    import llm_cache
+
+    cache = llm_cache._default_cache
+    if cache is None:
+        return {}
+    return {('llm', 'hit'): cache.memory_hits + cache.disk_hits, ('llm', 'miss'): cache.misses}
+
+
+def _cache_requests() -> Dict[Labels, float]:
+    return {**_page_cache_requests(), **_llm_cache_requests()}
+
+
+def _queue_depth() -> Dict[Labels, float]:
+    from job_queue import get_job_queue
+
+    return {(status,): count for status, count in get_job_queue().stats().items()}
+
+
+REQUESTS = REGISTRY.register(Counter(
+    'amazon_api_requests_total', 'Peticiones HTTP por endpoint, método y código de estado',
+    ('endpoint', 'method', 'status')))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'amazon_api_request_duration_seconds', 'Duración de las peticiones HTTP por endpoint',
+    ('endpoint',)))
+SCRAPE_DURATION = REGISTRY.register(Histogram(
+    'amazon_scrape_duration_seconds', 'Duración del scraping de un producto (descarga y parseo)',
+    ('mode', 'result')))
+LLM_DURATION = REGISTRY.register(Histogram(
+    'amazon_llm_request_duration_seconds', 'Duración de las llamadas a los modelos por proveedor',
+    ('provider', 'result'), buckets=LLM_BUCKETS))
+ARTICLES = REGISTRY.register(Counter(
+    'amazon_articles_total', 'Artículos generados por cada generador (las peticiones coalescidas cuentan una vez)',
+    ('generator',)))
+FALLBACK_ARTICLES = REGISTRY.register(Counter(
+    'amazon_fallback_articles_total', 'Artículos de plantilla (_generate_fallback_article) por generador',
+    ('generator',)))
+WORDPRESS_DURATION = REGISTRY.register(Histogram(
+    'amazon_wordpress_request_duration_seconds', 'Duración de las peticiones a WordPress por operación',
+    ('operation', 'result')))
+CACHE_REQUESTS = REGISTRY.register(CallbackMetric(
+    'amazon_cache_requests_total', 'Consultas a la caché de páginas y a la de respuestas de LLM',
+    ('cache', 'result'), _cache_requests, type='counter'))
+QUEUE_DEPTH = REGISTRY.register(CallbackMetric(
+    'amazon_job_queue_jobs', 'Trabajos en la cola por estado', ('status',), _queue_depth))
+START_TIME = REGISTRY.register(CallbackMetric(
+    'process_start_time_seconds', 'Inicio del proceso (detecta reinicios y arranques en frío)', (),
+    lambda: {(): _START_TIME}))
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float):
+    REQUESTS.inc(endpoint, method, status)
+    REQUEST_DURATION.observe(seconds, endpoint)
+
+
+def instrumented(endpoint: str):
+    """
+    Decorador para los handlers BaseHTTPRequestHandler: cuenta cada petición
+    con su código de estado y mide su duración
+    """
+    def decorate(cls):
+        send_response = cls.send_response
+
+        def send_response_recording(self, code, message=None):
+            self._metrics_status = code
+            send_response(self, code, message)
+
+        cls.send_response = send_response_recording
+
+        for method_name in ('do_GET', 'do_POST', 'do_PUT', 'do_DELETE', 'do_OPTIONS'):
+            method = getattr(cls, method_name, None)
+            if method is not None:
+                setattr(cls, method_name, _timed_method(method, endpoint, method_name[3:]))
+        return cls
+    return decorate
+
+
+def _timed_method(method: Callable, endpoint: str, http_method: str) -> Callable:
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        self._metrics_status = 0
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            observe_request(endpoint, http_method, self._metrics_status or 500, time.perf_counter() - start)
+    return wrapper
@@ -0,0 +1,319 @@
+"""
+Caché local de páginas de producto de Amazon
+Guarda el HTML comprimido y los datos extraídos por ASIN y marketplace en SQLite
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+DEFAULT_CACHE_PATH = os.getenv('PAGE_CACHE_PATH', '/tmp/amazon_page_cache.sqlite3')
+DEFAULT_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# Clases de campos con su TTL en segundos: el precio y la disponibilidad
+# cambian a menudo, el título, las imágenes o las características casi nunca
+FIELD_CLASSES = {
+    'volatile': ('price', 'availability'),
+    'social': ('rating', 'reviews_count'),
+    'stable': ('url', 'title', 'description', 'images', 'features', 'asin', 'category'),
+}
+
+DEFAULT_TTLS = {
+    'volatile': int(os.getenv('PAGE_CACHE_TTL_VOLATILE', os.getenv('CACHE_TTL', '3600'))),
+    'social': int(os.getenv('PAGE_CACHE_TTL_SOCIAL', str(24 * 3600))),
+    'stable': int(os.getenv('PAGE_CACHE_TTL_STABLE', str(30 * 24 * 3600))),
+}
+
+_ASIN_RE = re.compile(r'/(?:dp|gp/product|gp/aw/d)/([A-Za-z0-9]{10})(?:[/?#]|$)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    marketplace TEXT NOT NULL,
+    asin TEXT NOT NULL,
+    codec TEXT NOT NULL,
+    html BLOB NOT NULL,
+    data TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access);
+"""
+
+# Columnas añadidas después de la primera versión del esquema; se crean al
+# abrir cachés ya existentes en instancias en caliente
+_SNAPSHOT_COLUMNS = {
+    'etag': 'TEXT',
+    'last_modified': 'TEXT',
+    'fingerprint': 'TEXT',
+    'field_hashes': 'TEXT',
+}
+
+
+def product_key(url: str) -> Optional[Tuple[str, str]]:
+    """
+    Normaliza una URL de producto a (marketplace, ASIN).
+
+    'https://www.amazon.es/Echo-Dot/dp/b08n5wrwnw?tag=x' -> ('amazon.es', 'B08N5WRWNW').
+    Devuelve None si la URL no contiene un ASIN.
+    """
+    match = _ASIN_RE.search(urlparse(url).path + '/')
+    if not match:
+        return None
+
+    host = urlparse(url).netloc.lower().split(':')[0]
+    marketplace = host[4:] if host.startswith('www.') else host
+    return marketplace, match.group(1).upper()
+
+
+def field_class(field: str) -> str:
+    for name, fields in FIELD_CLASSES.items():
+        if field in fields:
+            return name
+    return 'stable'
+
+
+def field_hashes(data: Dict[str, Any]) -> Dict[str, str]:
+    """Hash estable de cada campo extraído (la URL no cuenta como contenido)"""
+    return {
+        field: hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+        for field, value in data.items()
+        if field != 'url'
+    }
+
+
+def fingerprint(hashes: Dict[str, str]) -> str:
+    """Hash del producto completo a partir de los hashes por campo"""
+    return hashlib.sha256(json.dumps(hashes, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _compress(html: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=6).compress(html)
+    return 'zlib', zlib.compress(html, 6)
+
+
+def _decompress(codec: str, blob: bytes) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("La entrada está comprimida con zstd: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob)
+
+
+class PageCache:
+    """
+    Caché de páginas de producto en un fichero SQLite local.
+
+    Cada entrada guarda el HTML comprimido (zstd si está instalado, zlib si
+    no) y el dict `data` extraído. La frescura se evalúa por campo según su
+    clase de TTL, de modo que quien solo necesita campos estables (título,
+    imágenes, características) sigue obteniendo aciertos cuando el precio ya
+    ha caducado. Cuando el tamaño total supera `max_bytes` se expulsan las
+    entradas usadas hace más tiempo (LRU).
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttls: Optional[Dict[str, int]] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.hits = 0
+        self.misses = 0
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(pages)')}
+        for column, column_type in _SNAPSHOT_COLUMNS.items():
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE pages ADD COLUMN {column} {column_type}')
+
+    @staticmethod
+    def _key(marketplace: str, asin: str) -> str:
+        return f'{marketplace}:{asin}'
+
+    def is_fresh(self, fetched_at: float, fields: Iterable[str], now: Optional[float] = None) -> bool:
+        now = now or time.time()
+        age = now - fetched_at
+        return all(age < self.ttls[field_class(field)] for field in fields)
+
+    def get(self, url: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve los datos cacheados si todos los campos pedidos siguen frescos.
+        Los campos caducados que no se pidieron se omiten del resultado.
+
+        Args:
+            url: URL del producto
+            fields: Campos que necesita el llamador (por defecto, todos)
+        """
+        key = product_key(url)
+        if key is None:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, fetched_at FROM pages WHERE key = ?', (self._key(*key),)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            data = json.loads(row[0])
+            now = time.time()
+            if not isinstance(data, dict) or not self.is_fresh(row[1], fields or data.keys(), now):
+                self.misses += 1
+                return None
+
+            self._conn.execute('UPDATE pages SET last_access = ? WHERE key = ?',
+                               (now, self._key(*key)))
+            self.hits += 1
+
+        # Solo se devuelven los campos frescos; la URL de la petición puede
+        # traer parámetros distintos a la cacheada
+        data = {field: value for field, value in data.items() if self.is_fresh(row[1], (field,), now)}
+        data['url'] = url
+        return data
+
+    def get_html(self, url: str) -> Optional[bytes]:
+        """Devuelve el HTML original guardado, sin mirar el TTL"""
+        key = product_key(url)
+        if key is None:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT codec, html FROM pages WHERE key = ?', (self._key(*key),)
+            ).fetchone()
+        return _decompress(row[0], row[1]) if row else None
+
+    def get_snapshot(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve la última versión guardada de un producto sin mirar el TTL,
+        con los validadores HTTP y los hashes por campo para refrescarla.
+        """
+        key = product_key(url)
+        if key is None:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, fetched_at, etag, last_modified, fingerprint, field_hashes '
+                'FROM pages WHERE key = ?', (self._key(*key),)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        data = json.loads(row[0])
+        hashes = json.loads(row[5]) if row[5] else field_hashes(data)
+        return {
+            'data': data,
+            'fetched_at': row[1],
+            'etag': row[2],
+            'last_modified': row[3],
+            'fingerprint': row[4] or fingerprint(hashes),
+            'field_hashes': hashes,
+        }
+
+    def put(self, url: str, html: bytes, data: Dict[str, Any],
+            etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Guarda el HTML y los datos extraídos de un producto"""
+        if not isinstance(data, dict):
+            raise TypeError(f'Los datos a cachear deben ser un dict, no {type(data).__name__}')
+        key = product_key(url)
+        if key is None:
+            return
+
+        codec, blob = _compress(html)
+        serialized = json.dumps(data, ensure_ascii=False)
+        hashes = field_hashes(data)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages '
+                '(key, marketplace, asin, codec, html, data, size, fetched_at, last_access, '
+                'etag, last_modified, fingerprint, field_hashes) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self._key(*key), key[0], key[1], codec, blob, serialized,
+                 len(blob) + len(serialized), now, now,
+                 etag, last_modified, fingerprint(hashes), json.dumps(hashes))
+            )
+            self._evict()
+
+    def touch(self, url: str):
+        """Marca como recién comprobada una entrada que no ha cambiado (HTTP 304)"""
+        key = product_key(url)
+        if key is None:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE pages SET fetched_at = ?, last_access = ? WHERE key = ?',
+                               (now, now, self._key(*key)))
+
+    def _evict(self):
+        """Expulsa entradas por LRU hasta quedar por debajo de max_bytes"""
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute('SELECT key, size FROM pages ORDER BY last_access ASC').fetchall()
+        expired = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM pages WHERE key = ?', expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages'
+            ).fetchone()
+        return {
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_default_cache: Optional[PageCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[PageCache]:
+    """Caché compartida del proceso, o None si CACHE_ENABLED=false"""
+    global _default_cache
+    if os.getenv('CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = PageCache()
+    return _default_cache
@@ -0,0 +1,101 @@
+"""
+Ejecución de pipelines asíncronos como grafo de dependencias
+Las etapas independientes se ejecutan en paralelo con asyncio
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class Stage:
+    """
+    Etapa del pipeline.
+
+    Args:
+        name: Nombre único de la etapa
+        func: Corrutina que recibe como argumentos por nombre los resultados
+            de sus dependencias
+        deps: Nombres de las etapas de las que depende
+    """
+
+    def __init__(self, name: str, func: Callable[..., Awaitable[Any]], deps: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+class PipelineDAG:
+    """
+    Grafo de etapas asíncronas.
+
+    Cada etapa arranca en cuanto terminan sus dependencias, de modo que las
+    ramas independientes se solapan con `asyncio.gather`. Devuelve los
+    resultados y la duración de cada etapa en milisegundos.
+    """
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Etapa duplicada: {stage.name}")
+            self.stages[stage.name] = stage
+
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"La etapa {stage.name} depende de una etapa inexistente: {dep}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependencia circular en la etapa {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(self, initial: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """
+        Ejecuta el grafo.
+
+        Args:
+            initial: Resultados ya conocidos, utilizables como dependencias
+
+        Returns:
+            Tupla (resultados por etapa, milisegundos por etapa)
+        """
+        results: Dict[str, Any] = dict(initial or {})
+        timings: Dict[str, float] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: Stage):
+            if stage.deps:
+                await asyncio.gather(*(tasks[dep] for dep in stage.deps if dep in tasks))
+            start = time.perf_counter()
+            try:
+                results[stage.name] = await stage.func(**{dep: results[dep] for dep in stage.deps})
+            finally:
+                timings[stage.name] = round((time.perf_counter() - start) * 1000, 1)
+
+        pending: List[Stage] = [stage for name, stage in self.stages.items() if name not in results]
+        for stage in pending:
+            tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        return results, timings
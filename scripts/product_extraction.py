@@ -0,0 +1,464 @@
+"""
+Plan de extracción compilado para páginas de producto de Amazon
+Resuelve los selectores de todos los campos en un único recorrido del árbol
+"""
+
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from html_backends import ParserBackend, get_backend
+
+# Valores que devuelven los extractores cuando no encuentran el campo
+TITLE_NOT_FOUND = "Título no encontrado"
+PRICE_NOT_FOUND = "Precio no disponible"
+
+# Marcas de la página de captcha ("Robot Check") que Amazon sirve con HTTP 200
+_BLOCKED_MARKERS = (b'/errors/validateCaptcha', b'<title>Robot Check</title>',
+                    b'api-services-support@amazon.com')
+
+# Selectores por campo, en orden de prioridad
+FIELD_SELECTORS = {
+    'title': ['#productTitle', '.product-title', 'h1.a-size-large', 'h1 span'],
+    'price': [
+        '.a-price-whole',
+        '.a-price .a-offscreen',
+        '#priceblock_dealprice',
+        '#priceblock_ourprice',
+        '.a-price-range'
+    ],
+    'description': [
+        '#feature-bullets ul',
+        '#productDescription',
+        '.a-unordered-list.a-vertical.a-spacing-mini'
+    ],
+    'images': ['#landingImage', '.a-dynamic-image', '#imgTagWrapperId img'],
+    'rating': ['.a-icon-alt', '.a-star-5 .a-icon-alt'],
+    'reviews_count': ['#acrCustomerReviewText', '.a-link-normal .a-size-base'],
+    'availability': ['#availability span', '.a-color-success', '.a-color-state'],
+    'features': ['#feature-bullets li span', '.a-unordered-list.a-vertical li span'],
+    'asin': ['[data-asin]', '#ASIN'],
+    'category': ['#wayfinding-breadcrumbs_feature_div', '.a-breadcrumb'],
+}
+
+# Campos que usan todas las coincidencias de un selector; el resto solo
+# necesita la primera (equivalente a select_one)
+MULTI_MATCH_FIELDS = ('images', 'features')
+
+# Compuesto simple de un selector: tag, #id, .clases y [atributos]
+_COMPOUND_RE = re.compile(r'^(?P<tag>[a-zA-Z][\w-]*)?(?P<rest>(?:[#.][\w-]+|\[[\w-]+\])*)$')
+_PART_RE = re.compile(r'([#.])([\w-]+)|\[([\w-]+)\]')
+
+# Contenedores que agrupan los datos del producto; si la página no los tiene,
+# o si dentro de ellos faltan el título o el precio, se recorre el documento completo
+ROOT_IDS = ('dp-container', 'dp')
+
+
+class _Compound:
+    """Compuesto simple (tag, id, clases, atributos) de un selector"""
+
+    def __init__(self, text: str):
+        match = _COMPOUND_RE.match(text)
+        if match is None:
+            raise ValueError(f"Selector no soportado por el plan de extracción: {text}")
+
+        self.tag = match.group('tag')
+        self.id = None
+        self.classes = set()
+        self.attrs = []
+        for prefix, name, attr in _PART_RE.findall(match.group('rest')):
+            if prefix == '#':
+                self.id = name
+            elif prefix == '.':
+                self.classes.add(name)
+            else:
+                self.attrs.append(attr)
+
+    def matches(self, info) -> bool:
+        tag, element_id, classes, attrs = info
+        if self.tag and tag != self.tag:
+            return False
+        if self.id and element_id != self.id:
+            return False
+        if self.classes and not self.classes.issubset(classes):
+            return False
+        for attr in self.attrs:
+            if attr not in attrs:
+                return False
+        return True
+
+
+class _CompiledSelector:
+    """
+    Selector compilado a compuestos simples unidos por el combinador
+    descendiente, que es el único que usan los selectores del scraper.
+
+    Se comprueba el compuesto final contra el elemento y el resto contra la
+    pila de ancestros del recorrido, de derecha a izquierda, sin depender del
+    motor de parseo.
+    """
+
+    def __init__(self, selector: str, limit: Optional[int]):
+        self.selector = selector
+        self.limit = limit
+        self.compounds = [_Compound(part) for part in selector.split()]
+
+        last = self.compounds[-1]
+        self.tag = last.tag
+        self.id = last.id
+        self.classes = last.classes
+        self.attrs = last.attrs
+
+    def matches(self, info, ancestors: list) -> bool:
+        if not self.compounds[-1].matches(info):
+            return False
+
+        pending = len(self.compounds) - 2
+        depth = len(ancestors) - 1
+        while pending >= 0 and depth >= 0:
+            if self.compounds[pending].matches(ancestors[depth]):
+                pending -= 1
+            depth -= 1
+        return pending < 0
+
+
+class SelectorMatches:
+    """Elementos encontrados por selector, en orden de documento"""
+
+    def __init__(self, buckets: Dict[str, list]):
+        self._buckets = buckets
+
+    def first(self, selector: str):
+        elements = self._buckets.get(selector)
+        return elements[0] if elements else None
+
+    def all(self, selector: str) -> list:
+        return self._buckets.get(selector, [])
+
+
+def _extract_title(matches: SelectorMatches, selectors: List[str], url: str,
+                   backend: ParserBackend) -> str:
+    for selector in selectors:
+        element = matches.first(selector)
+        if element is not None:
+            return backend.text(element).strip()
+    return TITLE_NOT_FOUND
+
+
+def _extract_price(matches: SelectorMatches, selectors: List[str], url: str,
+                   backend: ParserBackend) -> str:
+    for selector in selectors:
+        element = matches.first(selector)
+        if element is not None:
+            price_text = backend.text(element).strip()
+            price_clean = re.sub(r'[^\d.,]', '', price_text)
+            if price_clean:
+                return price_clean
+    return PRICE_NOT_FOUND
+
+
+def _extract_description(matches: SelectorMatches, selectors: List[str], url: str,
+                         backend: ParserBackend) -> str:
+    for selector in selectors:
+        element = matches.first(selector)
+        if element is not None:
+            if backend.tag(element) == 'ul':
+                items = [backend.text(item).strip() for item in backend.find_all(element, 'li')]
+                description = ' '.join([item for item in items if item])
+            else:
+                description = backend.text(element).strip()
+
+            if description and len(description) > 20:
+                return description[:1500]
+    return "Descripción no disponible"
+
+
+def _extract_images(matches: SelectorMatches, selectors: List[str], url: str,
+                    backend: ParserBackend) -> List[str]:
+    images = []
+    for selector in selectors:
+        for img in matches.all(selector):
+            src = backend.attr(img, 'src') or backend.attr(img, 'data-src')
+            if src:
+                full_url = urljoin(url, src)
+                if full_url not in images:
+                    images.append(full_url)
+                    if len(images) >= 3:  # Limitar a 3 imágenes
+                        return images
+
+    return images
+
+
+def _extract_rating(matches: SelectorMatches, selectors: List[str], url: str,
+                    backend: ParserBackend) -> str:
+    for selector in selectors:
+        element = matches.first(selector)
+        if element is not None:
+            rating_text = backend.text(element)
+            rating_match = re.search(r'(\d+\.?\d*)\s*de\s*5|(\d+\.?\d*)\s*out\s*of\s*5', rating_text)
+            if rating_match:
+                return rating_match.group(1) or rating_match.group(2)
+    return "Sin calificación"
+
+
+def _extract_reviews_count(matches: SelectorMatches, selectors: List[str], url: str,
+                           backend: ParserBackend) -> str:
+    for selector in selectors:
+        element = matches.first(selector)
+        if element is not None:
+            reviews_text = backend.text(element)
+            reviews_match = re.search(r'([\d,]+)\s*(reviews?|reseñas?)', reviews_text, re.IGNORECASE)
+            if reviews_match:
+                return reviews_match.group(1).replace(',', '')
+    return "0"
+
+
+def _extract_availability(matches: SelectorMatches, selectors: List[str], url: str,
+                          backend: ParserBackend) -> str:
+    for selector in selectors:
+        element = matches.first(selector)
+        if element is not None:
+            availability = backend.text(element).strip()
+            if availability and len(availability) < 100:
+                return availability
+    return "Disponibilidad no especificada"
+
+
+def _extract_features(matches: SelectorMatches, selectors: List[str], url: str,
+                      backend: ParserBackend) -> List[str]:
+    features = []
+    for selector in selectors:
+        for element in matches.all(selector):
+            feature = backend.text(element).strip()
+            if feature and len(feature) > 10 and feature not in features:
+                features.append(feature)
+                if len(features) >= 5:
+                    break
+        if features:
+            break
+
+    return features
+
+
+def _extract_asin(matches: SelectorMatches, selectors: List[str], url: str,
+                  backend: ParserBackend) -> str:
+    asin_match = re.search(r'/dp/([A-Z0-9]{10})', url)
+    if asin_match:
+        return asin_match.group(1)
+
+    for selector in selectors:
+        element = matches.first(selector)
+        if element is not None:
+            asin = backend.attr(element, 'data-asin') or backend.attr(element, 'value')
+            if asin:
+                return asin
+
+    return "ASIN no encontrado"
+
+
+def _extract_category(matches: SelectorMatches, selectors: List[str], url: str,
+                      backend: ParserBackend) -> str:
+    for selector in selectors:
+        element = matches.first(selector)
+        if element is not None:
+            category = backend.text(element).strip()
+            if category:
+                return category[:200]
+    return "Categoría no especificada"
+
+
+def is_blocked_page(content) -> bool:
+    """Si la respuesta es la página de captcha en lugar de la del producto"""
+    if isinstance(content, str):
+        content = content.encode('utf-8', 'ignore')
+    head = content[:20000]
+    return any(marker in head for marker in _BLOCKED_MARKERS)
+
+
+def is_complete(data: Dict[str, Any]) -> bool:
+    """Si la extracción tiene título y precio: solo entonces merece ir a la caché"""
+    return (isinstance(data, dict)
+            and data.get('title') not in (None, '', TITLE_NOT_FOUND)
+            and data.get('price') not in (None, '', PRICE_NOT_FOUND))
+
+
+FIELD_EXTRACTORS: Dict[str, Callable[[SelectorMatches, List[str], str, ParserBackend], Any]] = {
+    'title': _extract_title,
+    'price': _extract_price,
+    'description': _extract_description,
+    'images': _extract_images,
+    'rating': _extract_rating,
+    'reviews_count': _extract_reviews_count,
+    'availability': _extract_availability,
+    'features': _extract_features,
+    'asin': _extract_asin,
+    'category': _extract_category,
+}
+
+
+class ExtractionPlan:
+    """
+    Plan de extracción compilado una sola vez por proceso.
+
+    Los selectores de todos los campos se indexan por el id, clase o tag de
+    su compuesto final, de modo que el árbol se recorre una sola vez y cada
+    elemento solo se compara con los selectores que podrían cumplirse. Cada
+    campo se resuelve después respetando su orden de prioridad.
+
+    El recorrido se limita al contenedor del producto (`root_ids`). Si ahí no
+    aparecen el título o el precio se repite sobre el documento completo,
+    que da el mismo resultado que llamar a `select_one`/`select` selector a
+    selector. Con título y precio dentro del contenedor, los campos
+    opcionales cuyos elementos estén fuera de él quedan sin valor.
+
+    El plan solo usa las operaciones de `ParserBackend`, así que funciona
+    igual con html.parser, lxml o selectolax.
+    """
+
+    def __init__(self, field_selectors: Optional[Dict[str, List[str]]] = None,
+                 root_ids: Tuple[str, ...] = ROOT_IDS,
+                 backend: Optional[ParserBackend] = None):
+        self.field_selectors = field_selectors or FIELD_SELECTORS
+        self.root_ids = root_ids
+        self.backend = backend or get_backend()
+
+        limits: Dict[str, Optional[int]] = {}
+        for field, selectors in self.field_selectors.items():
+            for selector in selectors:
+                limit = None if field in MULTI_MATCH_FIELDS else 1
+                if selector in limits and (limits[selector] is None or limit is None):
+                    limit = None
+                limits[selector] = limit
+
+        self.selectors = list(limits)
+        self.compiled = [_CompiledSelector(selector, limit) for selector, limit in limits.items()]
+
+        # Índice por id, clase, tag o atributo del compuesto final para que
+        # cada elemento solo se compare con los selectores que podrían cumplirse
+        self._by_id: Dict[str, list] = {}
+        self._by_class: Dict[str, list] = {}
+        self._by_tag: Dict[str, list] = {}
+        self._by_attr: list = []
+        self._unindexed: list = []
+        for compiled in self.compiled:
+            if compiled.id:
+                self._by_id.setdefault(compiled.id, []).append(compiled)
+            elif compiled.classes:
+                self._by_class.setdefault(sorted(compiled.classes)[0], []).append(compiled)
+            elif compiled.tag:
+                self._by_tag.setdefault(compiled.tag, []).append(compiled)
+            elif compiled.attrs:
+                self._by_attr.append(compiled)
+            else:
+                self._unindexed.append(compiled)
+
+    def _narrow(self, document):
+        """Contenedor principal del producto, o None si la página no tiene ninguno"""
+        for root_id in self.root_ids:
+            root = self.backend.find_by_id(document, root_id)
+            if root is not None:
+                return root
+        return None
+
+    def _candidates(self, info) -> list:
+        tag, element_id, classes, attrs = info
+        candidates = list(self._unindexed)
+        if element_id in self._by_id:
+            candidates.extend(self._by_id[element_id])
+        for class_name in classes:
+            if class_name in self._by_class:
+                candidates.extend(self._by_class[class_name])
+        if tag in self._by_tag:
+            candidates.extend(self._by_tag[tag])
+        if self._by_attr and attrs:
+            candidates.extend(self._by_attr)
+        return candidates
+
+    def match(self, document, root=None) -> SelectorMatches:
+        """
+        Recorre el árbol una vez (en profundidad, en orden de documento) y
+        agrupa los elementos por selector.
+
+        Con `root` solo se recorre ese elemento (incluido) y sus
+        descendientes; sin él, el documento completo. El recorrido mantiene
+        la pila de ancestros del elemento actual, así que los selectores con
+        combinador descendiente no necesitan volver a subir por el árbol.
+        """
+        backend = self.backend
+        buckets: Dict[str, list] = {}
+        ancestors: list = []
+        stack = [iter([root]) if root is not None else backend.children(backend.root(document))]
+
+        while stack:
+            element = next(stack[-1], None)
+            if element is None:
+                stack.pop()
+                if ancestors:
+                    ancestors.pop()
+                continue
+
+            info = backend.info(element)
+            for compiled in self._candidates(info):
+                bucket = buckets.get(compiled.selector)
+                if bucket is not None and compiled.limit is not None and len(bucket) >= compiled.limit:
+                    continue
+                if compiled.matches(info, ancestors):
+                    buckets.setdefault(compiled.selector, []).append(element)
+
+            ancestors.append(info)
+            stack.append(backend.children(element))
+
+        return SelectorMatches(buckets)
+
+    def extract(self, document, url: str) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """
+        Extrae todos los campos de un documento ya parseado con `self.backend`.
+
+        Returns:
+            Tupla (datos, tiempos en milisegundos por campo). El tiempo del
+            recorrido compartido se reporta como `traversal`.
+        """
+        timings = {}
+
+        start = time.perf_counter()
+        root = self._narrow(document)
+        matches = self.match(document, root)
+        timings['traversal'] = round((time.perf_counter() - start) * 1000, 3)
+        data = self._resolve(matches, url, timings)
+
+        if root is not None and not is_complete(data):
+            # Título o precio fuera del contenedor: se recorre la página entera
+            start = time.perf_counter()
+            matches = self.match(document)
+            timings['traversal'] += round((time.perf_counter() - start) * 1000, 3)
+            data = self._resolve(matches, url, timings)
+
+        return data, timings
+
+    def _resolve(self, matches: SelectorMatches, url: str, timings: Dict[str, float]) -> Dict[str, Any]:
+        """Resuelve cada campo a partir de las coincidencias, por orden de prioridad"""
+        data = {'url': url}
+        for field, selectors in self.field_selectors.items():
+            start = time.perf_counter()
+            data[field] = FIELD_EXTRACTORS[field](matches, selectors, url, self.backend)
+            timings[field] = round((time.perf_counter() - start) * 1000, 3)
+        return data
+
+    def parse_and_extract(self, content, url: str, encoding: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """
+        Parsea el HTML con el backend del plan y extrae los campos
+
+        `encoding` es el charset de la cabecera Content-Type: las páginas de
+        marketplaces como amazon.co.jp no siempre son UTF-8
+        """
+        start = time.perf_counter()
+        document = self.backend.parse(content, encoding)
+        parse_ms = round((time.perf_counter() - start) * 1000, 3)
+
+        data, timings = self.extract(document, url)
+        return data, {'parser': self.backend.name, 'parse': parse_ms, **timings}
+
+
+# Plan por defecto, compilado al importar el módulo con el backend de SCRAPER_PARSER
+DEFAULT_PLAN = ExtractionPlan()
@@ -0,0 +1,166 @@
+"""
+Perfilado opcional de scrape_product y generate_article con cProfile
+Se activa por petición con la cabecera X-Profile (con el valor de
+PROFILE_TOKEN) o por muestreo con PROFILE_SAMPLE_RATE; los perfiles se
+guardan en PROFILE_DIR y se consultan en /api/profiles
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/profiles')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '50'))
+# Sin token no se puede pedir un perfil por cabecera ni consultar los guardados
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+
+HEADER = 'X-Profile'
+RESPONSE_HEADER = 'X-Profile-Id'
+
+_PROFILE_ID = re.compile(r'^(\d+)-([\w.-]+)-([0-9a-f]{8})$')
+
+# Petición en curso: si pidió perfil y los ids de los perfiles que generó.
+# La lista se comparte con las copias del contexto (hilos del lote)
+_requested: ContextVar[bool] = ContextVar('profile_requested', default=False)
+_profile_ids: ContextVar[Optional[List[str]]] = ContextVar('profile_ids', default=None)
+
+# Hasta Python 3.11 cProfile solo ve el hilo que lo activa y desde 3.12 no
+# admite dos perfiladores a la vez: un perfil por proceso y el resto se omite
+_busy = threading.Lock()
+
+
+def authorized(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def _sampled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def request_scope(header_value: Optional[str]) -> Iterator[List[str]]:
+    """
+    Contexto de una petición HTTP: decide una sola vez si se perfila (por
+    cabecera o por muestreo) y recoge los ids de los perfiles que se
+    capturen durante ella, para la cabecera X-Profile-Id
+    """
+    ids: List[str] = []
+    requested_token = _requested.set(authorized(header_value) or _sampled())
+    ids_token = _profile_ids.set(ids)
+    try:
+        yield ids
+    finally:
+        _profile_ids.reset(ids_token)
+        _requested.reset(requested_token)
+
+
+def profiled(name: str):
+    """
+    Perfila el bloque si la petición en curso lo decidió en request_scope o,
+    fuera de una petición (worker de la cola), si sale en el muestreo.
+
+    Desactivado solo cuesta leer dos ContextVar y devolver un nullcontext.
+    Los bloques anidados no generan perfiles propios: quedan dentro del
+    exterior. En código asíncrono el perfil incluye las demás corrutinas que
+    corran en el event loop mientras tanto.
+    """
+    ids = _profile_ids.get()
+    if not (_requested.get() if ids is not None else _sampled()):
+        return nullcontext()
+    return _profile(name, ids)
+
+
+@contextmanager
+def _profile(name: str, ids: Optional[List[str]]) -> Iterator[None]:
+    if not _busy.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profile_id = f'{int(time.time() * 1000)}-{name}-{uuid.uuid4().hex[:8]}'
+    try:
+        profiler.enable()
+    except ValueError:
+        # Otro perfilador ajeno (depurador, cobertura) ya está activo
+        _busy.release()
+        yield
+        return
+
+    # El id se conoce antes de terminar para poder enviarlo en las cabeceras
+    if ids is not None:
+        ids.append(profile_id)
+    try:
+        yield
+    finally:
+        # También se guarda si el bloque falla: las peticiones lentas que
+        # acaban en error son las que más interesa ver
+        profiler.disable()
+        try:
+            _save(profiler, profile_id)
+        finally:
+            _busy.release()
+
+
+def _save(profiler: cProfile.Profile, profile_id: str):
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, profile_id + '.prof'))
+        _prune()
+    except OSError as e:
+        print(f"Error guardando el perfil {profile_id}: {e}")
+
+
+def _prune():
+    """Conserva los PROFILE_MAX_FILES perfiles más recientes"""
+    files = sorted(file for file in os.listdir(PROFILE_DIR) if file.endswith('.prof'))
+    for file in files[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else []:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, file))
+        except OSError:
+            pass
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Ruta del perfil, o None si el id no es válido o no existe"""
+    if not _PROFILE_ID.match(profile_id or ''):
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + '.prof')
+    return path if os.path.exists(path) else None
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Perfiles guardados, del más reciente al más antiguo"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+
+    profiles = []
+    for file in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        match = _PROFILE_ID.match(file[:-len('.prof')]) if file.endswith('.prof') else None
+        if not match:
+            continue
+        profiles.append({
+            'id': match.group(0),
+            'name': match.group(2),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(int(match.group(1)) / 1000)) + 'Z',
+            'bytes': os.path.getsize(os.path.join(PROFILE_DIR, file)),
+        })
+    return profiles
+
+
+def render_profile(path: str, sort: str = 'cumulative', limit: int = 40) -> str:
+    """Resumen en texto de pstats: las `limit` funciones más costosas según `sort`"""
+    stream = io.StringIO()
+    stats = pstats.Stats(path, stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
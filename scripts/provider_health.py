@@ -0,0 +1,191 @@
+"""
+Registro de disponibilidad de proveedores de IA
+Cachea el resultado de las comprobaciones con TTL, las refresca en segundo
+plano y aplica un circuit breaker según los fallos recientes
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+DEFAULT_TTL = float(os.getenv('PROVIDER_HEALTH_TTL', '60'))
+DEFAULT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))
+DEFAULT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _ProviderState:
+    def __init__(self):
+        self.available: Optional[bool] = None
+        self.checked_at = 0.0
+        self.circuit = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.refresh: Optional[asyncio.Task] = None
+
+
+class ProviderHealth:
+    """
+    Estado de salud compartido por todas las peticiones de un proceso.
+
+    La disponibilidad de cada proveedor se obtiene con una comprobación
+    asíncrona registrada con `register_probe` y se cachea `ttl` segundos.
+    Cuando caduca se sigue usando el último valor mientras se refresca en
+    segundo plano, de modo que ninguna petición espera a la comprobación
+    salvo la primera.
+
+    El circuit breaker se abre tras `failure_threshold` fallos seguidos
+    registrados con `record_failure`; mientras está abierto el proveedor no
+    se selecciona, y pasados `reset_timeout` segundos se deja pasar una
+    petición de prueba (half-open) que lo cierra o lo vuelve a abrir.
+
+    Consultar la disponibilidad no reserva nada: la prueba half-open se
+    reclama con `try_acquire` justo antes de llamar al proveedor y, si la
+    llamada se cancela sin resultado, se devuelve con `release`.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.ttl = ttl
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._probes: Dict[str, Callable[[], Awaitable[bool]]] = {}
+        self._states: Dict[str, _ProviderState] = {}
+        self._lock = threading.Lock()
+
+    def register_probe(self, name: str, probe: Callable[[], Awaitable[bool]]):
+        """Registra la comprobación de disponibilidad de un proveedor"""
+        self._probes[name] = probe
+
+    def _state(self, name: str) -> _ProviderState:
+        with self._lock:
+            return self._states.setdefault(name, _ProviderState())
+
+    def _advance(self, state: _ProviderState):
+        """Pasa a half-open el circuito abierto cuyo reset_timeout ya ha vencido (con el lock)"""
+        if state.circuit == OPEN and time.monotonic() - state.opened_at >= self.reset_timeout:
+            state.circuit = HALF_OPEN
+            state.trial_in_flight = False
+
+    def _circuit_allows(self, state: _ProviderState) -> bool:
+        """Si el circuito dejaría pasar una llamada ahora, sin reservar la prueba half-open"""
+        with self._lock:
+            self._advance(state)
+            return state.circuit == CLOSED or (state.circuit == HALF_OPEN and not state.trial_in_flight)
+
+    def try_acquire(self, name: str) -> bool:
+        """
+        Reserva el paso por el circuito justo antes de llamar al proveedor.
+
+        Con el circuito cerrado siempre se concede; en half-open solo a la
+        primera llamada, que queda como prueba hasta record_success,
+        record_failure o release.
+        """
+        state = self._state(name)
+        with self._lock:
+            self._advance(state)
+            if state.circuit == CLOSED:
+                return True
+            if state.circuit == HALF_OPEN and not state.trial_in_flight:
+                state.trial_in_flight = True
+                return True
+            return False
+
+    def release(self, name: str):
+        """Devuelve la prueba half-open de una llamada que terminó sin resultado (cancelada)"""
+        state = self._state(name)
+        with self._lock:
+            state.trial_in_flight = False
+
+    async def _probe(self, name: str, state: _ProviderState) -> bool:
+        probe = self._probes.get(name)
+        try:
+            available = bool(await probe()) if probe else True
+        except Exception:
+            available = False
+        state.available = available
+        state.checked_at = time.monotonic()
+        return available
+
+    def _refresh_in_background(self, name: str, state: _ProviderState):
+        refresh = state.refresh
+        if refresh is not None and not refresh.done():
+            try:
+                if refresh.get_loop() is asyncio.get_running_loop():
+                    return
+            except RuntimeError:
+                pass
+        state.refresh = asyncio.ensure_future(self._probe(name, state))
+
+    async def is_available(self, name: str) -> bool:
+        """
+        Indica si el proveedor puede usarse ahora.
+
+        Solo espera a la comprobación la primera vez; después responde con el
+        valor cacheado y lo refresca en segundo plano al caducar.
+        """
+        state = self._state(name)
+
+        if state.available is None:
+            refresh = state.refresh
+            if refresh is not None and not refresh.done() and refresh.get_loop() is asyncio.get_running_loop():
+                await refresh
+            else:
+                state.refresh = asyncio.ensure_future(self._probe(name, state))
+                await state.refresh
+        elif time.monotonic() - state.checked_at >= self.ttl:
+            self._refresh_in_background(name, state)
+
+        return bool(state.available) and self._circuit_allows(state)
+
+    def record_success(self, name: str):
+        """Registra una llamada correcta: cierra el circuito"""
+        state = self._state(name)
+        with self._lock:
+            state.failures = 0
+            state.circuit = CLOSED
+            state.trial_in_flight = False
+
+    def record_failure(self, name: str):
+        """Registra una llamada fallida y abre el circuito si se supera el umbral"""
+        state = self._state(name)
+        with self._lock:
+            state.failures += 1
+            state.trial_in_flight = False
+            if state.circuit == HALF_OPEN or state.failures >= self.failure_threshold:
+                state.circuit = OPEN
+                state.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Estado actual de cada proveedor, para health checks y depuración"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    'available': state.available,
+                    'checked_seconds_ago': round(now - state.checked_at, 1) if state.checked_at else None,
+                    'circuit': state.circuit,
+                    'consecutive_failures': state.failures,
+                }
+                for name, state in self._states.items()
+            }
+
+
+_default_registry: Optional[ProviderHealth] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_provider_health() -> ProviderHealth:
+    """Registro compartido del proceso (se conserva entre invocaciones en caliente)"""
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = ProviderHealth()
+    return _default_registry
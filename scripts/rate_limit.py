@@ -0,0 +1,254 @@
+"""
+Limitadores de frecuencia compartidos por el scraper y los clientes de IA
+Sustituyen los time.sleep globales por esperas calculadas por host, y
+encolan las llamadas a la IA según sus límites de peticiones y tokens
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+GEMINI_RPM_LIMIT = int(os.getenv('GEMINI_RPM_LIMIT', '15'))
+GEMINI_TPM_LIMIT = int(os.getenv('GEMINI_TPM_LIMIT', '32000'))
+GEMINI_BURST = int(os.getenv('GEMINI_BURST', '3'))
+MAX_QUEUE_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '60'))
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'sqlite')
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', '/tmp/amazon_rate_limits.sqlite3')
+
+
+class HostRateLimiter:
+    """
+    Limita la frecuencia de peticiones por host.
+
+    Cada host tiene su propio "siguiente hueco" disponible; las peticiones a
+    hosts distintos no se bloquean entre sí y las peticiones al mismo host se
+    espacian según `requests_per_second`, con un jitter aleatorio (fracción
+    del intervalo) para no generar un patrón regular detectable.
+    """
+
+    def __init__(self, requests_per_second: Optional[float] = None, jitter: float = 0.25):
+        if requests_per_second is None:
+            requests_per_second = float(os.getenv('SCRAPER_REQUESTS_PER_SECOND', '2'))
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second debe ser mayor que 0")
+
+        self.interval = 1.0 / requests_per_second
+        self.jitter = jitter
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> float:
+        """
+        Bloquea hasta que haya un hueco libre para el host de la URL.
+
+        Returns:
+            Segundos esperados
+        """
+        host = urlparse(url).netloc.lower()
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval * (1 + random.uniform(0, self.jitter))
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class RateLimitExceeded(Exception):
+    """La espera en la cola superaría el máximo permitido"""
+
+    def __init__(self, wait: float, max_wait: float):
+        super().__init__(f"Límite de frecuencia: la espera sería de {wait:.1f}s (máximo {max_wait:.1f}s)")
+        self.wait = wait
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación aproximada de tokens (4 caracteres por token)"""
+    return max(1, len(text or '') // 4)
+
+
+class MemoryBucketStore:
+    """Estado de los buckets en memoria del proceso"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, requests: Dict[str, Tuple[float, float, float]], max_wait: float) -> float:
+        with self._lock:
+            now = time.time()
+            levels = {key: _refill(self._buckets.get(key), capacity, rate, now)
+                      for key, (amount, capacity, rate) in requests.items()}
+            wait = _wait_for(requests, levels)
+            if wait > max_wait:
+                raise RateLimitExceeded(wait, max_wait)
+            for key, (amount, capacity, rate) in requests.items():
+                self._buckets[key] = (levels[key] - amount, now)
+            return wait
+
+    def levels(self, requests: Dict[str, Tuple[float, float, float]]) -> Dict[str, float]:
+        """Nivel actual de cada bucket, sin reservar nada"""
+        with self._lock:
+            now = time.time()
+            return {key: _refill(self._buckets.get(key), capacity, rate, now)
+                    for key, (amount, capacity, rate) in requests.items()}
+
+
+class SQLiteBucketStore:
+    """
+    Estado de los buckets en un fichero SQLite, compartido por todos los
+    procesos de la misma máquina (workers de uvicorn, job workers...).
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, level REAL NOT NULL, '
+                           'updated_at REAL NOT NULL)')
+        self._lock = threading.Lock()
+
+    def reserve(self, requests: Dict[str, Tuple[float, float, float]], max_wait: float) -> float:
+        with self._lock:
+            # BEGIN IMMEDIATE serializa la lectura y la reserva entre procesos
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                levels = {}
+                for key, (amount, capacity, rate) in requests.items():
+                    row = self._conn.execute('SELECT level, updated_at FROM buckets WHERE key = ?',
+                                             (key,)).fetchone()
+                    levels[key] = _refill(row, capacity, rate, now)
+
+                wait = _wait_for(requests, levels)
+                if wait > max_wait:
+                    raise RateLimitExceeded(wait, max_wait)
+
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO buckets (key, level, updated_at) VALUES (?, ?, ?)',
+                    [(key, levels[key] - amount, now) for key, (amount, capacity, rate) in requests.items()]
+                )
+                self._conn.execute('COMMIT')
+                return wait
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def levels(self, requests: Dict[str, Tuple[float, float, float]]) -> Dict[str, float]:
+        """Nivel actual de cada bucket, sin reservar nada"""
+        with self._lock:
+            now = time.time()
+            levels = {}
+            for key, (amount, capacity, rate) in requests.items():
+                row = self._conn.execute('SELECT level, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+                levels[key] = _refill(row, capacity, rate, now)
+            return levels
+
+
+def _refill(state: Optional[Tuple[float, float]], capacity: float, rate: float, now: float) -> float:
+    """Nivel actual de un bucket; un bucket nuevo empieza lleno"""
+    if state is None:
+        return capacity
+    level, updated_at = state
+    return min(capacity, level + (now - updated_at) * rate)
+
+
+def _wait_for(requests: Dict[str, Tuple[float, float, float]], levels: Dict[str, float]) -> float:
+    """Segundos hasta que todos los buckets cubran la reserva"""
+    return max(max(0.0, (amount - levels[key]) / rate) for key, (amount, capacity, rate) in requests.items())
+
+
+class TokenBucketLimiter:
+    """
+    Limitador por peticiones y tokens por minuto (RPM/TPM) con cola acotada.
+
+    Cada llamada reserva una petición y sus tokens estimados. Si los buckets
+    no tienen saldo la reserva se hace igualmente (el nivel queda negativo)
+    y el llamador espera su turno, de modo que una ráfaga se reparte en el
+    tiempo en orden de llegada. Si la espera superaría `max_wait` se lanza
+    RateLimitExceeded sin reservar nada.
+
+    `burst` es la capacidad del bucket de peticiones: cuántas pueden salir
+    seguidas antes de espaciarse a rpm/60 por segundo. Con un valor bajo la
+    ráfaga se suaviza y no se agota la cuota del minuto en el primer segundo.
+    """
+
+    def __init__(self, name: str, rpm: Optional[int], tpm: Optional[int] = None,
+                 burst: Optional[int] = None, max_wait: float = MAX_QUEUE_WAIT, store=None):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.burst = burst or rpm
+        self.max_wait = max_wait
+        self.store = store or MemoryBucketStore()
+
+    def _requests(self, tokens: int) -> Dict[str, Tuple[float, float, float]]:
+        requests = {}
+        if self.rpm:
+            requests[f'{self.name}:rpm'] = (1, self.burst, self.rpm / 60)
+        if self.tpm:
+            # Una sola llamada mayor que el bucket no podría pasar nunca
+            requests[f'{self.name}:tpm'] = (min(tokens, self.tpm), self.tpm, self.tpm / 60)
+        return requests
+
+    def remaining(self) -> Optional[int]:
+        """Peticiones que pueden salir ya sin esperar (None si no hay límite RPM)"""
+        if not self.rpm:
+            return None
+        key = f'{self.name}:rpm'
+        requests = {key: self._requests(0)[key]}
+        return max(0, int(self.store.levels(requests)[key]))
+
+    def wait_time(self, tokens: int = 0) -> float:
+        """Segundos que esperaría una llamada reservada ahora, sin reservarla"""
+        requests = self._requests(tokens)
+        return _wait_for(requests, self.store.levels(requests)) if requests else 0.0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserva un hueco y devuelve los segundos que hay que esperar"""
+        requests = self._requests(tokens)
+        return self.store.reserve(requests, self.max_wait) if requests else 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Espera (bloqueando) hasta que la llamada pueda hacerse"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """Espera sin bloquear el event loop hasta que la llamada pueda hacerse"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+_gemini_limiter: Optional[TokenBucketLimiter] = None
+_gemini_limiter_lock = threading.Lock()
+
+
+def get_gemini_limiter() -> TokenBucketLimiter:
+    """
+    Limitador compartido de las llamadas a Gemini (GEMINI_RPM_LIMIT,
+    GEMINI_TPM_LIMIT, GEMINI_BURST). Con RATE_LIMIT_STORE=sqlite el estado se comparte
+    entre procesos; con 'memory' solo dentro del proceso.
+    """
+    global _gemini_limiter
+    if _gemini_limiter is None:
+        with _gemini_limiter_lock:
+            if _gemini_limiter is None:
+                store = SQLiteBucketStore() if RATE_LIMIT_STORE == 'sqlite' else MemoryBucketStore()
+                _gemini_limiter = TokenBucketLimiter('gemini', GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT,
+                                                     burst=GEMINI_BURST, store=store)
+    return _gemini_limiter
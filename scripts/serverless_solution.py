@@ -3,17 +3,49 @@ Función serverless para Vercel que extrae datos de productos de Amazon
 Compatible con Vercel Functions (Python)
 """
 
+import contextvars
 import json
-import requests
-from bs4 import BeautifulSoup
-import re
+import os
+import sys
 import time
-import random
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler
 
+# Módulos compartidos en scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from html_backends import charset_from_content_type
+from http_pool import get_session
+from instrumentation import record, stage, tracing
+from metrics import SCRAPE_DURATION, instrumented
+from page_cache import field_hashes, fingerprint, get_default_cache
+from product_extraction import DEFAULT_PLAN, is_blocked_page, is_complete
+from profiling import HEADER as PROFILE_HEADER, RESPONSE_HEADER as PROFILE_RESPONSE_HEADER, profiled, request_scope
+from rate_limit import HostRateLimiter
+from single_flight import flight_key, get_single_flight, single_flight_stats
+
+# Límite compartido por todas las instancias del proceso (invocaciones en caliente)
+_host_rate_limiter = HostRateLimiter()
+
+MAX_BATCH_SIZE = int(os.getenv('SCRAPER_MAX_BATCH_SIZE', '500'))
+
+def _observe_scrape(mode, start, result):
+    """Registra la duración del scraping según cómo se resolvió"""
+    if not result['success']:
+        outcome = 'error'
+    elif result.get('coalesced'):
+        outcome = 'coalesced'
+    elif result.get('cached') or result.get('not_modified'):
+        outcome = 'cached'
+    else:
+        outcome = 'fetched'
+    SCRAPE_DURATION.observe(time.perf_counter() - start, mode, outcome)
+
 class AmazonScraper:
-    def __init__(self):
+    def __init__(self, max_workers=None, rate_limiter=None, cache=None):
+        self.max_workers = max_workers or int(os.getenv('SCRAPER_MAX_WORKERS', '8'))
+        self.rate_limiter = rate_limiter or _host_rate_limiter
+        self.cache = cache if cache is not None else get_default_cache()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept-Language': 'en-US,en;q=0.9,es;q=0.8',
@@ -23,32 +55,73 @@ class AmazonScraper:
             'Upgrade-Insecure-Requests': '1',
         }
     
-    def scrape_product(self, url):
-        """Extrae datos de un producto de Amazon"""
+    def scrape_product(self, url, use_cache=True, fields=None):
+        """
+        Extrae datos de un producto de Amazon
+        
+        Las peticiones simultáneas del mismo ASIN y marketplace comparten una
+        sola descarga; las que esperaron se marcan con 'coalesced'.
+        
+        Args:
+            url: URL del producto
+            use_cache: Si se puede servir desde la caché local de páginas
+            fields: Campos que necesita el llamador; la caché solo exige que
+                estos sigan frescos (por defecto, todos)
+        """
+        start = time.perf_counter()
+        key = flight_key(url, 'scrape', use_cache, ','.join(sorted(fields)) if fields else '*')
+        with profiled('scrape_product'):
+            if key is None:
+                result = self._scrape_product(url, use_cache, fields)
+            else:
+                result, shared = get_single_flight('scrape').do(key, self._scrape_product, url, use_cache, fields)
+                if shared:
+                    result = dict(result, coalesced=True)
+        
+        _observe_scrape('scrape', start, result)
+        return result
+    
+    def _scrape_product(self, url, use_cache=True, fields=None):
         try:
-            # Delay para evitar detección
-            time.sleep(random.uniform(0.5, 2))
+            if use_cache and self.cache is not None:
+                cached = self.cache.get(url, fields)
+                if cached is not None:
+                    record('fetch', cache_hit=True)
+                    return {
+                        'success': True,
+                        'data': cached,
+                        'cached': True
+                    }
             
-            response = requests.get(url, headers=self.headers, timeout=15)
-            response.raise_for_status()
+            with stage('fetch'):
+                # Espaciado por host para evitar detección
+                self.rate_limiter.wait(url)
+                
+                response = get_session().get(url, headers=self.headers, timeout=15)
+                response.raise_for_status()
+                record(bytes=len(response.content))
+            
+            if is_blocked_page(response.content):
+                raise Exception('Amazon devolvió la página de captcha (Robot Check)')
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Parseo con el backend configurado (SCRAPER_PARSER) y extracción
+            # de todos los campos en un único recorrido del árbol
+            with stage('parse'):
+                data, extraction_timings = DEFAULT_PLAN.parse_and_extract(
+                    response.content, url, charset_from_content_type(response.headers.get('Content-Type')))
+            
+            # Una extracción sin título o precio no se cachea: sus campos
+            # estables se servirían durante todo su TTL
+            if self.cache is not None and is_complete(data):
+                self.cache.put(url, response.content, data,
+                               etag=response.headers.get('ETag'),
+                               last_modified=response.headers.get('Last-Modified'))
             
             return {
                 'success': True,
-                'data': {
-                    'url': url,
-                    'title': self._get_title(soup),
-                    'price': self._get_price(soup),
-                    'description': self._get_description(soup),
-                    'images': self._get_images(soup, url),
-                    'rating': self._get_rating(soup),
-                    'reviews_count': self._get_reviews_count(soup),
-                    'availability': self._get_availability(soup),
-                    'features': self._get_features(soup),
-                    'asin': self._get_asin(url, soup),
-                    'category': self._get_category(soup)
-                }
+                'data': data,
+                'cached': False,
+                'extraction_timings': extraction_timings
             }
             
         except Exception as e:
@@ -57,148 +130,162 @@ class AmazonScraper:
                 'error': f'Error al extraer datos: {str(e)}'
             }
     
-    def _get_title(self, soup):
-        selectors = ['#productTitle', '.product-title', 'h1.a-size-large', 'h1 span']
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element:
-                return element.get_text().strip()
-        return "Título no encontrado"
-    
-    def _get_price(self, soup):
-        selectors = [
-            '.a-price-whole',
-            '.a-price .a-offscreen',
-            '#priceblock_dealprice',
-            '#priceblock_ourprice',
-            '.a-price-range'
-        ]
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element:
-                price_text = element.get_text().strip()
-                price_clean = re.sub(r'[^\d.,]', '', price_text)
-                if price_clean:
-                    return price_clean
-        return "Precio no disponible"
-    
-    def _get_description(self, soup):
-        selectors = [
-            '#feature-bullets ul',
-            '#productDescription',
-            '.a-unordered-list.a-vertical.a-spacing-mini'
-        ]
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element:
-                if element.name == 'ul':
-                    items = element.find_all('li')
-                    description = ' '.join([item.get_text().strip() for item in items if item.get_text().strip()])
-                else:
-                    description = element.get_text().strip()
-                
-                if description and len(description) > 20:
-                    return description[:1500]
-        return "Descripción no disponible"
-    
-    def _get_images(self, soup, base_url):
-        images = []
-        selectors = ['#landingImage', '.a-dynamic-image', '#imgTagWrapperId img']
-        
-        for selector in selectors:
-            elements = soup.select(selector)
-            for img in elements:
-                src = img.get('src') or img.get('data-src')
-                if src:
-                    full_url = urljoin(base_url, src)
-                    if full_url not in images:
-                        images.append(full_url)
+    def scrape_many(self, urls, use_cache=True, fields=None):
+        """
+        Extrae datos de varios productos en paralelo.
+
+        La concurrencia está limitada por `max_workers` y la frecuencia por
+        host la controla el rate limiter. Los resultados se devuelven en el
+        mismo orden que las URLs de entrada.
+        """
+        urls = list(urls)
+        if not urls:
+            return []
         
-        return images[:3]  # Limitar a 3 imágenes
-    
-    def _get_rating(self, soup):
-        selectors = ['.a-icon-alt', '.a-star-5 .a-icon-alt']
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element:
-                rating_text = element.get_text()
-                rating_match = re.search(r'(\d+\.?\d*)\s*de\s*5|(\d+\.?\d*)\s*out\s*of\s*5', rating_text)
-                if rating_match:
-                    return rating_match.group(1) or rating_match.group(2)
-        return "Sin calificación"
-    
-    def _get_reviews_count(self, soup):
-        selectors = ['#acrCustomerReviewText', '.a-link-normal .a-size-base']
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element:
-                reviews_text = element.get_text()
-                reviews_match = re.search(r'([\d,]+)\s*(reviews?|reseñas?)', reviews_text, re.IGNORECASE)
-                if reviews_match:
-                    return reviews_match.group(1).replace(',', '')
-        return "0"
+        workers = min(self.max_workers, len(urls))
+        # Cada hilo con una copia del contexto: la decisión de perfilar es la de la petición
+        contexts = [contextvars.copy_context() for _ in urls]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda context, url: context.run(self.scrape_product, url, use_cache, fields),
+                                     contexts, urls))
     
-    def _get_availability(self, soup):
-        selectors = ['#availability span', '.a-color-success', '.a-color-state']
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element:
-                availability = element.get_text().strip()
-                if availability and len(availability) < 100:
-                    return availability
-        return "Disponibilidad no especificada"
-    
-    def _get_features(self, soup):
-        features = []
-        selectors = ['#feature-bullets li span', '.a-unordered-list.a-vertical li span']
+    def refresh_product(self, url):
+        """
+        Comprueba si un producto ha cambiado desde la última extracción.
         
-        for selector in selectors:
-            elements = soup.select(selector)
-            for element in elements:
-                feature = element.get_text().strip()
-                if feature and len(feature) > 10 and feature not in features:
-                    features.append(feature)
-                    if len(features) >= 5:
-                        break
-            if features:
-                break
+        Envía las cabeceras condicionales (If-None-Match / If-Modified-Since)
+        guardadas en la caché; si Amazon responde 304 no se parsea nada. Si
+        llega una página nueva se comparan los hashes de los campos extraídos
+        con la última versión y solo se informan los campos que cambiaron,
+        para que el artículo se regenere únicamente cuando hace falta.
+        """
+        start = time.perf_counter()
+        key = flight_key(url, 'refresh')
+        if key is None:
+            result = self._refresh_product(url)
+        else:
+            result, shared = get_single_flight('scrape').do(key, self._refresh_product, url)
+            if shared:
+                result = dict(result, coalesced=True)
         
-        return features
+        _observe_scrape('refresh', start, result)
+        return result
     
-    def _get_asin(self, url, soup):
-        asin_match = re.search(r'/dp/([A-Z0-9]{10})', url)
-        if asin_match:
-            return asin_match.group(1)
-        
-        selectors = ['[data-asin]', '#ASIN']
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element:
-                asin = element.get('data-asin') or element.get('value')
-                if asin:
-                    return asin
-        
-        return "ASIN no encontrado"
+    def _refresh_product(self, url):
+        try:
+            snapshot = self.cache.get_snapshot(url) if self.cache is not None else None
+            
+            headers = dict(self.headers)
+            if snapshot and snapshot['etag']:
+                headers['If-None-Match'] = snapshot['etag']
+            if snapshot and snapshot['last_modified']:
+                headers['If-Modified-Since'] = snapshot['last_modified']
+            
+            with stage('fetch'):
+                self.rate_limiter.wait(url)
+                response = get_session().get(url, headers=headers, timeout=15)
+                record(bytes=len(response.content))
+            
+            if response.status_code == 304 and snapshot:
+                record('fetch', cache_hit=True)
+                self.cache.touch(url)
+                return {
+                    'success': True,
+                    'changed': False,
+                    'not_modified': True,
+                    'changed_fields': {},
+                    'data': snapshot['data']
+                }
+            
+            response.raise_for_status()
+            if is_blocked_page(response.content):
+                raise Exception('Amazon devolvió la página de captcha (Robot Check)')
+            with stage('parse'):
+                data, extraction_timings = DEFAULT_PLAN.parse_and_extract(
+                    response.content, url, charset_from_content_type(response.headers.get('Content-Type')))
+            # Compararla con la versión guardada marcaría como cambiados campos que
+            # simplemente no se han podido leer
+            if not is_complete(data):
+                raise Exception('Extracción incompleta: falta el título o el precio')
+            
+            changed_fields = {}
+            if snapshot:
+                new_hashes = field_hashes(data)
+                if fingerprint(new_hashes) != snapshot['fingerprint']:
+                    old_data = snapshot['data']
+                    changed_fields = {
+                        field: {'old': old_data.get(field), 'new': data[field]}
+                        for field, value_hash in new_hashes.items()
+                        if snapshot['field_hashes'].get(field) != value_hash
+                    }
+            
+            if self.cache is not None:
+                self.cache.put(url, response.content, data,
+                               etag=response.headers.get('ETag'),
+                               last_modified=response.headers.get('Last-Modified'))
+            
+            return {
+                'success': True,
+                'changed': snapshot is None or bool(changed_fields),
+                'not_modified': False,
+                'first_snapshot': snapshot is None,
+                'changed_fields': changed_fields,
+                'data': data,
+                'extraction_timings': extraction_timings
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Error al refrescar datos: {str(e)}'
+            }
     
-    def _get_category(self, soup):
-        selectors = ['#wayfinding-breadcrumbs_feature_div', '.a-breadcrumb']
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element:
-                category = element.get_text().strip()
-                if category:
-                    return category[:200]
-        return "Categoría no especificada"
+    def refresh_many(self, urls):
+        """Versión en paralelo de refresh_product, en el orden de entrada"""
+        urls = list(urls)
+        if not urls:
+            return []
+        
+        workers = min(self.max_workers, len(urls))
+        # Igual que scrape_many: cada hilo con una copia del contexto de la petición
+        contexts = [contextvars.copy_context() for _ in urls]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda context, url: context.run(self.refresh_product, url),
+                                     contexts, urls))
 
+@instrumented('scrape-amazon')
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Maneja las peticiones POST para scraping de Amazon"""
+        # Con X-Profile (o por muestreo) se perfila la petición entera, serialización incluida
+        with request_scope(self.headers.get(PROFILE_HEADER)) as self._profile_ids, profiled('scrape-amazon'):
+            self._handle_post()
+    
+    def _handle_post(self):
         try:
             # Leer el cuerpo de la petición
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             data = json.loads(post_data.decode('utf-8'))
             
+            # 'scrape' (por defecto) o 'refresh' para detectar cambios
+            mode = data.get('mode', 'scrape')
+            if mode not in ('scrape', 'refresh'):
+                self._send_error(400, f'Modo no soportado: {mode}')
+                return
+            
+            # Nombres de campo: un texto suelto o un dict harían clasificar sus
+            # caracteres o claves como campos en la caché
+            fields = data.get('fields')
+            if fields is not None and not (isinstance(fields, list) and all(isinstance(field, str) for field in fields)):
+                self._send_error(400, 'fields debe ser una lista de nombres de campo')
+                return
+            
+            # Petición por lotes
+            if 'urls' in data:
+                self._handle_batch(data['urls'], mode, data.get('use_cache', True), data.get('fields'))
+                return
+            
             # Validar que se proporcione la URL
             if 'url' not in data:
                 self._send_error(400, 'URL del producto es requerida')
@@ -213,7 +300,12 @@ class handler(BaseHTTPRequestHandler):
             
             # Realizar el scraping
             scraper = AmazonScraper()
-            result = scraper.scrape_product(url)
+            with tracing('scrape-amazon', url=url, mode=mode) as trace:
+                if mode == 'refresh':
+                    result = scraper.refresh_product(url)
+                else:
+                    result = scraper.scrape_product(url, data.get('use_cache', True), data.get('fields'))
+            result = dict(result, timings=trace.as_dict())
             
             # Enviar respuesta
             self._send_response(200, result)
@@ -223,12 +315,50 @@ class handler(BaseHTTPRequestHandler):
         except Exception as e:
             self._send_error(500, f'Error interno: {str(e)}')
     
+    def _handle_batch(self, urls, mode='scrape', use_cache=True, fields=None):
+        """Procesa una lista de URLs en una sola petición"""
+        if not isinstance(urls, list) or not urls:
+            self._send_error(400, 'urls debe ser una lista no vacía')
+            return
+        
+        if len(urls) > MAX_BATCH_SIZE:
+            self._send_error(400, f'Máximo {MAX_BATCH_SIZE} URLs por petición')
+            return
+        
+        invalid = [url for url in urls if not isinstance(url, str) or 'amazon.' not in url]
+        if invalid:
+            self._send_error(400, f'Todas las URLs deben ser de Amazon: {invalid[:5]}')
+            return
+        
+        scraper = AmazonScraper()
+        if mode == 'refresh':
+            results = scraper.refresh_many(urls)
+            summary = {
+                'changed': [url for url, result in zip(urls, results) if result.get('changed')]
+            }
+        else:
+            results = scraper.scrape_many(urls, use_cache, fields)
+            summary = {
+                'cached': sum(1 for result in results if result.get('cached')),
+                'coalesced': sum(1 for result in results if result.get('coalesced'))
+            }
+        
+        self._send_response(200, {
+            'success': True,
+            'mode': mode,
+            'total': len(results),
+            'succeeded': sum(1 for result in results if result['success']),
+            **summary,
+            'results': results
+        })
+    
     def do_GET(self):
         """Maneja las peticiones GET para health check"""
         health_data = {
             'status': 'healthy',
             'service': 'Amazon Product Scraper',
-            'version': '1.0.0'
+            'version': '1.0.0',
+            'single_flight': single_flight_stats()
         }
         self._send_response(200, health_data)
     
@@ -239,6 +369,8 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        if getattr(self, '_profile_ids', None):
+            self.send_header(PROFILE_RESPONSE_HEADER, ', '.join(self._profile_ids))
         self.end_headers()
         
         response = json.dumps(data, ensure_ascii=False, indent=2)
@@ -0,0 +1,138 @@
+"""
+Agrupación de llamadas concurrentes por clave (single-flight)
+Cuando varias peticiones piden a la vez el mismo producto, solo la primera
+hace el scraping o la generación; las demás esperan y reciben su resultado
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from page_cache import product_key
+
+
+def flight_key(url: str, *extra: Any) -> Optional[str]:
+    """
+    Clave por ASIN y marketplace, más los parámetros que cambian el resultado.
+
+    Returns:
+        None si la URL no es de un producto (no se agrupa)
+    """
+    key = product_key(url)
+    if key is None:
+        return None
+    return ':'.join([key[0], key[1]] + [str(value) for value in extra])
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Ejecuta una sola vez las llamadas concurrentes con la misma clave.
+
+    `do` sirve para código con hilos (el scraper) y `do_async` para
+    corrutinas (los generadores). Solo se agrupan las llamadas que coinciden
+    en el tiempo: en cuanto la primera termina, la clave se libera y la
+    siguiente vuelve a ejecutarse (para reutilizar resultados ya están las
+    cachés). Las excepciones se propagan a todos los que esperaban.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._sync: Dict[str, _Call] = {}
+        self._async: Dict[str, asyncio.Future] = {}
+
+    def do(self, key: str, func: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Ejecuta `func(*args, **kwargs)` o espera a la ejecución en curso.
+
+        Returns:
+            Tupla (resultado, compartido) donde compartido indica que el
+            resultado es el de otra llamada
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._sync.get(key)
+            leader = call is None
+            if leader:
+                call = self._sync[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._sync.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Tuple[Any, bool]:
+        """Versión asíncrona de `do`: los que esperan comparten la misma tarea"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.calls += 1
+            task = self._async.get(key)
+            # Las tareas solo pueden esperarse desde su propio event loop
+            leader = task is None or task.done() or task.get_loop() is not loop
+            if leader:
+                task = self._async[key] = asyncio.ensure_future(func(*args, **kwargs))
+                task.add_done_callback(lambda finished: self._forget(key, finished))
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        # shield: cancelar a uno de los que esperan no cancela la ejecución compartida
+        return await asyncio.shield(task), not leader
+
+    def _forget(self, key: str, task: asyncio.Future):
+        with self._lock:
+            if self._async.get(key) is task:
+                del self._async[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._sync) + len(self._async),
+            }
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Grupo compartido del proceso para un tipo de operación ('scrape', 'generate_article'...)"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    """Contadores de todos los grupos, para health checks y métricas"""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
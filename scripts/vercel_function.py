@@ -5,10 +5,15 @@ para generar artículos de productos de Amazon
 
 import json
 import os
+import sys
 import asyncio
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from instrumentation import record, stage, tracing
+
 # Configurar variables de entorno para OpenAI
 os.environ['OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY', 'sk-placeholder')
 os.environ['OPENAI_API_BASE'] = os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')
@@ -80,12 +85,17 @@ class AmazonArticleAPI(BaseHTTPRequestHandler):
                 }
             
             # Generar artículo (versión simplificada para demo)
-            article_data = self._generate_demo_article(product_url, affiliate_link)
+            with tracing('vercel-function', product_url=product_url) as trace:
+                with stage('generate'):
+                    article_data = self._generate_demo_article(product_url, affiliate_link)
+                    record(bytes=len(article_data['content'].encode('utf-8')))
+            timings = trace.as_dict()
             
             return {
                 'success': True,
                 'article': article_data,
-                'processing_time': '45 segundos',
+                'processing_time': f"{timings['total_ms'] / 1000:.2f} segundos",
+                'timings': timings,
                 'status': 'completed'
             }
             
@@ -0,0 +1,323 @@
+"""
+Procesamiento de las peticiones del webhook de Make.com
+Compartido por api/webhook.py, que atiende las peticiones síncronas, y por
+scripts/job_worker.py, que procesa las encoladas
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from http_pool import get_session
+from instrumentation import stage, tracing
+from wordpress_publisher import get_wordpress_publisher
+
+# Filas procesadas en paralelo y tamaño máximo de un lote
+BATCH_MAX_WORKERS = int(os.getenv('WEBHOOK_BATCH_WORKERS', '8'))
+MAX_BATCH_ROWS = int(os.getenv('WEBHOOK_MAX_BATCH_ROWS', '500'))
+
+# Hosts a los que se envía el resultado de los lotes con callback_url (solo
+# https): los webhooks de Make.com/Integromat. Cualquier otra URL se rechaza
+# para que el endpoint no sirva de relay de peticiones (SSRF)
+CALLBACK_HOSTS = frozenset(
+    host.strip().lower()
+    for host in os.getenv(
+        'WEBHOOK_CALLBACK_HOSTS',
+        'hook.integromat.com,hook.make.com,hook.eu1.make.com,hook.eu2.make.com,hook.us1.make.com,hook.us2.make.com'
+    ).split(',')
+    if host.strip()
+)
+
+# Columnas de la hoja (docs/google_sheets_structure.md): A = timestamp,
+# B = product_url, C = affiliate_link, D = status
+SHEET_COLUMNS = ('timestamp', 'product_url', 'affiliate_link', 'status')
+# Celda inicial de la parte de celdas de un rango A1 (B2:D201, B:D, $B$2...)
+_RANGE_START_RE = re.compile(r'^\$?([A-Z]+)\$?(\d*)(?=:|$)', re.IGNORECASE)
+
+
+def is_valid_amazon_url(url):
+    """Valida si es una URL válida de Amazon"""
+    if not url or not isinstance(url, str):
+        return False
+
+    amazon_domains = [
+        'amazon.com', 'amazon.es', 'amazon.co.uk', 'amazon.de',
+        'amazon.fr', 'amazon.it', 'amazon.ca', 'amazon.com.mx'
+    ]
+
+    return any(domain in url for domain in amazon_domains) and '/dp/' in url
+
+
+def is_valid_affiliate_link(link):
+    """Valida si es un enlace de afiliado válido"""
+    if not link or not isinstance(link, str):
+        return False
+
+    return 'amzn.to' in link or ('amazon.' in link and 'tag=' in link)
+
+
+def is_allowed_callback_url(url):
+    """Valida que callback_url sea https y apunte a un host de WEBHOOK_CALLBACK_HOSTS"""
+    if not url or not isinstance(url, str):
+        return False
+
+    parsed = urlparse(url)
+    return parsed.scheme == 'https' and (parsed.hostname or '') in CALLBACK_HOSTS and not parsed.username
+
+
+def process_article_request(data, publish=True):
+    """
+    Procesa solicitud de generación de artículo
+
+    La traza recoge las etapas que se ejecuten dentro (scraping, generación,
+    publicación) y su resumen se devuelve en `timings`. Con `publish=False`
+    el artículo no se publica: process_batch_request publica todos los del
+    lote juntos.
+    """
+    with tracing('webhook', sheet_id=data.get('sheet_id'), row_number=data.get('row_number')) as trace:
+        result = _process_article_request(data)
+        if publish:
+            publish_articles([(data, result)])
+    timings = trace.as_dict()
+    if result.get('success'):
+        result['data']['processing_time'] = f"{timings['total_ms'] / 1000:.2f} segundos"
+    result['timings'] = timings
+    return result
+
+
+def _process_article_request(data):
+    try:
+        product_url = data['product_url']
+        affiliate_link = data['affiliate_link']
+        row_number = data.get('row_number')
+        sheet_id = data.get('sheet_id')
+
+        # Validar URLs
+        if not is_valid_amazon_url(product_url):
+            return {
+                'success': False,
+                'error': 'URL de Amazon inválida',
+                'row_number': row_number
+            }
+
+        if not is_valid_affiliate_link(affiliate_link):
+            return {
+                'success': False,
+                'error': 'Enlace de afiliado inválido',
+                'row_number': row_number
+            }
+
+        # Aquí se integraría con el generador de artículos
+        # Por ahora, simulamos el procesamiento
+
+        # En un entorno real, esto llamaría a:
+        # 1. /api/scrape-amazon para extraer datos
+        # 2. /api/generate-article para crear el artículo
+        # 3. WordPress API para publicar
+
+        # Respuesta simulada
+        result = {
+            'success': True,
+            'message': 'Artículo procesado exitosamente',
+            'data': {
+                'product_url': product_url,
+                'affiliate_link': affiliate_link,
+                'article_title': f'Análisis del producto Amazon',
+                'article_url': f'https://myamzdeals.shop/producto-{row_number}',
+                'word_count': 1850,
+                'seo_score': 8
+            },
+            'row_number': row_number,
+            'sheet_id': sheet_id,
+            'processed_at': datetime.utcnow().isoformat() + 'Z'
+        }
+
+        return result
+
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f'Error procesando artículo: {str(e)}',
+            'row_number': data.get('row_number')
+        }
+
+
+def sheet_range_start(sheet_range):
+    """
+    Columna (0 = A) y fila en las que empieza un rango A1
+
+    Raises:
+        ValueError: si el rango empieza después de la columna de product_url
+    """
+    sheet_range = sheet_range or ''
+    if '!' in sheet_range:
+        cells = sheet_range.rsplit('!', 1)[1]
+    else:
+        # Sin '!' y sin ':' es el nombre de una hoja completa
+        cells = sheet_range if ':' in sheet_range else ''
+    match = _RANGE_START_RE.match(cells)
+    if not match:
+        return 0, 1
+
+    column = 0
+    for letter in match.group(1).upper():
+        column = column * 26 + ord(letter) - ord('A') + 1
+    column -= 1
+    if column > SHEET_COLUMNS.index('product_url'):
+        raise ValueError(f'El rango {sheet_range} debe incluir la columna B (product_url)')
+    return column, int(match.group(2) or 1)
+
+
+def publish_articles(processed):
+    """
+    Publica en WordPress los artículos ya generados, en una sola llamada a
+    publish_many (lotes de /batch/v1)
+
+    `processed` son pares (datos de la fila, resultado). Solo se publican las
+    filas correctas que traen `article_content` (generado antes, p. ej. con
+    /api/generate-article en el escenario de Make.com); su resultado recibe
+    la URL real de la entrada o pasa a error si WordPress la rechaza.
+    """
+    pending = [(data, result) for data, result in processed
+               if result.get('success') and data.get('article_content') and isinstance(data['article_content'], str)]
+    if not pending:
+        return
+    publisher = get_wordpress_publisher()
+    if not publisher.configured:
+        return
+
+    with stage('publish'):
+        published = publisher.publish_many([
+            {
+                'title': data.get('article_title') or result['data']['article_title'],
+                'content': data['article_content'],
+                'images': data.get('images') or [],
+            }
+            for data, result in pending
+        ])
+
+    for (data, result), post in zip(pending, published):
+        if post['success']:
+            result['data'].update(article_url=post['link'], post_id=post['id'])
+        else:
+            result.update(success=False, error=f"Error al publicar en WordPress: {post['error']}")
+
+
+def read_sheet_rows(sheet_id, sheet_range):
+    """
+    Lee las filas de un rango de Google Sheets (API v4 con GOOGLE_SHEETS_API_KEY)
+
+    Los valores se asignan a SHEET_COLUMNS a partir de la columna en la que
+    empieza el rango, de modo que B2:D201 y A2:D201 leen lo mismo.
+    """
+    first_column, first_row = sheet_range_start(sheet_range)
+    api_key = os.getenv('GOOGLE_SHEETS_API_KEY')
+    if not api_key:
+        raise ValueError('GOOGLE_SHEETS_API_KEY no configurada')
+
+    response = get_session().get(
+        f'https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}/values/{sheet_range}',
+        params={'key': api_key, 'majorDimension': 'ROWS'},
+        timeout=30
+    )
+    response.raise_for_status()
+
+    rows = []
+    for offset, values in enumerate(response.json().get('values', [])):
+        row = dict(zip(SHEET_COLUMNS[first_column:], values))
+        # Las filas ya completadas no se vuelven a procesar
+        if not row.get('product_url') or row.get('status') == 'Completado':
+            continue
+        row['row_number'] = first_row + offset
+        rows.append(row)
+    return rows
+
+
+def process_batch_request(data, on_progress=None):
+    """
+    Procesa varias filas de la hoja en una sola invocación
+
+    Las filas se reparten en un pool de hilos con concurrencia acotada; el
+    fallo de una fila no afecta a las demás y cada una devuelve su propio
+    resultado, en el mismo orden en que llegaron. `on_progress`, si se
+    indica, recibe el número de filas procesadas tras cada una. Los
+    artículos del lote se publican al final en lotes de /batch/v1.
+    """
+    start = time.perf_counter()
+    batch_id = data.get('batch_id') or uuid.uuid4().hex
+    sheet_id = data.get('sheet_id')
+
+    try:
+        rows = data.get('rows')
+        if rows is None:
+            rows = read_sheet_rows(sheet_id, data['sheet_range'])
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f'Error leyendo la hoja: {str(e)}',
+            'batch_id': batch_id
+        }
+
+    # Un rango de hoja mayor que el límite se procesa en parte y se indica en el resultado
+    skipped_rows = max(0, len(rows) - MAX_BATCH_ROWS)
+    rows = rows[:MAX_BATCH_ROWS]
+    max_workers = max(1, min(int(data.get('max_workers') or BATCH_MAX_WORKERS), BATCH_MAX_WORKERS * 4))
+
+    def process_row(row):
+        if not isinstance(row, dict) or not row.get('product_url') or not row.get('affiliate_link'):
+            return {
+                'success': False,
+                'error': 'Fila sin product_url o affiliate_link',
+                'row_number': row.get('row_number') if isinstance(row, dict) else None
+            }
+        return process_article_request(dict(row, sheet_id=row.get('sheet_id', sheet_id)), publish=False)
+
+    results = []
+    if rows:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(rows))) as executor:
+            for result in executor.map(process_row, rows):
+                results.append(result)
+                if on_progress:
+                    on_progress({'total': len(rows), 'processed': len(results)})
+        publish_articles([(row, result) for row, result in zip(rows, results) if isinstance(row, dict)])
+
+    succeeded = sum(1 for result in results if result.get('success'))
+    summary = {
+        'success': succeeded == len(results) and not skipped_rows,
+        'partial': 0 < succeeded < len(results) or bool(skipped_rows and succeeded),
+        'batch_id': batch_id,
+        'sheet_id': sheet_id,
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'truncated': bool(skipped_rows),
+        'skipped_rows': skipped_rows,
+        'results': results,
+        'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+        'processed_at': datetime.utcnow().isoformat() + 'Z'
+    }
+    if skipped_rows:
+        summary['error'] = (f'El lote supera WEBHOOK_MAX_BATCH_ROWS ({MAX_BATCH_ROWS}): '
+                            f'{skipped_rows} filas sin procesar; divide el rango')
+    return summary
+
+
+def send_callback(callback_url, result):
+    """Envía el resultado a la URL de callback de Make.com; los errores solo se registran"""
+    if not is_allowed_callback_url(callback_url):
+        print(f"callback_url no permitida (WEBHOOK_CALLBACK_HOSTS): {callback_url}")
+        return False
+    try:
+        # Sin redirecciones: el host permitido no puede reenviar la petición a otro
+        get_session().post(callback_url, json=result, timeout=30, allow_redirects=False).raise_for_status()
+        return True
+    except Exception as e:
+        print(f"Error enviando el resultado a callback_url: {e}")
+        return False
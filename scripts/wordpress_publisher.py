@@ -0,0 +1,245 @@
+"""
+Publicación en WordPress mediante la API REST
+Agrupa la creación de entradas en peticiones a /batch/v1 y sube las
+imágenes de los productos en paralelo, reutilizando una sesión autenticada
+con su propio pool de conexiones
+"""
+
+import contextvars
+import logging
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from http_pool import get_session
+from instrumentation import record
+from metrics import WORDPRESS_DURATION
+
+# WordPress admite como máximo 25 peticiones por lote por defecto
+BATCH_SIZE = int(os.getenv('WORDPRESS_BATCH_SIZE', '25'))
+MEDIA_WORKERS = int(os.getenv('WORDPRESS_MEDIA_WORKERS', '8'))
+CONNECT_TIMEOUT = float(os.getenv('WORDPRESS_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('WORDPRESS_READ_TIMEOUT', '30'))
+# Subir la imagen del producto como imagen destacada (más peticiones por artículo)
+UPLOAD_IMAGES = os.getenv('WORDPRESS_UPLOAD_IMAGES', 'false').lower() == 'true'
+
+logger = logging.getLogger(__name__)
+
+
+class WordPressError(Exception):
+    """WordPress rechazó la petición o no respondió"""
+
+
+class BatchNotSupported(WordPressError):
+    """El sitio no tiene /batch/v1 (WordPress < 5.6)"""
+
+
+class WordPressPublisher:
+    """
+    Cliente de publicación para la API REST de WordPress (wp/v2).
+
+    Usa una sesión propia con las credenciales (application password) y un
+    pool de conexiones al sitio, separada de la sesión del scraper para no
+    enviar nunca la autenticación a otros hosts. Las entradas se crean en
+    lotes de `batch_size` mediante /batch/v1; si el sitio no lo soporta
+    (WordPress < 5.6) se crean una a una en paralelo. Las imágenes se
+    descargan y suben en paralelo, una sola vez por URL, y la primera de
+    cada artículo se usa como imagen destacada.
+    """
+
+    def __init__(self, api_url: Optional[str] = None, username: Optional[str] = None,
+                 password: Optional[str] = None, batch_size: int = BATCH_SIZE,
+                 media_workers: int = MEDIA_WORKERS, upload_images: bool = UPLOAD_IMAGES):
+        self.api_url = (api_url or os.getenv('WORDPRESS_API_URL') or '').rstrip('/')
+        self.username = username or os.getenv('WORDPRESS_USERNAME')
+        self.password = password or os.getenv('WORDPRESS_PASSWORD')
+        self.batch_size = max(1, batch_size)
+        self.media_workers = max(1, media_workers)
+        self.upload_images = upload_images
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        self.requests_sent = 0
+
+        # https://sitio/wp-json/wp/v2 -> https://sitio/wp-json y /wp/v2
+        root, _, namespace = self.api_url.partition('/wp/')
+        self.rest_root = root
+        self.namespace = f'/wp/{namespace}' if namespace else '/wp/v2'
+        self.batch_supported: Optional[bool] = None
+
+        self.session = requests.Session()
+        self.session.auth = (self.username, self.password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.media_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return all([self.api_url, self.username, self.password])
+
+    def _request(self, operation: str, method: str, url: str, **kwargs) -> requests.Response:
+        """Petición autenticada; `operation` (post, batch, media) etiqueta su latencia"""
+        with self._lock:
+            self.requests_sent += 1
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            WORDPRESS_DURATION.observe(time.perf_counter() - start, operation, 'error')
+            raise
+        WORDPRESS_DURATION.observe(time.perf_counter() - start, operation,
+                                   'error' if response.status_code >= 400 else 'success')
+        record(bytes=len(response.request.body or b'') + len(response.content))
+        return response
+
+    def publish(self, title: str, content: str, images: Optional[List[str]] = None,
+                status: str = 'publish', **fields) -> Dict[str, Any]:
+        """Publica un artículo; equivale a publish_many con una sola entrada"""
+        return self.publish_many([dict(fields, title=title, content=content, images=images or [],
+                                       status=status)])[0]
+
+    def publish_many(self, articles: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Publica varios artículos.
+
+        Cada artículo es un dict con `title` y `content` y, opcionalmente,
+        `images` (URLs de las imágenes del producto), `status`, `excerpt`,
+        `categories`, `tags`... (cualquier campo de /wp/v2/posts).
+
+        Returns:
+            Un resultado por artículo, en el mismo orden: success, id y link,
+            o error
+        """
+        articles = list(articles)
+        if not self.configured:
+            return [{'success': False, 'error': 'WordPress no configurado'} for _ in articles]
+
+        media = self.upload_media(
+            url for article in articles for url in (article.get('images') or [])[:1]
+        ) if self.upload_images else {}
+
+        posts = []
+        for article in articles:
+            post = {key: value for key, value in article.items() if key != 'images'}
+            post.setdefault('status', 'publish')
+            featured = next((media[url] for url in (article.get('images') or [])[:1] if media.get(url)), None)
+            if featured:
+                post.setdefault('featured_media', featured)
+            posts.append(post)
+
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(posts), self.batch_size):
+            results.extend(self._create_posts(posts[start:start + self.batch_size]))
+        return results
+
+    def _create_posts(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Crea las entradas con /batch/v1 o, si el sitio no lo tiene, una a una en paralelo"""
+        if len(posts) == 1 or self.batch_supported is False:
+            return self._map(self._create_post, posts)
+
+        try:
+            return self._create_posts_batch(posts)
+        except BatchNotSupported as e:
+            logger.warning("WordPress sin /batch/v1, publicando una a una: %s", e)
+            return self._map(self._create_post, posts)
+        except WordPressError as e:
+            return [{'success': False, 'error': str(e)} for _ in posts]
+
+    def _map(self, func, items: List[Any]) -> List[Any]:
+        """executor.map en el pool de `media_workers` hilos, cada uno con una copia del contexto (la traza)"""
+        contexts = [contextvars.copy_context() for _ in items]
+        with ThreadPoolExecutor(max_workers=min(self.media_workers, len(items))) as executor:
+            return list(executor.map(lambda context, item: context.run(func, item), contexts, items))
+
+    def _create_posts_batch(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Crea hasta `batch_size` entradas en una sola petición a /batch/v1"""
+        try:
+            response = self._request('batch', 'POST', f'{self.rest_root}/batch/v1', json={
+                'validation': 'normal',
+                'requests': [
+                    {'method': 'POST', 'path': f'{self.namespace}/posts', 'body': post}
+                    for post in posts
+                ],
+            })
+        except requests.exceptions.RequestException as e:
+            raise WordPressError(f'Error en el lote de WordPress: {e}')
+
+        if response.status_code in (404, 405):
+            self.batch_supported = False
+            raise BatchNotSupported(f'/batch/v1 no disponible (HTTP {response.status_code})')
+        if response.status_code >= 400:
+            raise WordPressError(f'WordPress rechazó el lote (HTTP {response.status_code}): {response.text[:200]}')
+
+        self.batch_supported = True
+        try:
+            responses = response.json().get('responses', [])
+        except ValueError:
+            raise WordPressError('Respuesta del lote de WordPress no es JSON')
+        return [self._post_result(item.get('status', 500), item.get('body') or {}) for item in responses]
+
+    def _create_post(self, post: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            response = self._request('post', 'POST', f'{self.api_url}/posts', json=post)
+            body = response.json() if response.content else {}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return {'success': False, 'error': f'Error al publicar en WordPress: {e}'}
+        return self._post_result(response.status_code, body)
+
+    @staticmethod
+    def _post_result(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
+        if status_code >= 400:
+            return {'success': False, 'status_code': status_code,
+                    'error': body.get('message') or f'HTTP {status_code}'}
+        return {'success': True, 'id': body.get('id'), 'link': body.get('link'),
+                'featured_media': body.get('featured_media')}
+
+    def upload_media(self, image_urls: Iterable[str]) -> Dict[str, Optional[int]]:
+        """
+        Descarga y sube imágenes a la biblioteca de medios en paralelo.
+
+        Returns:
+            URL de la imagen -> id del medio en WordPress (None si falló)
+        """
+        urls = list(dict.fromkeys(url for url in image_urls if url))
+        if not urls:
+            return {}
+        return dict(zip(urls, self._map(self._upload_image, urls)))
+
+    def _upload_image(self, image_url: str) -> Optional[int]:
+        try:
+            # La descarga va por el pool compartido, sin las credenciales de WordPress
+            image = get_session().get(image_url, timeout=self.timeout)
+            image.raise_for_status()
+
+            filename = os.path.basename(urlparse(image_url).path) or 'imagen.jpg'
+            content_type = (image.headers.get('Content-Type')
+                            or mimetypes.guess_type(filename)[0] or 'image/jpeg')
+            response = self._request('media', 'POST', f'{self.api_url}/media', data=image.content, headers={
+                'Content-Type': content_type,
+                'Content-Disposition': f'attachment; filename="{filename}"',
+            })
+            response.raise_for_status()
+            return response.json().get('id')
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Error subiendo la imagen %s a WordPress: %s", image_url, e)
+            return None
+
+
+_default_publisher: Optional[WordPressPublisher] = None
+_default_publisher_lock = threading.Lock()
+
+
+def get_wordpress_publisher() -> WordPressPublisher:
+    """Publicador compartido del proceso: la sesión autenticada se reutiliza entre invocaciones"""
+    global _default_publisher
+    if _default_publisher is None:
+        with _default_publisher_lock:
+            if _default_publisher is None:
+                _default_publisher = WordPressPublisher()
+    return _default_publisher
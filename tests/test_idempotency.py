@@ -0,0 +1,30 @@
+"""
+Pruebas de la clave de idempotencia del webhook
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from idempotency import derive_idempotency_key
+
+ARTICLE = {
+    'event_type': 'process_article',
+    'product_url': 'https://www.amazon.com/dp/B08N5WRWNW',
+    'affiliate_link': 'https://amzn.to/3xyz123',
+    'row_number': 2,
+    'sheet_id': 'sheet',
+}
+
+
+def test_la_clave_cambia_con_el_enlace_de_afiliado():
+    other = dict(ARTICLE, affiliate_link='https://amzn.to/otro')
+    assert derive_idempotency_key(ARTICLE) != derive_idempotency_key(other)
+    assert derive_idempotency_key(ARTICLE) == derive_idempotency_key(dict(ARTICLE))
+
+
+def test_articulo_sin_fila_no_es_idempotente():
+    data = {key: value for key, value in ARTICLE.items() if key not in ('row_number', 'sheet_id')}
+    assert derive_idempotency_key(data) is None
+    assert derive_idempotency_key(data, 'cabecera') == 'explicit:cabecera'
@@ -0,0 +1,58 @@
+"""
+Pruebas de la cuota de LLMRouter alimentada por el token bucket del proveedor
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from llm_router import LLMRouter
+from provider_health import ProviderHealth
+from rate_limit import MemoryBucketStore, TokenBucketLimiter
+
+
+def _router(limiter):
+    return LLMRouter(health=ProviderHealth(), limiters={'gemini': limiter})
+
+
+def test_bucket_vacio_espera_turno_en_vez_de_descartar_el_proveedor():
+    # 600 RPM con ráfaga de 1: la segunda llamada espera 0,1 s
+    limiter = TokenBucketLimiter('gemini', 600, burst=1, max_wait=5, store=MemoryBucketStore())
+    router = _router(limiter)
+
+    async def call(name):
+        return name
+
+    async def run():
+        await router.call(['gemini'], call)
+        assert limiter.remaining() == 0
+        assert router.rank(['gemini']) == ['gemini']
+        return await router.call(['gemini'], call)
+
+    result, route = asyncio.run(run())
+
+    assert result == 'gemini'
+    attempt = route['attempts'][0]
+    assert attempt['queued_ms'] > 50
+    # La espera en el limitador no cuenta como latencia del proveedor
+    assert attempt['ms'] < attempt['queued_ms']
+    assert router.stats('gemini').p50() < 0.05
+
+
+def test_cola_llena_pasa_al_siguiente_sin_abrir_el_circuito():
+    # Bucket de tokens vacío: una llamada de 30 tokens esperaría 30 s
+    limiter = TokenBucketLimiter('gemini', None, tpm=60, max_wait=0.5, store=MemoryBucketStore())
+    router = _router(limiter)
+    limiter.reserve(60)
+
+    async def call(name):
+        return name
+
+    result, route = asyncio.run(router.call(['gemini', 'ollama'], call, tokens=lambda name: 30))
+
+    assert result == 'ollama'
+    assert [attempt['status'] for attempt in route['attempts']] == ['rate_limited', 'ok']
+    assert router.health.snapshot()['gemini']['circuit'] == 'closed'
+    assert router.health.try_acquire('gemini')
@@ -0,0 +1,30 @@
+"""
+Pruebas del plan de extracción con el recorrido limitado al contenedor del producto
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from product_extraction import DEFAULT_PLAN
+
+URL = 'https://www.amazon.com/dp/B08N5WRWNW'
+
+
+def test_titulo_fuera_del_contenedor_recorre_la_pagina_entera():
+    html = (b'<html><body><span id="productTitle">Fuera de dp</span>'
+            b'<div id="dp"><span class="a-price"><span class="a-offscreen">$19.99</span></span></div>'
+            b'</body></html>')
+    data, _ = DEFAULT_PLAN.parse_and_extract(html, URL)
+    assert data['title'] == 'Fuera de dp'
+    assert data['price'] == '19.99'
+
+
+def test_el_contenedor_tambien_se_compara_con_los_selectores():
+    html = (b'<html><body><div id="dp-container" data-asin="B08N5WRWNW">'
+            b'<span id="productTitle">Dentro</span>'
+            b'<span class="a-price"><span class="a-offscreen">$5.00</span></span></div></body></html>')
+    # Sin /dp/ en la URL el ASIN sale del propio contenedor
+    data, _ = DEFAULT_PLAN.parse_and_extract(html, 'https://www.amazon.com/producto')
+    assert (data['title'], data['price'], data['asin']) == ('Dentro', '5.00', 'B08N5WRWNW')
@@ -0,0 +1,125 @@
+"""
+Pruebas del circuit breaker de provider_health y de su uso en LLMRouter
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from llm_router import LLMRouter
+from provider_health import CLOSED, HALF_OPEN, OPEN, ProviderHealth
+
+
+def _half_open_health(*names):
+    """Registro con el circuito de `names` abierto y el reset_timeout ya vencido"""
+    health = ProviderHealth(failure_threshold=1, reset_timeout=0)
+    for name in names:
+        health.record_failure(name)
+    return health
+
+
+def test_consultar_disponibilidad_no_reserva_la_prueba_half_open():
+    health = _half_open_health('gemini')
+
+    async def check():
+        return [await health.is_available('gemini') for _ in range(3)]
+
+    # Consultar varias veces sin llamar no debe dejar el proveedor excluido
+    assert asyncio.run(check()) == [True, True, True]
+    assert health.snapshot()['gemini']['circuit'] == HALF_OPEN
+
+
+def test_solo_una_llamada_reclama_la_prueba_half_open():
+    health = _half_open_health('gemini')
+
+    assert health.try_acquire('gemini') is True
+    assert health.try_acquire('gemini') is False
+    assert asyncio.run(health.is_available('gemini')) is False
+
+    health.release('gemini')
+    assert health.try_acquire('gemini') is True
+
+    health.record_failure('gemini')
+    assert health.snapshot()['gemini']['circuit'] == OPEN
+
+
+def test_router_reclama_la_prueba_solo_del_proveedor_llamado():
+    health = _half_open_health('gemini', 'huggingface')
+    router = LLMRouter(health=health, limiters={})
+    called = []
+
+    async def call(name):
+        called.append(name)
+        return name
+
+    async def run():
+        # Ambos están disponibles, pero el router solo llama al primero
+        assert await health.is_available('gemini')
+        assert await health.is_available('huggingface')
+        return await router.call(['gemini', 'huggingface'], call)
+
+    result, route = asyncio.run(run())
+
+    assert called == [result] == [route['provider']]
+    other = 'huggingface' if result == 'gemini' else 'gemini'
+    assert health.snapshot()[result]['circuit'] == CLOSED
+    # El que no se llamó sigue pudiendo recibir su prueba half-open
+    assert health.try_acquire(other) is True
+
+
+def _streaming_generator(health, cached=None):
+    """Generador en streaming que elige Gemini y no depende de APIs ni de la caché reales"""
+    from free_ai_integration import FreeAIArticleGenerator
+
+    generator = FreeAIArticleGenerator(health=health, router=LLMRouter(health=health, limiters={}))
+    generator.cache = None
+
+    async def select_best_api():
+        return 'gemini'
+
+    async def stream_with_api(api_name, product_data, affiliate_link):
+        for chunk in ('<h2>Uno</h2><p>a</p>', '<h2>Dos</h2><p>b</p>', '<h2>Tres</h2><p>c</p>'):
+            await asyncio.sleep(0)
+            yield chunk
+
+    generator._select_best_api = select_best_api
+    generator._stream_with_api = stream_with_api
+    generator._find_cached_response = lambda candidates, product_data, affiliate_link: cached
+    return generator
+
+
+async def _consume(events, count=None):
+    seen = []
+    async for event in events:
+        seen.append(event)
+        if count is not None and len(seen) == count:
+            break
+    await events.aclose()
+    return seen
+
+
+def test_stream_devuelve_la_prueba_si_el_cliente_se_desconecta():
+    for count in (1, 2):
+        # 1: desconexión en el evento 'start'; 2: a mitad del streaming
+        health = _half_open_health('gemini')
+        events = _streaming_generator(health).stream_article({'title': 'Producto'}, 'https://amzn.to/x')
+        asyncio.run(_consume(events, count))
+        assert health.snapshot()['gemini']['circuit'] == HALF_OPEN
+        assert health.try_acquire('gemini') is True
+
+
+def test_stream_desde_la_cache_no_reserva_la_prueba():
+    health = _half_open_health('gemini')
+    generator = _streaming_generator(health, cached=('gemini', '<h2>Cacheado</h2><p>x</p>'))
+    events = asyncio.run(_consume(generator.stream_article({'title': 'Producto'}, 'https://amzn.to/x')))
+    assert events[-1]['cached'] is True
+    assert health.try_acquire('gemini') is True
+
+
+def test_stream_completo_cierra_el_circuito():
+    health = _half_open_health('gemini')
+    events = _streaming_generator(health).stream_article({'title': 'Producto'}, 'https://amzn.to/x')
+    assert asyncio.run(_consume(events))[-1]['event'] == 'done'
+    assert health.snapshot()['gemini']['circuit'] == CLOSED